@@ -2,8 +2,7 @@ import pickle
 
 import numpy as np
 
-from ...ops.iou3d_nms import iou3d_nms_utils
-from ...utils import box_utils
+from ...utils import box_utils, packed_utils
 
 
 class DataBaseSampler(object):
@@ -13,6 +12,7 @@ class DataBaseSampler(object):
         self.sampler_cfg = sampler_cfg
         self.logger = logger
         self.db_infos = {}
+        self.packed_db_readers = {}
         for class_name in class_names:
             self.db_infos[class_name] = []
 
@@ -22,6 +22,16 @@ class DataBaseSampler(object):
                 infos = pickle.load(f)
                 [self.db_infos[cur_class].extend(infos[cur_class]) for cur_class in class_names]
 
+        # keep the db_infos as struct-of-arrays per class instead of millions of small dicts
+        self.db_infos = {key: self.infos_to_columns(val) for key, val in self.db_infos.items()}
+        # the sampled rows of all classes are concatenated, and the points are read from the packed blob or from
+        # the per-object files depending on the keys, a mix of both kinds of DB_INFO_PATH can not be sampled
+        schemas = {tuple(sorted(val.keys())) for val in self.db_infos.values() if len(val) > 0}
+        if len(schemas) > 1:
+            raise ValueError('DB_INFO_PATH %s mixes db_infos of different keys: %s' % (
+                list(sampler_cfg.DB_INFO_PATH), sorted(schemas)
+            ))
+
         for func_name, val in sampler_cfg.PREPARE.items():
             self.db_infos = getattr(self, func_name)(self.db_infos, val)
 
@@ -35,8 +45,8 @@ class DataBaseSampler(object):
             self.sample_class_num[class_name] = sample_num
             self.sample_groups[class_name] = {
                 'sample_num': sample_num,
-                'pointer': len(self.db_infos[class_name]),
-                'indices': np.arange(len(self.db_infos[class_name]))
+                'pointer': self.get_num_infos(self.db_infos[class_name]),
+                'indices': np.arange(self.get_num_infos(self.db_infos[class_name]))
             }
 
     def __getstate__(self):
@@ -47,31 +57,59 @@ class DataBaseSampler(object):
     def __setstate__(self, d):
         self.__dict__.update(d)
 
+    @staticmethod
+    def infos_to_columns(infos):
+        """
+        Args:
+            infos: list of db_info dicts of the same class, with the same keys
+
+        Returns:
+            columns: dict of arrays, columns[key][i] == infos[i][key]
+        """
+        if len(infos) == 0:
+            return {}
+        keys = set(infos[0].keys())
+        for info in infos:
+            if set(info.keys()) != keys:
+                # e.g. packed and per-file db_infos, the rows without packed_offset would read missing files
+                raise ValueError('db_infos of %s with different keys: %s and %s' % (
+                    infos[0].get('name', None), sorted(keys), sorted(info.keys())
+                ))
+        return {key: np.array([info[key] for info in infos]) for key in infos[0].keys()}
+
+    @staticmethod
+    def get_num_infos(columns):
+        return len(next(iter(columns.values()))) if len(columns) > 0 else 0
+
+    @staticmethod
+    def select_infos(columns, indices):
+        return {key: val[indices] for key, val in columns.items()}
+
     def filter_by_difficulty(self, db_infos, removed_difficulty):
         new_db_infos = {}
         for key, dinfos in db_infos.items():
-            pre_len = len(dinfos)
-            new_db_infos[key] = [
-                info for info in dinfos
-                if info['difficulty'] not in removed_difficulty
-            ]
+            pre_len = self.get_num_infos(dinfos)
+            if pre_len > 0:
+                mask = ~np.isin(dinfos['difficulty'], removed_difficulty)
+                new_db_infos[key] = self.select_infos(dinfos, mask)
+            else:
+                new_db_infos[key] = dinfos
             if self.logger is not None:
-                self.logger.info('Database filter by difficulty %s: %d => %d' % (key, pre_len, len(new_db_infos[key])))
+                self.logger.info('Database filter by difficulty %s: %d => %d' %
+                                 (key, pre_len, self.get_num_infos(new_db_infos[key])))
         return new_db_infos
 
     def filter_by_min_points(self, db_infos, min_gt_points_list):
         for name_num in min_gt_points_list:
             name, min_num = name_num.split(':')
             min_num = int(min_num)
-            if min_num > 0 and name in db_infos.keys():
-                filtered_infos = []
-                for info in db_infos[name]:
-                    if info['num_points_in_gt'] >= min_num:
-                        filtered_infos.append(info)
+            if min_num > 0 and name in db_infos.keys() and self.get_num_infos(db_infos[name]) > 0:
+                mask = db_infos[name]['num_points_in_gt'] >= min_num
+                filtered_infos = self.select_infos(db_infos[name], mask)
 
                 if self.logger is not None:
                     self.logger.info('Database filter by min points %s: %d => %d' %
-                                     (name, len(db_infos[name]), len(filtered_infos)))
+                                     (name, self.get_num_infos(db_infos[name]), self.get_num_infos(filtered_infos)))
                 db_infos[name] = filtered_infos
 
         return db_infos
@@ -82,18 +120,19 @@ class DataBaseSampler(object):
             class_name:
             sample_group:
         Returns:
-
+            sampled_infos: dict of arrays, the sampled rows of self.db_infos[class_name]
         """
         sample_num, pointer, indices = int(sample_group['sample_num']), sample_group['pointer'], sample_group['indices']
-        if pointer >= len(self.db_infos[class_name]):
-            indices = np.random.permutation(len(self.db_infos[class_name]))
+        num_infos = self.get_num_infos(self.db_infos[class_name])
+        if pointer >= num_infos:
+            indices = np.random.permutation(num_infos)
             pointer = 0
 
-        sampled_dict = [self.db_infos[class_name][idx] for idx in indices[pointer: pointer + sample_num]]
+        sampled_infos = self.select_infos(self.db_infos[class_name], indices[pointer: pointer + sample_num])
         pointer += sample_num
         sample_group['pointer'] = pointer
         sample_group['indices'] = indices
-        return sampled_dict
+        return sampled_infos
 
     @staticmethod
     def put_boxes_on_road_planes(gt_boxes, road_planes, calib):
@@ -115,7 +154,14 @@ class DataBaseSampler(object):
         gt_boxes[:, 2] -= mv_height  # lidar view
         return gt_boxes, mv_height
 
-    def add_sampled_boxes_to_scene(self, data_dict, sampled_gt_boxes, total_valid_sampled_dict):
+    def get_packed_db_reader(self, packed_path):
+        if packed_path not in self.packed_db_readers:
+            self.packed_db_readers[packed_path] = packed_utils.PackedPointsReader(
+                self.root_path / packed_path, num_features=self.sampler_cfg.NUM_POINT_FEATURES
+            )
+        return self.packed_db_readers[packed_path]
+
+    def add_sampled_boxes_to_scene(self, data_dict, sampled_gt_boxes, total_valid_sampled_infos):
         gt_boxes_mask = data_dict['gt_boxes_mask']
         gt_boxes = data_dict['gt_boxes'][gt_boxes_mask]
         gt_names = data_dict['gt_names'][gt_boxes_mask]
@@ -128,21 +174,26 @@ class DataBaseSampler(object):
             data_dict.pop('road_plane')
 
         obj_points_list = []
-        for idx, info in enumerate(total_valid_sampled_dict):
-            file_path = self.root_path / info['path']
-            obj_points = np.fromfile(str(file_path), dtype=np.float32).reshape(
-                [-1, self.sampler_cfg.NUM_POINT_FEATURES])
-
-            obj_points[:, :3] += info['box3d_lidar'][:3]
-
-            if self.sampler_cfg.get('USE_ROAD_PLANE', False):
-                # mv height
-                obj_points[:, 2] -= mv_height[idx]
-
+        for idx in range(sampled_gt_boxes.shape[0]):
+            if 'packed_offset' in total_valid_sampled_infos:
+                obj_points = self.get_packed_db_reader(total_valid_sampled_infos['packed_path'][idx]).get_slice(
+                    *total_valid_sampled_infos['packed_offset'][idx]
+                )
+            else:
+                file_path = self.root_path / total_valid_sampled_infos['path'][idx]
+                obj_points = np.fromfile(str(file_path), dtype=np.float32).reshape(
+                    [-1, self.sampler_cfg.NUM_POINT_FEATURES])
             obj_points_list.append(obj_points)
 
+        num_obj_points = [x.shape[0] for x in obj_points_list]
         obj_points = np.concatenate(obj_points_list, axis=0)
-        sampled_gt_names = np.array([x['name'] for x in total_valid_sampled_dict])
+        obj_points[:, :3] += np.repeat(total_valid_sampled_infos['box3d_lidar'][:, 0:3], num_obj_points, axis=0)
+
+        if self.sampler_cfg.get('USE_ROAD_PLANE', False):
+            # mv height
+            obj_points[:, 2] -= np.repeat(mv_height, num_obj_points, axis=0)
+
+        sampled_gt_names = total_valid_sampled_infos['name']
 
         large_sampled_gt_boxes = box_utils.enlarge_box3d(
             sampled_gt_boxes[:, 0:7], extra_width=self.sampler_cfg.REMOVE_EXTRA_WIDTH
@@ -168,33 +219,36 @@ class DataBaseSampler(object):
         gt_boxes = data_dict['gt_boxes']
         gt_names = data_dict['gt_names'].astype(str)
         existed_boxes = gt_boxes
-        total_valid_sampled_dict = []
+        total_valid_sampled_infos = []
         for class_name, sample_group in self.sample_groups.items():
             if self.limit_whole_scene:
                 num_gt = np.sum(class_name == gt_names)
                 sample_group['sample_num'] = str(int(self.sample_class_num[class_name]) - num_gt)
             if int(sample_group['sample_num']) > 0:
-                sampled_dict = self.sample_with_fixed_number(class_name, sample_group)
+                sampled_infos = self.sample_with_fixed_number(class_name, sample_group)
 
-                sampled_boxes = np.stack([x['box3d_lidar'] for x in sampled_dict], axis=0).astype(np.float32)
+                sampled_boxes = sampled_infos['box3d_lidar'].astype(np.float32)
 
                 if self.sampler_cfg.get('DATABASE_WITH_FAKELIDAR', False):
                     sampled_boxes = box_utils.boxes3d_kitti_fakelidar_to_lidar(sampled_boxes)
 
-                iou1 = iou3d_nms_utils.boxes_bev_iou_cpu(sampled_boxes[:, 0:7], existed_boxes[:, 0:7])
-                iou2 = iou3d_nms_utils.boxes_bev_iou_cpu(sampled_boxes[:, 0:7], sampled_boxes[:, 0:7])
-                iou2[range(sampled_boxes.shape[0]), range(sampled_boxes.shape[0])] = 0
-                iou1 = iou1 if iou1.shape[1] > 0 else iou2
-                valid_mask = ((iou1.max(axis=1) + iou2.max(axis=1)) == 0).nonzero()[0]
-                valid_sampled_dict = [sampled_dict[x] for x in valid_mask]
+                collision1 = box_utils.boxes_bev_collision_numpy(sampled_boxes[:, 0:7], existed_boxes[:, 0:7])
+                collision2 = box_utils.boxes_bev_collision_numpy(sampled_boxes[:, 0:7], sampled_boxes[:, 0:7])
+                collision2[range(sampled_boxes.shape[0]), range(sampled_boxes.shape[0])] = False
+                valid_mask = (~(collision1.any(axis=1) | collision2.any(axis=1))).nonzero()[0]
+                valid_sampled_infos = self.select_infos(sampled_infos, valid_mask)
                 valid_sampled_boxes = sampled_boxes[valid_mask]
 
                 existed_boxes = np.concatenate((existed_boxes, valid_sampled_boxes), axis=0)
-                total_valid_sampled_dict.extend(valid_sampled_dict)
+                total_valid_sampled_infos.append(valid_sampled_infos)
 
         sampled_gt_boxes = existed_boxes[gt_boxes.shape[0]:, :]
-        if total_valid_sampled_dict.__len__() > 0:
-            data_dict = self.add_sampled_boxes_to_scene(data_dict, sampled_gt_boxes, total_valid_sampled_dict)
+        if sampled_gt_boxes.shape[0] > 0:
+            total_valid_sampled_infos = {
+                key: np.concatenate([x[key] for x in total_valid_sampled_infos], axis=0)
+                for key in total_valid_sampled_infos[0].keys()
+            }
+            data_dict = self.add_sampled_boxes_to_scene(data_dict, sampled_gt_boxes, total_valid_sampled_infos)
 
         data_dict.pop('gt_boxes_mask')
         return data_dict
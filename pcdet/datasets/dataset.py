@@ -112,6 +112,7 @@ class DatasetTemplate(torch_data.Dataset):
                 voxels: optional (num_voxels, max_points_per_voxel, 3 + C)
                 voxel_coords: optional (num_voxels, 3)
                 voxel_num_points: optional (num_voxels)
+                point_voxel_ids: optional (N), voxel index of each point for dynamic voxelization, -1 if dropped
                 ...
         """
         if self.training:
@@ -164,6 +165,10 @@ class DatasetTemplate(torch_data.Dataset):
                         coor_pad = np.pad(coor, ((0, 0), (1, 0)), mode='constant', constant_values=i)
                         coors.append(coor_pad)
                     ret[key] = np.concatenate(coors, axis=0)
+                elif key in ['point_voxel_ids']:
+                    voxel_offsets = np.cumsum([0] + [len(x) for x in data_dict['voxel_coords']])
+                    ids = [np.where(x >= 0, x + voxel_offsets[i], -1) for i, x in enumerate(val)]
+                    ret[key] = np.concatenate(ids, axis=0)
                 elif key in ['gt_boxes']:
                     max_gt = max([len(x) for x in val])
                     batch_gt_boxes3d = np.zeros((batch_size, max_gt, val[0].shape[-1]), dtype=np.float32)
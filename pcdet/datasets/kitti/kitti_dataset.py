@@ -1,13 +1,29 @@
 import copy
 import pickle
+from pathlib import Path
 
 import numpy as np
 from skimage import io
 
 from ...ops.roiaware_pool3d import roiaware_pool3d_utils
-from ...utils import box_utils, calibration_kitti, common_utils, object3d_kitti
+from ...utils import (box_utils, calibration_kitti, common_utils, gt_database_utils, info_store_utils, object3d_kitti,
+                      packed_utils)
 from ..dataset import DatasetTemplate
 
+# state of the get_infos workers, set once per process by _init_info_worker instead of being pickled with every chunk
+_info_worker_data = {}
+
+
+def _init_info_worker(dataset, has_label, count_inside_pts):
+    _info_worker_data.update({'dataset': dataset, 'has_label': has_label, 'count_inside_pts': count_inside_pts})
+
+
+def _process_single_scene_in_worker(sample_idx):
+    return _info_worker_data['dataset'].process_single_scene(
+        sample_idx, has_label=_info_worker_data['has_label'],
+        count_inside_pts=_info_worker_data['count_inside_pts']
+    )
+
 
 class KittiDataset(DatasetTemplate):
     def __init__(self, dataset_cfg, class_names, training=True, root_path=None, logger=None):
@@ -27,6 +43,9 @@ class KittiDataset(DatasetTemplate):
 
         split_dir = self.root_path / 'ImageSets' / (self.split + '.txt')
         self.sample_id_list = [x.strip() for x in open(split_dir).readlines()] if split_dir.exists() else None
+        self.packed_lidar = self.get_packed_lidar_reader()
+        self.packed_fov_lidar = self.get_packed_lidar_reader('velodyne_fov', cfg_key='PACKED_FOV_LIDAR')
+        self.calib_cache = {}
 
         self.kitti_infos = []
         self.include_kitti_data(self.mode)
@@ -44,7 +63,8 @@ class KittiDataset(DatasetTemplate):
                 infos = pickle.load(f)
                 kitti_infos.extend(infos)
 
-        self.kitti_infos.extend(kitti_infos)
+        # one flat buffer instead of a list of dicts, shared by the DataLoader workers without copy-on-write
+        self.kitti_infos = info_store_utils.SerializedInfoList(list(self.kitti_infos) + kitti_infos)
 
         if self.logger is not None:
             self.logger.info('Total samples for KITTI dataset: %d' % (len(kitti_infos)))
@@ -58,8 +78,71 @@ class KittiDataset(DatasetTemplate):
 
         split_dir = self.root_path / 'ImageSets' / (self.split + '.txt')
         self.sample_id_list = [x.strip() for x in open(split_dir).readlines()] if split_dir.exists() else None
+        self.packed_lidar = self.get_packed_lidar_reader()
+        self.packed_fov_lidar = self.get_packed_lidar_reader('velodyne_fov', cfg_key='PACKED_FOV_LIDAR')
+        self.calib_cache = {}
+
+    def get_packed_lidar_reader(self, name='velodyne', cfg_key='PACKED_LIDAR'):
+        if not self.dataset_cfg.get(cfg_key, False):
+            return None
+
+        blob_path = self.root_split_path / ('%s_packed.bin' % name)
+        index_path = self.root_split_path / ('%s_packed_index.pkl' % name)
+        if not (blob_path.exists() and index_path.exists()):
+            if self.logger is not None:
+                self.logger.info('Packed %s not found in %s, fall back to velodyne/*.bin' % (
+                    name, self.root_split_path
+                ))
+            return None
+        return packed_utils.PackedPointsReader.from_index_file(blob_path, index_path)
+
+    def create_packed_lidar(self):
+        """
+        Pack all the velodyne/*.bin files of the current split directory into one contiguous float32 blob
+        (velodyne_packed.bin) plus an offset index (velodyne_packed_index.pkl), which are read by get_lidar
+        through np.memmap when PACKED_LIDAR is enabled.
+        """
+        velodyne_path = self.root_split_path / 'velodyne'
+        blob_path = self.root_split_path / 'velodyne_packed.bin'
+        index_path = self.root_split_path / 'velodyne_packed_index.pkl'
+        if not velodyne_path.exists():
+            return None
+
+        lidar_files = sorted(velodyne_path.glob('*.bin'))
+        writer = packed_utils.PackedPointsWriter(blob_path, num_features=4)
+        for k, lidar_file in enumerate(lidar_files):
+            print('packed lidar sample: %d/%d' % (k + 1, len(lidar_files)))
+            writer.add(np.fromfile(str(lidar_file), dtype=np.float32).reshape(-1, 4), key=lidar_file.stem)
+        writer.close(index_path)
+        print('Packed lidar of %d samples is saved to %s' % (len(lidar_files), blob_path))
+
+        self.packed_lidar = self.get_packed_lidar_reader()
+
+    def create_packed_fov_lidar(self, infos):
+        """
+        Pack the field-of-view points of the samples of infos into velodyne_fov_packed.bin of the current split
+        directory, which are read by __getitem__ instead of cropping the clouds when PACKED_FOV_LIDAR and
+        FOV_POINTS_ONLY are enabled.
+        """
+        blob_path = self.root_split_path / 'velodyne_fov_packed.bin'
+        index_path = self.root_split_path / 'velodyne_fov_packed_index.pkl'
+        writer = packed_utils.PackedPointsWriter(blob_path, num_features=4)
+        for k, info in enumerate(infos):
+            if (k + 1) % 500 == 0 or k + 1 == len(infos):
+                print('packed fov lidar sample: %d/%d' % (k + 1, len(infos)))
+            sample_idx = info['point_cloud']['lidar_idx']
+            points = self.get_lidar(sample_idx)
+            fov_flag = self.get_fov_flag_from_planes(points[:, 0:3], self.get_fov_planes(info))
+            writer.add(points[fov_flag], key=sample_idx)
+        writer.close(index_path)
+        print('Packed fov lidar of %d samples is saved to %s' % (len(infos), blob_path))
+
+        self.packed_fov_lidar = self.get_packed_lidar_reader('velodyne_fov', cfg_key='PACKED_FOV_LIDAR')
 
     def get_lidar(self, idx):
+        if self.packed_lidar is not None and idx in self.packed_lidar:
+            return self.packed_lidar.get(idx)
+
         lidar_file = self.root_split_path / 'velodyne' / ('%s.bin' % idx)
         assert lidar_file.exists()
         return np.fromfile(str(lidar_file), dtype=np.float32).reshape(-1, 4)
@@ -74,7 +157,23 @@ class KittiDataset(DatasetTemplate):
         assert label_file.exists()
         return object3d_kitti.get_objects_from_label(label_file)
 
-    def get_calib(self, idx):
+    def get_calib(self, idx, calib_info=None):
+        """
+        Args:
+            idx:
+            calib_info: info['calib'], the calibration is then built from the infos and cached per sample instead
+                of parsing the calib file
+
+        Returns:
+            calib: Calibration, shared by the samples of the same idx, do not modify it
+        """
+        if calib_info is not None:
+            if idx not in self.calib_cache:
+                self.calib_cache[idx] = calibration_kitti.Calibration(
+                    calibration_kitti.get_calib_from_info(calib_info)
+                )
+            return self.calib_cache[idx]
+
         calib_file = self.root_split_path / 'calib' / ('%s.txt' % idx)
         assert calib_file.exists()
         return calibration_kitti.Calibration(calib_file)
@@ -116,131 +215,218 @@ class KittiDataset(DatasetTemplate):
 
         return pts_valid_flag
 
-    def get_infos(self, num_workers=4, has_label=True, count_inside_pts=True, sample_id_list=None):
-        import concurrent.futures as futures
+    @staticmethod
+    def get_fov_flag_from_planes(pts_lidar, fov_planes):
+        """
+        Args:
+            pts_lidar: (N, 3)
+            fov_planes: (5, 4) from Calibration.get_fov_planes
+
+        Returns:
+            pts_valid_flag: (N), same as get_fov_flag without projecting the points
+        """
+        dists = np.dot(pts_lidar, fov_planes[:, 0:3].T) + fov_planes[:, 3]
+        return (dists[:, [0, 2]] >= 0).all(axis=1) & (dists[:, [1, 3, 4]] > 0).all(axis=1)
+
+    def get_fov_planes(self, info):
+        """
+        Frustum planes of the infos, computed from the calibration for the infos created without them
+        """
+        if 'fov_planes' in info['image']:
+            return info['image']['fov_planes']
+        calib = self.get_calib(info['point_cloud']['lidar_idx'], calib_info=info['calib'])
+        return calib.get_fov_planes(info['image']['image_shape'])
+
+    def process_single_scene(self, sample_idx, has_label=True, count_inside_pts=True):
+        """
+        Build the info dict of one sample, run in the worker processes of get_infos
+        """
+        info = {}
+        pc_info = {'num_features': 4, 'lidar_idx': sample_idx}
+        info['point_cloud'] = pc_info
+
+        image_info = {'image_idx': sample_idx, 'image_shape': self.get_image_shape(sample_idx)}
+        info['image'] = image_info
+        calib = self.get_calib(sample_idx)
+
+        P2 = np.concatenate([calib.P2, np.array([[0., 0., 0., 1.]])], axis=0)
+        R0_4x4 = np.zeros([4, 4], dtype=calib.R0.dtype)
+        R0_4x4[3, 3] = 1.
+        R0_4x4[:3, :3] = calib.R0
+        V2C_4x4 = np.concatenate([calib.V2C, np.array([[0., 0., 0., 1.]])], axis=0)
+        calib_info = {'P2': P2, 'R0_rect': R0_4x4, 'Tr_velo_to_cam': V2C_4x4}
+
+        info['calib'] = calib_info
+        image_info['fov_planes'] = calib.get_fov_planes(image_info['image_shape'])
+
+        if has_label:
+            obj_list = self.get_label(sample_idx)
+            annotations = {}
+            annotations['name'] = np.array([obj.cls_type for obj in obj_list])
+            annotations['truncated'] = np.array([obj.truncation for obj in obj_list])
+            annotations['occluded'] = np.array([obj.occlusion for obj in obj_list])
+            annotations['alpha'] = np.array([obj.alpha for obj in obj_list])
+            annotations['bbox'] = np.concatenate([obj.box2d.reshape(1, 4) for obj in obj_list], axis=0)
+            annotations['dimensions'] = np.array([[obj.l, obj.h, obj.w] for obj in obj_list])  # lhw(camera) format
+            annotations['location'] = np.concatenate([obj.loc.reshape(1, 3) for obj in obj_list], axis=0)
+            annotations['rotation_y'] = np.array([obj.ry for obj in obj_list])
+            annotations['score'] = np.array([obj.score for obj in obj_list])
+            annotations['difficulty'] = np.array([obj.level for obj in obj_list], np.int32)
+
+            num_objects = len([obj.cls_type for obj in obj_list if obj.cls_type != 'DontCare'])
+            num_gt = len(annotations['name'])
+            index = list(range(num_objects)) + [-1] * (num_gt - num_objects)
+            annotations['index'] = np.array(index, dtype=np.int32)
+
+            loc = annotations['location'][:num_objects]
+            dims = annotations['dimensions'][:num_objects]
+            rots = annotations['rotation_y'][:num_objects]
+            loc_lidar = calib.rect_to_lidar(loc)
+            l, h, w = dims[:, 0:1], dims[:, 1:2], dims[:, 2:3]
+            loc_lidar[:, 2] += h[:, 0] / 2
+            gt_boxes_lidar = np.concatenate([loc_lidar, l, w, h, -(np.pi / 2 + rots[..., np.newaxis])], axis=1)
+            annotations['gt_boxes_lidar'] = gt_boxes_lidar
+
+            info['annos'] = annotations
+
+            if count_inside_pts:
+                points = self.get_lidar(sample_idx)
+                fov_flag = self.get_fov_flag_from_planes(points[:, 0:3], image_info['fov_planes'])
+                pts_fov = points[fov_flag]
+                num_points_in_gt = -np.ones(num_gt, dtype=np.int32)
+                # no BEV margin, as the convex hull of the box corners
+                _, box_idxs = roiaware_pool3d_utils.points_in_boxes_sparse_cpu(
+                    pts_fov[:, 0:3], gt_boxes_lidar, margin=0
+                )
+                num_points_in_gt[:num_objects] = np.bincount(box_idxs, minlength=num_objects)
+                annotations['num_points_in_gt'] = num_points_in_gt
+
+        return info
+
+    def get_infos(self, num_workers=4, has_label=True, count_inside_pts=True, sample_id_list=None,
+                  resume_path=None, report_interval=200):
+        """
+        Args:
+            num_workers: number of processes, 0 to build the infos in the current process
+            has_label:
+            count_inside_pts:
+            sample_id_list:
+            resume_path: optional file of the infos built so far, the samples in it are skipped and it is updated
+                every report_interval samples, so that an interrupted run can be resumed
+            report_interval: number of samples between two progress reports
 
-        def process_single_scene(sample_idx):
-            print('%s sample_idx: %s' % (self.split, sample_idx))
-            info = {}
-            pc_info = {'num_features': 4, 'lidar_idx': sample_idx}
-            info['point_cloud'] = pc_info
-
-            image_info = {'image_idx': sample_idx, 'image_shape': self.get_image_shape(sample_idx)}
-            info['image'] = image_info
-            calib = self.get_calib(sample_idx)
-
-            P2 = np.concatenate([calib.P2, np.array([[0., 0., 0., 1.]])], axis=0)
-            R0_4x4 = np.zeros([4, 4], dtype=calib.R0.dtype)
-            R0_4x4[3, 3] = 1.
-            R0_4x4[:3, :3] = calib.R0
-            V2C_4x4 = np.concatenate([calib.V2C, np.array([[0., 0., 0., 1.]])], axis=0)
-            calib_info = {'P2': P2, 'R0_rect': R0_4x4, 'Tr_velo_to_cam': V2C_4x4}
-
-            info['calib'] = calib_info
-
-            if has_label:
-                obj_list = self.get_label(sample_idx)
-                annotations = {}
-                annotations['name'] = np.array([obj.cls_type for obj in obj_list])
-                annotations['truncated'] = np.array([obj.truncation for obj in obj_list])
-                annotations['occluded'] = np.array([obj.occlusion for obj in obj_list])
-                annotations['alpha'] = np.array([obj.alpha for obj in obj_list])
-                annotations['bbox'] = np.concatenate([obj.box2d.reshape(1, 4) for obj in obj_list], axis=0)
-                annotations['dimensions'] = np.array([[obj.l, obj.h, obj.w] for obj in obj_list])  # lhw(camera) format
-                annotations['location'] = np.concatenate([obj.loc.reshape(1, 3) for obj in obj_list], axis=0)
-                annotations['rotation_y'] = np.array([obj.ry for obj in obj_list])
-                annotations['score'] = np.array([obj.score for obj in obj_list])
-                annotations['difficulty'] = np.array([obj.level for obj in obj_list], np.int32)
-
-                num_objects = len([obj.cls_type for obj in obj_list if obj.cls_type != 'DontCare'])
-                num_gt = len(annotations['name'])
-                index = list(range(num_objects)) + [-1] * (num_gt - num_objects)
-                annotations['index'] = np.array(index, dtype=np.int32)
-
-                loc = annotations['location'][:num_objects]
-                dims = annotations['dimensions'][:num_objects]
-                rots = annotations['rotation_y'][:num_objects]
-                loc_lidar = calib.rect_to_lidar(loc)
-                l, h, w = dims[:, 0:1], dims[:, 1:2], dims[:, 2:3]
-                loc_lidar[:, 2] += h[:, 0] / 2
-                gt_boxes_lidar = np.concatenate([loc_lidar, l, w, h, -(np.pi / 2 + rots[..., np.newaxis])], axis=1)
-                annotations['gt_boxes_lidar'] = gt_boxes_lidar
-
-                info['annos'] = annotations
-
-                if count_inside_pts:
-                    points = self.get_lidar(sample_idx)
-                    calib = self.get_calib(sample_idx)
-                    pts_rect = calib.lidar_to_rect(points[:, 0:3])
-
-                    fov_flag = self.get_fov_flag(pts_rect, info['image']['image_shape'], calib)
-                    pts_fov = points[fov_flag]
-                    corners_lidar = box_utils.boxes_to_corners_3d(gt_boxes_lidar)
-                    num_points_in_gt = -np.ones(num_gt, dtype=np.int32)
-
-                    for k in range(num_objects):
-                        flag = box_utils.in_hull(pts_fov[:, 0:3], corners_lidar[k])
-                        num_points_in_gt[k] = flag.sum()
-                    annotations['num_points_in_gt'] = num_points_in_gt
-
-            return info
+        Returns:
+            infos: list of info dicts in the order of sample_id_list
+        """
+        import concurrent.futures as futures
+        import multiprocessing
+        import time
 
         sample_id_list = sample_id_list if sample_id_list is not None else self.sample_id_list
-        with futures.ThreadPoolExecutor(num_workers) as executor:
-            infos = executor.map(process_single_scene, sample_id_list)
-        return list(infos)
+        done_infos = {}
+        if resume_path is not None and Path(resume_path).exists():
+            with open(resume_path, 'rb') as f:
+                done_infos = {info['point_cloud']['lidar_idx']: info for info in pickle.load(f)}
+            print('%s infos: resume from %d samples of %s' % (self.split, len(done_infos), resume_path))
+        todo_id_list = [sample_idx for sample_idx in sample_id_list if sample_idx not in done_infos]
+
+        start_time = time.time()
+        executor = None
+        if num_workers > 0:
+            # the dataset reaches each worker once through the initializer, the tasks only carry the sample ids.
+            # spawned workers, as the gt database ones, since the parallel numba kernels are not fork-safe
+            executor = futures.ProcessPoolExecutor(
+                num_workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_info_worker,
+                initargs=(self, has_label, count_inside_pts)
+            )
+            infos = executor.map(_process_single_scene_in_worker, todo_id_list, chunksize=8)
+        else:
+            infos = (self.process_single_scene(sample_idx, has_label=has_label, count_inside_pts=count_inside_pts)
+                     for sample_idx in todo_id_list)
+        try:
+            for k, info in enumerate(infos):
+                done_infos[info['point_cloud']['lidar_idx']] = info
+                if (k + 1) % report_interval == 0 or k + 1 == len(todo_id_list):
+                    print('%s infos: %d/%d, %.1f samples/s' % (
+                        self.split, len(done_infos), len(sample_id_list), (k + 1) / (time.time() - start_time)
+                    ))
+                    if resume_path is not None:
+                        common_utils.dump_pickle_atomic(list(done_infos.values()), resume_path)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return [done_infos[sample_idx] for sample_idx in sample_id_list]
+
+    def get_gt_database_objects(self, info, database_save_path, used_classes=None):
+        """
+        Args:
+            info: info dict of one sample
+            database_save_path:
+            used_classes:
 
-    def create_groundtruth_database(self, info_path=None, used_classes=None, split='train'):
-        import torch
+        Returns:
+            objects: list of (name, gt_points, filepath, db_info) of the objects of the sample, db_info is None for
+                the objects of the unused classes
+        """
+        sample_idx = info['point_cloud']['lidar_idx']
+        points = self.get_lidar(sample_idx)
+        annos = info['annos']
+        names = annos['name']
+        difficulty = annos['difficulty']
+        bbox = annos['bbox']
+        gt_boxes = annos['gt_boxes_lidar']
+
+        num_obj = gt_boxes.shape[0]
+        point_idxs, box_idxs = roiaware_pool3d_utils.points_in_boxes_sparse_cpu(points[:, 0:3], gt_boxes)
+        box_order = np.argsort(box_idxs, kind='stable')
+        box_point_idxs = np.split(point_idxs[box_order], np.cumsum(np.bincount(box_idxs, minlength=num_obj))[:-1])
+
+        objects = []
+        for i in range(num_obj):
+            filename = '%s_%s_%d.bin' % (sample_idx, names[i], i)
+            filepath = database_save_path / filename
+            gt_points = points[box_point_idxs[i]]
+
+            gt_points[:, :3] -= gt_boxes[i, :3]
+            db_info = None
+            if (used_classes is None) or names[i] in used_classes:
+                db_path = str(filepath.relative_to(self.root_path))  # gt_database/xxxxx.bin
+                db_info = {'name': names[i], 'path': db_path, 'image_idx': sample_idx, 'gt_idx': i,
+                           'box3d_lidar': gt_boxes[i], 'num_points_in_gt': gt_points.shape[0],
+                           'difficulty': difficulty[i], 'bbox': bbox[i], 'score': annos['score'][i]}
+            objects.append((names[i], gt_points, filepath, db_info))
+        return objects
+
+    def create_groundtruth_database(self, info_path=None, used_classes=None, split='train', packed=False,
+                                    num_workers=4, resume=False):
+        """
+        Args:
+            info_path:
+            used_classes:
+            split:
+            packed: write the points of all objects into one gt_database blob and record their
+                (start_row, num_rows) in the db_infos instead of writing one file per object
+            num_workers: number of processes, 0 to build the database in the current process
+            resume: keep the finished shards of an interrupted build
+        """
+        import functools
 
         database_save_path = Path(self.root_path) / ('gt_database' if split == 'train' else ('gt_database_%s' % split))
         db_info_save_path = Path(self.root_path) / ('kitti_dbinfos_%s.pkl' % split)
-
-        database_save_path.mkdir(parents=True, exist_ok=True)
-        all_db_infos = {}
+        packed_db_path = Path(self.root_path) / ('%s_packed.bin' % database_save_path.name) if packed else None
 
         with open(info_path, 'rb') as f:
             infos = pickle.load(f)
 
-        for k in range(len(infos)):
-            print('gt_database sample: %d/%d' % (k + 1, len(infos)))
-            info = infos[k]
-            sample_idx = info['point_cloud']['lidar_idx']
-            points = self.get_lidar(sample_idx)
-            annos = info['annos']
-            names = annos['name']
-            difficulty = annos['difficulty']
-            bbox = annos['bbox']
-            gt_boxes = annos['gt_boxes_lidar']
-
-            num_obj = gt_boxes.shape[0]
-            point_indices = roiaware_pool3d_utils.points_in_boxes_cpu(
-                torch.from_numpy(points[:, 0:3]), torch.from_numpy(gt_boxes)
-            ).numpy()  # (nboxes, npoints)
-
-            for i in range(num_obj):
-                filename = '%s_%s_%d.bin' % (sample_idx, names[i], i)
-                filepath = database_save_path / filename
-                gt_points = points[point_indices[i] > 0]
-
-                gt_points[:, :3] -= gt_boxes[i, :3]
-                with open(filepath, 'w') as f:
-                    gt_points.tofile(f)
-
-                if (used_classes is None) or names[i] in used_classes:
-                    db_path = str(filepath.relative_to(self.root_path))  # gt_database/xxxxx.bin
-                    db_info = {'name': names[i], 'path': db_path, 'image_idx': sample_idx, 'gt_idx': i,
-                               'box3d_lidar': gt_boxes[i], 'num_points_in_gt': gt_points.shape[0],
-                               'difficulty': difficulty[i], 'bbox': bbox[i], 'score': annos['score'][i]}
-                    if names[i] in all_db_infos:
-                        all_db_infos[names[i]].append(db_info)
-                    else:
-                        all_db_infos[names[i]] = [db_info]
-        for k, v in all_db_infos.items():
-            print('Database %s: %d' % (k, len(v)))
-
-        with open(db_info_save_path, 'wb') as f:
-            pickle.dump(all_db_infos, f)
+        get_sample_objects = functools.partial(
+            self.get_gt_database_objects, database_save_path=database_save_path, used_classes=used_classes
+        )
+        gt_database_utils.create_gt_database_sharded(
+            get_sample_objects, infos, root_path=self.root_path, database_save_path=database_save_path,
+            db_info_save_path=db_info_save_path, num_features=4, packed_db_path=packed_db_path,
+            num_workers=num_workers, resume=resume
+        )
 
     @staticmethod
     def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None):
@@ -326,8 +512,10 @@ class KittiDataset(DatasetTemplate):
         from .kitti_object_eval_python import eval as kitti_eval
 
         eval_det_annos = copy.deepcopy(det_annos)
-        eval_gt_annos = [copy.deepcopy(info['annos']) for info in self.kitti_infos]
-        ap_result_str, ap_dict = kitti_eval.get_official_eval_result(eval_gt_annos, eval_det_annos, class_names)
+        eval_gt_annos = [info['annos'] for info in self.kitti_infos]
+        ap_result_str, ap_dict = kitti_eval.get_official_eval_result(
+            eval_gt_annos, eval_det_annos, class_names, num_workers=self.dataset_cfg.get('EVAL_NUM_WORKERS', 0)
+        )
 
         return ap_result_str, ap_dict
 
@@ -342,18 +530,22 @@ class KittiDataset(DatasetTemplate):
         if self._merge_all_iters_to_one_epoch:
             index = index % len(self.kitti_infos)
 
-        info = copy.deepcopy(self.kitti_infos[index])
+        info = self.kitti_infos[index]  # a freshly deserialized dict, no deepcopy needed
 
         sample_idx = info['point_cloud']['lidar_idx']
 
-        points = self.get_lidar(sample_idx)
-        calib = self.get_calib(sample_idx)
+        calib = self.get_calib(sample_idx, calib_info=info.get('calib', None))
 
         img_shape = info['image']['image_shape']
-        if self.dataset_cfg.FOV_POINTS_ONLY:
-            pts_rect = calib.lidar_to_rect(points[:, 0:3])
-            fov_flag = self.get_fov_flag(pts_rect, img_shape, calib)
-            points = points[fov_flag]
+        if self.dataset_cfg.FOV_POINTS_ONLY and self.packed_fov_lidar is not None \
+                and sample_idx in self.packed_fov_lidar:
+            points = self.packed_fov_lidar.get(sample_idx)  # already cropped
+        else:
+            points = self.get_lidar(sample_idx)
+            if self.dataset_cfg.FOV_POINTS_ONLY:
+                points = points[self.get_fov_flag_from_planes(points[:, 0:3], self.get_fov_planes(info))]
+        if not points.flags.writeable:
+            points = points.copy()  # the packed lidar is a read-only memmap view
 
         input_dict = {
             'points': points,
@@ -383,7 +575,7 @@ class KittiDataset(DatasetTemplate):
         return data_dict
 
 
-def create_kitti_infos(dataset_cfg, class_names, data_path, save_path, workers=4):
+def create_kitti_infos(dataset_cfg, class_names, data_path, save_path, workers=4, resume=False):
     dataset = KittiDataset(dataset_cfg=dataset_cfg, class_names=class_names, root_path=data_path, training=False)
     train_split, val_split = 'train', 'val'
 
@@ -392,40 +584,77 @@ def create_kitti_infos(dataset_cfg, class_names, data_path, save_path, workers=4
     trainval_filename = save_path / 'kitti_infos_trainval.pkl'
     test_filename = save_path / 'kitti_infos_test.pkl'
 
-    print('---------------Start to generate data infos---------------')
+    if dataset_cfg.get('PACKED_LIDAR', False):
+        print('---------------Start to pack lidar points---------------')
+        dataset.set_split(train_split)
+        dataset.create_packed_lidar()
+        dataset.set_split('test')
+        dataset.create_packed_lidar()
+
+    def create_split_infos(split, info_filename, has_label):
+        resume_path = info_filename.parent / (info_filename.name + '.partial')
+        if resume and info_filename.exists():
+            print('Kitti info %s file exists, skipped: %s' % (split, info_filename))
+            with open(info_filename, 'rb') as f:
+                return pickle.load(f)
+        if not resume and resume_path.exists():
+            resume_path.unlink()
+
+        dataset.set_split(split)
+        split_infos = dataset.get_infos(
+            num_workers=workers, has_label=has_label, count_inside_pts=has_label, resume_path=resume_path
+        )
+        with open(info_filename, 'wb') as f:
+            pickle.dump(split_infos, f)
+        if resume_path.exists():
+            resume_path.unlink()
+        print('Kitti info %s file is saved to %s' % (split, info_filename))
+        return split_infos
 
-    dataset.set_split(train_split)
-    kitti_infos_train = dataset.get_infos(num_workers=workers, has_label=True, count_inside_pts=True)
-    with open(train_filename, 'wb') as f:
-        pickle.dump(kitti_infos_train, f)
-    print('Kitti info train file is saved to %s' % train_filename)
+    print('---------------Start to generate data infos---------------')
 
-    dataset.set_split(val_split)
-    kitti_infos_val = dataset.get_infos(num_workers=workers, has_label=True, count_inside_pts=True)
-    with open(val_filename, 'wb') as f:
-        pickle.dump(kitti_infos_val, f)
-    print('Kitti info val file is saved to %s' % val_filename)
+    kitti_infos_train = create_split_infos(train_split, train_filename, has_label=True)
+    kitti_infos_val = create_split_infos(val_split, val_filename, has_label=True)
 
     with open(trainval_filename, 'wb') as f:
         pickle.dump(kitti_infos_train + kitti_infos_val, f)
     print('Kitti info trainval file is saved to %s' % trainval_filename)
 
-    dataset.set_split('test')
-    kitti_infos_test = dataset.get_infos(num_workers=workers, has_label=False, count_inside_pts=False)
-    with open(test_filename, 'wb') as f:
-        pickle.dump(kitti_infos_test, f)
-    print('Kitti info test file is saved to %s' % test_filename)
+    kitti_infos_test = create_split_infos('test', test_filename, has_label=False)
+
+    if dataset_cfg.get('PACKED_FOV_LIDAR', False):
+        print('---------------Start to pack field-of-view lidar points---------------')
+        dataset.set_split(train_split)
+        dataset.create_packed_fov_lidar(kitti_infos_train + kitti_infos_val)
+        dataset.set_split('test')
+        dataset.create_packed_fov_lidar(kitti_infos_test)
 
     print('---------------Start create groundtruth database for data augmentation---------------')
     dataset.set_split(train_split)
-    dataset.create_groundtruth_database(train_filename, split=train_split)
+    dataset.create_groundtruth_database(
+        train_filename, split=train_split, packed=dataset_cfg.get('PACKED_GT_DATABASE', False),
+        num_workers=workers, resume=resume
+    )
 
     print('---------------Data preparation Done---------------')
 
 
 if __name__ == '__main__':
     import sys
-    if sys.argv.__len__() > 1 and sys.argv[1] == 'create_kitti_infos':
+    if sys.argv.__len__() > 1 and sys.argv[1] == 'create_packed_lidar':
+        import yaml
+        from pathlib import Path
+        from easydict import EasyDict
+        dataset_cfg = EasyDict(yaml.load(open(sys.argv[2])))
+        ROOT_DIR = (Path(__file__).resolve().parent / '../../../').resolve()
+        dataset = KittiDataset(
+            dataset_cfg=dataset_cfg, class_names=['Car', 'Pedestrian', 'Cyclist'],
+            root_path=ROOT_DIR / 'data' / 'kitti', training=False
+        )
+        for split in ['train', 'test']:
+            dataset.set_split(split)
+            dataset.create_packed_lidar()
+    elif sys.argv.__len__() > 1 and sys.argv[1] == 'create_kitti_infos':
         import yaml
         from pathlib import Path
         from easydict import EasyDict
@@ -435,5 +664,6 @@ if __name__ == '__main__':
             dataset_cfg=dataset_cfg,
             class_names=['Car', 'Pedestrian', 'Cyclist'],
             data_path=ROOT_DIR / 'data' / 'kitti',
-            save_path=ROOT_DIR / 'data' / 'kitti'
+            save_path=ROOT_DIR / 'data' / 'kitti',
+            resume=sys.argv.__len__() > 3 and sys.argv[3] == 'resume'
         )
@@ -1,4 +1,6 @@
 import io as sysio
+import multiprocessing
+import time
 
 import numba
 import numpy as np
@@ -445,6 +447,169 @@ def _prepare_data(gt_annos, dt_annos, current_class, difficulty):
             total_dc_num, total_num_valid_gt)
 
 
+# inputs of the evaluation cells, set before the process pool is forked so that the workers inherit them
+_eval_data = {}
+
+
+def eval_cell(metric, current_class, difficulty, min_overlaps, compute_aos=False, num_parts=100):
+    """One (metric, class, difficulty) cell of eval_class, reading the annos
+    and the shared overlaps of the metric from _eval_data.
+    Args:
+        metric: eval type. 0: bbox, 1: bev, 2: 3d
+        current_class: int
+        difficulty: int
+        min_overlaps: list of float, min overlaps of the class and metric
+
+    Returns:
+        precision, recall, aos: [num_minoverlap, num_sample_points]
+    """
+    gt_annos, dt_annos = _eval_data['gt_annos'], _eval_data['dt_annos']
+    overlaps, parted_overlaps, total_dt_num, total_gt_num = _eval_data['overlaps'][metric]
+    num_examples = len(gt_annos)
+    split_parts = get_split_parts(num_examples, num_parts)
+
+    # _prepare_data does not depend on the metric, keep it for the other cells of the process
+    prepared_data = _eval_data.setdefault('prepared_data', {})
+    if (current_class, difficulty) not in prepared_data:
+        prepared_data[(current_class, difficulty)] = _prepare_data(gt_annos, dt_annos, current_class, difficulty)
+    (gt_datas_list, dt_datas_list, ignored_gts, ignored_dets,
+     dontcares, total_dc_num, total_num_valid_gt) = prepared_data[(current_class, difficulty)]
+
+    N_SAMPLE_PTS = 41
+    precision = np.zeros([len(min_overlaps), N_SAMPLE_PTS])
+    recall = np.zeros([len(min_overlaps), N_SAMPLE_PTS])
+    aos = np.zeros([len(min_overlaps), N_SAMPLE_PTS])
+    for k, min_overlap in enumerate(min_overlaps):
+        thresholdss = []
+        for i in range(len(gt_annos)):
+            rets = compute_statistics_jit(
+                overlaps[i],
+                gt_datas_list[i],
+                dt_datas_list[i],
+                ignored_gts[i],
+                ignored_dets[i],
+                dontcares[i],
+                metric,
+                min_overlap=min_overlap,
+                thresh=0.0,
+                compute_fp=False)
+            tp, fp, fn, similarity, thresholds = rets
+            thresholdss += thresholds.tolist()
+        thresholdss = np.array(thresholdss)
+        thresholds = get_thresholds(thresholdss, total_num_valid_gt)
+        thresholds = np.array(thresholds)
+        pr = np.zeros([len(thresholds), 4])
+        idx = 0
+        for j, num_part in enumerate(split_parts):
+            gt_datas_part = np.concatenate(
+                gt_datas_list[idx:idx + num_part], 0)
+            dt_datas_part = np.concatenate(
+                dt_datas_list[idx:idx + num_part], 0)
+            dc_datas_part = np.concatenate(
+                dontcares[idx:idx + num_part], 0)
+            ignored_dets_part = np.concatenate(
+                ignored_dets[idx:idx + num_part], 0)
+            ignored_gts_part = np.concatenate(
+                ignored_gts[idx:idx + num_part], 0)
+            fused_compute_statistics(
+                parted_overlaps[j],
+                pr,
+                total_gt_num[idx:idx + num_part],
+                total_dt_num[idx:idx + num_part],
+                total_dc_num[idx:idx + num_part],
+                gt_datas_part,
+                dt_datas_part,
+                dc_datas_part,
+                ignored_gts_part,
+                ignored_dets_part,
+                metric,
+                min_overlap=min_overlap,
+                thresholds=thresholds,
+                compute_aos=compute_aos)
+            idx += num_part
+        for i in range(len(thresholds)):
+            recall[k, i] = pr[i, 0] / (pr[i, 0] + pr[i, 2])
+            precision[k, i] = pr[i, 0] / (pr[i, 0] + pr[i, 1])
+            if compute_aos:
+                aos[k, i] = pr[i, 3] / (pr[i, 0] + pr[i, 1])
+        for i in range(len(thresholds)):
+            precision[k, i] = np.max(precision[k, i:], axis=-1)
+            recall[k, i] = np.max(recall[k, i:], axis=-1)
+            if compute_aos:
+                aos[k, i] = np.max(aos[k, i:], axis=-1)
+    return precision, recall, aos
+
+
+def _eval_cell_args(args):
+    return eval_cell(*args)
+
+
+def eval_classes(gt_annos,
+                 dt_annos,
+                 current_classes,
+                 difficultys,
+                 metrics,
+                 min_overlaps,
+                 compute_aos=False,
+                 num_parts=100,
+                 num_workers=0,
+                 timings=None):
+    """eval_class of several metrics. The overlaps of each metric are
+    computed once and shared by its cells, the independent (metric, class,
+    difficulty) cells can run in a pool of forked processes.
+    Args:
+        metrics: list of eval types. 0: bbox, 1: bev, 2: 3d
+        compute_aos: aos is only computed for the bbox metric
+        num_workers: number of forked processes of the cells, 0 to run them
+            sequentially in the current process. The pool is opt-in: forking
+            a process holding a CUDA context (train.py, test.py) is only safe
+            as long as the children do not touch CUDA
+        timings: optional dict receiving the time of each stage in seconds
+
+    Returns:
+        dict of metric => dict of recall, precision and aos
+    """
+    assert len(gt_annos) == len(dt_annos)
+    timings = timings if timings is not None else {}
+    metric_names = {0: 'bbox', 1: 'bev', 2: '3d'}
+
+    _eval_data.clear()
+    _eval_data.update({'gt_annos': gt_annos, 'dt_annos': dt_annos, 'overlaps': {}})
+    for metric in metrics:
+        start_time = time.time()
+        _eval_data['overlaps'][metric] = calculate_iou_partly(dt_annos, gt_annos, metric, num_parts)
+        timings['iou_%s' % metric_names[metric]] = time.time() - start_time
+
+    cells = [(metric, m, l) for metric in metrics
+             for m in range(len(current_classes)) for l in range(len(difficultys))]
+    cell_args = [(metric, current_classes[m], difficultys[l], min_overlaps[:, metric, m].tolist(),
+                  compute_aos and metric == 0, num_parts) for metric, m, l in cells]
+
+    start_time = time.time()
+    num_workers = min(num_workers, len(cells))
+    # fork keeps _eval_data and the jitted functions compiled by the first cell in the parent
+    if num_workers > 1 and len(cells) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        import concurrent.futures as futures
+
+        cell_rets = [eval_cell(*cell_args[0])]
+        with futures.ProcessPoolExecutor(num_workers, mp_context=multiprocessing.get_context('fork')) as executor:
+            cell_rets += list(executor.map(_eval_cell_args, cell_args[1:]))
+    else:
+        cell_rets = [eval_cell(*args) for args in cell_args]
+    timings['statistics'] = time.time() - start_time
+    _eval_data.clear()
+
+    N_SAMPLE_PTS = 41
+    shape = [len(current_classes), len(difficultys), len(min_overlaps), N_SAMPLE_PTS]
+    ret_dicts = {metric: {"recall": np.zeros(shape), "precision": np.zeros(shape), "orientation": np.zeros(shape)}
+                 for metric in metrics}
+    for (metric, m, l), (precision, recall, aos) in zip(cells, cell_rets):
+        ret_dicts[metric]["precision"][m, l] = precision
+        ret_dicts[metric]["recall"][m, l] = recall
+        ret_dicts[metric]["orientation"][m, l] = aos
+    return ret_dicts
+
+
 def eval_class(gt_annos,
                dt_annos,
                current_classes,
@@ -452,7 +617,8 @@ def eval_class(gt_annos,
                metric,
                min_overlaps,
                compute_aos=False,
-               num_parts=100):
+               num_parts=100,
+               num_workers=0):
     """Kitti eval. support 2d/bev/3d/aos eval. support 0.5:0.05:0.95 coco AP.
     Args:
         gt_annos: dict, must from get_label_annos() in kitti_common.py
@@ -462,95 +628,13 @@ def eval_class(gt_annos,
         metric: eval type. 0: bbox, 1: bev, 2: 3d
         min_overlaps: float, min overlap. format: [num_overlap, metric, class].
         num_parts: int. a parameter for fast calculate algorithm
+        num_workers: number of processes of the cells, see eval_classes
 
     Returns:
         dict of recall, precision and aos
     """
-    assert len(gt_annos) == len(dt_annos)
-    num_examples = len(gt_annos)
-    split_parts = get_split_parts(num_examples, num_parts)
-
-    rets = calculate_iou_partly(dt_annos, gt_annos, metric, num_parts)
-    overlaps, parted_overlaps, total_dt_num, total_gt_num = rets
-    N_SAMPLE_PTS = 41
-    num_minoverlap = len(min_overlaps)
-    num_class = len(current_classes)
-    num_difficulty = len(difficultys)
-    precision = np.zeros(
-        [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS])
-    recall = np.zeros(
-        [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS])
-    aos = np.zeros([num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS])
-    for m, current_class in enumerate(current_classes):
-        for l, difficulty in enumerate(difficultys):
-            rets = _prepare_data(gt_annos, dt_annos, current_class, difficulty)
-            (gt_datas_list, dt_datas_list, ignored_gts, ignored_dets,
-             dontcares, total_dc_num, total_num_valid_gt) = rets
-            for k, min_overlap in enumerate(min_overlaps[:, metric, m]):
-                thresholdss = []
-                for i in range(len(gt_annos)):
-                    rets = compute_statistics_jit(
-                        overlaps[i],
-                        gt_datas_list[i],
-                        dt_datas_list[i],
-                        ignored_gts[i],
-                        ignored_dets[i],
-                        dontcares[i],
-                        metric,
-                        min_overlap=min_overlap,
-                        thresh=0.0,
-                        compute_fp=False)
-                    tp, fp, fn, similarity, thresholds = rets
-                    thresholdss += thresholds.tolist()
-                thresholdss = np.array(thresholdss)
-                thresholds = get_thresholds(thresholdss, total_num_valid_gt)
-                thresholds = np.array(thresholds)
-                pr = np.zeros([len(thresholds), 4])
-                idx = 0
-                for j, num_part in enumerate(split_parts):
-                    gt_datas_part = np.concatenate(
-                        gt_datas_list[idx:idx + num_part], 0)
-                    dt_datas_part = np.concatenate(
-                        dt_datas_list[idx:idx + num_part], 0)
-                    dc_datas_part = np.concatenate(
-                        dontcares[idx:idx + num_part], 0)
-                    ignored_dets_part = np.concatenate(
-                        ignored_dets[idx:idx + num_part], 0)
-                    ignored_gts_part = np.concatenate(
-                        ignored_gts[idx:idx + num_part], 0)
-                    fused_compute_statistics(
-                        parted_overlaps[j],
-                        pr,
-                        total_gt_num[idx:idx + num_part],
-                        total_dt_num[idx:idx + num_part],
-                        total_dc_num[idx:idx + num_part],
-                        gt_datas_part,
-                        dt_datas_part,
-                        dc_datas_part,
-                        ignored_gts_part,
-                        ignored_dets_part,
-                        metric,
-                        min_overlap=min_overlap,
-                        thresholds=thresholds,
-                        compute_aos=compute_aos)
-                    idx += num_part
-                for i in range(len(thresholds)):
-                    recall[m, l, k, i] = pr[i, 0] / (pr[i, 0] + pr[i, 2])
-                    precision[m, l, k, i] = pr[i, 0] / (pr[i, 0] + pr[i, 1])
-                    if compute_aos:
-                        aos[m, l, k, i] = pr[i, 3] / (pr[i, 0] + pr[i, 1])
-                for i in range(len(thresholds)):
-                    precision[m, l, k, i] = np.max(
-                        precision[m, l, k, i:], axis=-1)
-                    recall[m, l, k, i] = np.max(recall[m, l, k, i:], axis=-1)
-                    if compute_aos:
-                        aos[m, l, k, i] = np.max(aos[m, l, k, i:], axis=-1)
-    ret_dict = {
-        "recall": recall,
-        "precision": precision,
-        "orientation": aos,
-    }
-    return ret_dict
+    return eval_classes(gt_annos, dt_annos, current_classes, difficultys, [metric], min_overlaps,
+                        compute_aos=compute_aos, num_parts=num_parts, num_workers=num_workers)[metric]
 
 
 def get_mAP(prec):
@@ -581,11 +665,14 @@ def do_eval(gt_annos,
             current_classes,
             min_overlaps,
             compute_aos=False,
-            PR_detail_dict=None):
+            PR_detail_dict=None,
+            num_workers=0,
+            timings=None):
     # min_overlaps: [num_minoverlap, metric, num_class]
     difficultys = [0, 1, 2]
-    ret = eval_class(gt_annos, dt_annos, current_classes, difficultys, 0,
-                     min_overlaps, compute_aos)
+    rets = eval_classes(gt_annos, dt_annos, current_classes, difficultys, [0, 1, 2],
+                        min_overlaps, compute_aos, num_workers=num_workers, timings=timings)
+    ret = rets[0]
     # ret: [num_class, num_diff, num_minoverlap, num_sample_points]
     mAP_bbox = get_mAP(ret["precision"])
     mAP_bbox_R40 = get_mAP_R40(ret["precision"])
@@ -601,16 +688,14 @@ def do_eval(gt_annos,
         if PR_detail_dict is not None:
             PR_detail_dict['aos'] = ret['orientation']
 
-    ret = eval_class(gt_annos, dt_annos, current_classes, difficultys, 1,
-                     min_overlaps)
+    ret = rets[1]
     mAP_bev = get_mAP(ret["precision"])
     mAP_bev_R40 = get_mAP_R40(ret["precision"])
 
     if PR_detail_dict is not None:
         PR_detail_dict['bev'] = ret['precision']
 
-    ret = eval_class(gt_annos, dt_annos, current_classes, difficultys, 2,
-                     min_overlaps)
+    ret = rets[2]
     mAP_3d = get_mAP(ret["precision"])
     mAP_3d_R40 = get_mAP_R40(ret["precision"])
     if PR_detail_dict is not None:
@@ -636,7 +721,8 @@ def do_coco_style_eval(gt_annos, dt_annos, current_classes, overlap_ranges,
     return mAP_bbox, mAP_bev, mAP_3d, mAP_aos
 
 
-def get_official_eval_result(gt_annos, dt_annos, current_classes, PR_detail_dict=None):
+def get_official_eval_result(gt_annos, dt_annos, current_classes, PR_detail_dict=None, num_workers=0):
+    start_time = time.time()
     overlap_0_7 = np.array([[0.7, 0.5, 0.5, 0.7,
                              0.5, 0.7], [0.7, 0.5, 0.5, 0.7, 0.5, 0.7],
                             [0.7, 0.5, 0.5, 0.7, 0.5, 0.7]])
@@ -671,8 +757,10 @@ def get_official_eval_result(gt_annos, dt_annos, current_classes, PR_detail_dict
             if anno['alpha'][0] != -10:
                 compute_aos = True
             break
+    timings = {}
     mAPbbox, mAPbev, mAP3d, mAPaos, mAPbbox_R40, mAPbev_R40, mAP3d_R40, mAPaos_R40 = do_eval(
-        gt_annos, dt_annos, current_classes, min_overlaps, compute_aos, PR_detail_dict=PR_detail_dict)
+        gt_annos, dt_annos, current_classes, min_overlaps, compute_aos, PR_detail_dict=PR_detail_dict,
+        num_workers=num_workers, timings=timings)
 
     ret_dict = {}
     for j, curcls in enumerate(current_classes):
@@ -743,6 +831,8 @@ def get_official_eval_result(gt_annos, dt_annos, current_classes, PR_detail_dict
                 ret_dict['%s_image/moderate_R40' % class_to_name[curcls]] = mAPbbox_R40[j, 1, 0]
                 ret_dict['%s_image/hard_R40' % class_to_name[curcls]] = mAPbbox_R40[j, 2, 0]
 
+    timings['total'] = time.time() - start_time
+    result += print_str('Eval time: ' + ', '.join(['%s %.2fs' % (k, v) for k, v in timings.items()]))
     return result, ret_dict
 
 
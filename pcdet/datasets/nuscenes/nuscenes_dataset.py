@@ -1,12 +1,11 @@
-import copy
+import os
 import pickle
 from pathlib import Path
 
 import numpy as np
-from tqdm import tqdm
 
 from ...ops.roiaware_pool3d import roiaware_pool3d_utils
-from ...utils import common_utils
+from ...utils import common_utils, gt_database_utils, info_store_utils, packed_utils
 from ..dataset import DatasetTemplate
 
 
@@ -20,6 +19,11 @@ class NuScenesDataset(DatasetTemplate):
         self.include_nuscenes_data(self.mode)
         if self.training and self.dataset_cfg.get('BALANCED_RESAMPLING', False):
             self.infos = self.balanced_infos_resampling(self.infos)
+        # one flat buffer instead of a list of dicts, shared by the DataLoader workers without copy-on-write
+        self.infos = info_store_utils.SerializedInfoList(self.infos)
+        # consecutive keyframes share most of their sweeps, keep the decoded ones of each worker
+        self.sweep_cache = common_utils.ArrayLRUCache(self.dataset_cfg.get('SWEEP_CACHE_MB', 256) * 1024 * 1024)
+        self.packed_sweeps = self.get_packed_sweeps_reader()
 
     def include_nuscenes_data(self, mode):
         self.logger.info('Loading NuScenes dataset')
@@ -73,31 +77,113 @@ class NuScenesDataset(DatasetTemplate):
 
         return sampled_infos
 
-    def get_sweep(self, sweep_info):
-        def remove_ego_points(points, center_radius=1.0):
-            mask = ~((np.abs(points[:, 0]) < center_radius) & (np.abs(points[:, 1]) < center_radius))
-            return points[mask]
+    def get_packed_sweeps_paths(self, max_sweeps):
+        blob_path = self.root_path / ('nuscenes_packed_%dsweeps_%s.bin' % (max_sweeps, self.mode))
+        index_path = self.root_path / ('nuscenes_packed_%dsweeps_%s_index.pkl' % (max_sweeps, self.mode))
+        return blob_path, index_path
+
+    def get_packed_sweeps_reader(self):
+        if self.training or not self.dataset_cfg.get('PACKED_SWEEPS', False):
+            return None
+
+        blob_path, index_path = self.get_packed_sweeps_paths(self.dataset_cfg.MAX_SWEEPS)
+        if not (blob_path.exists() and index_path.exists()):
+            self.logger.info('Packed sweeps not found in %s, fall back to the sweep files' % blob_path)
+            return None
+        return packed_utils.PackedPointsReader.from_index_file(blob_path, index_path)
+
+    def create_packed_sweeps(self, max_sweeps=10):
+        """
+        Pack the multi-sweep point clouds of the current infos into one contiguous float32 blob plus an offset index
+        keyed by the sample token, which are read by get_lidar_with_sweeps when PACKED_SWEEPS is enabled for
+        evaluation. The nearest max_sweeps - 1 sweeps are taken, so the packed clouds are deterministic.
+        """
+        blob_path, index_path = self.get_packed_sweeps_paths(max_sweeps)
+        self.packed_sweeps = None
+        writer = packed_utils.PackedPointsWriter(blob_path, num_features=5)
+        for idx in range(len(self.infos)):
+            if (idx + 1) % 500 == 0 or idx + 1 == len(self.infos):
+                print('packed sweeps sample: %d/%d' % (idx + 1, len(self.infos)))
+            points = self.get_lidar_with_sweeps(
+                idx, max_sweeps=max_sweeps, sweep_idxs=self.get_nearest_sweep_idxs(max_sweeps)
+            )
+            writer.add(points, key=self.infos[idx]['token'])
+        writer.close(index_path)
+        print('Packed sweeps of %d samples are saved to %s' % (len(self.infos), blob_path))
+
+        self.packed_sweeps = self.get_packed_sweeps_reader()
+
+    @staticmethod
+    def load_sweep_points(lidar_path, center_radius=1.0):
+        points_sweep = np.fromfile(lidar_path, dtype=np.float32, count=-1).reshape([-1, 5])[:, :4]
+        ego_mask = (np.abs(points_sweep[:, 0]) < center_radius) & (np.abs(points_sweep[:, 1]) < center_radius)
+        return points_sweep[~ego_mask]
 
-        lidar_path = self.root_path / sweep_info['lidar_path']
-        points_sweep = np.fromfile(str(lidar_path), dtype=np.float32, count=-1).reshape([-1, 5])[:, :4]
-        points_sweep = remove_ego_points(points_sweep).T
+    def get_sweep(self, sweep_info):
+        lidar_path = str(self.root_path / sweep_info['lidar_path'])
+        points_sweep = self.sweep_cache.get(lidar_path, self.load_sweep_points)
         if sweep_info['transform_matrix'] is not None:
-            num_points = points_sweep.shape[1]
-            points_sweep[:3, :] = sweep_info['transform_matrix'].dot(
-                np.vstack((points_sweep[:3, :], np.ones(num_points))))[:3, :]
+            transform_matrix = sweep_info['transform_matrix']
+            points_sweep = points_sweep.copy()
+            points_sweep[:, :3] = points_sweep[:, :3].dot(transform_matrix[:3, :3].T) + transform_matrix[:3, 3]
+
+        cur_times = np.full((points_sweep.shape[0], 1), sweep_info['time_lag'])
+        return points_sweep, cur_times
 
-        cur_times = sweep_info['time_lag'] * np.ones((1, points_sweep.shape[1]))
-        return points_sweep.T, cur_times.T
+    @staticmethod
+    def get_nearest_sweep_idxs(max_sweeps):
+        # info['sweeps'] is ordered from the nearest sweep backwards
+        return np.arange(max_sweeps - 1)
+
+    def get_eval_lidar_with_sweeps(self, index, max_sweeps=1):
+        """
+        Deterministic multi-sweep cloud of the nearest max_sweeps - 1 sweeps. With EVAL_SWEEPS_CACHE, the clouds
+        are saved to root_path/eval_sweeps_cache_<max_sweeps>sweeps_<mode>/<token>.npy on their first use, so that
+        the evaluation of the following checkpoints skips the sweep I/O.
+        """
+        if not self.dataset_cfg.get('EVAL_SWEEPS_CACHE', False):
+            return self.get_lidar_with_sweeps(
+                index, max_sweeps=max_sweeps, sweep_idxs=self.get_nearest_sweep_idxs(max_sweeps)
+            )
+
+        cache_dir = self.root_path / ('eval_sweeps_cache_%dsweeps_%s' % (max_sweeps, self.mode))
+        cache_file = cache_dir / ('%s.npy' % self.infos[index]['token'])
+        if cache_file.exists():
+            return np.load(str(cache_file), mmap_mode='r')
+
+        points = self.get_lidar_with_sweeps(
+            index, max_sweeps=max_sweeps, sweep_idxs=self.get_nearest_sweep_idxs(max_sweeps)
+        )
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_dir / ('%s.%d.tmp.npy' % (cache_file.stem, os.getpid()))
+        np.save(str(tmp_file), points)
+        os.replace(str(tmp_file), str(cache_file))
+        return points
 
-    def get_lidar_with_sweeps(self, index, max_sweeps=1):
+    def get_lidar_with_sweeps(self, index, max_sweeps=1, sweep_idxs=None):
+        """
+        Args:
+            index:
+            max_sweeps:
+            sweep_idxs: indices of the max_sweeps - 1 sweeps to take from info['sweeps'], random if None
+
+        Returns:
+            points: (N, 5) [x, y, z, intensity, time_lag]
+        """
         info = self.infos[index]
+        if self.packed_sweeps is not None and max_sweeps == self.dataset_cfg.MAX_SWEEPS \
+                and info['token'] in self.packed_sweeps:
+            return self.packed_sweeps.get(info['token'])
+
         lidar_path = self.root_path / info['lidar_path']
         points = np.fromfile(str(lidar_path), dtype=np.float32, count=-1).reshape([-1, 5])[:, :4]
 
         sweep_points_list = [points]
         sweep_times_list = [np.zeros((points.shape[0], 1))]
 
-        for k in np.random.choice(len(info['sweeps']), max_sweeps - 1, replace=False):
+        if sweep_idxs is None:
+            sweep_idxs = np.random.choice(len(info['sweeps']), max_sweeps - 1, replace=False)
+        for k in sweep_idxs:
             points_sweep, times_sweep = self.get_sweep(info['sweeps'][k])
             sweep_points_list.append(points_sweep)
             sweep_times_list.append(times_sweep)
@@ -118,8 +204,11 @@ class NuScenesDataset(DatasetTemplate):
         if self._merge_all_iters_to_one_epoch:
             index = index % len(self.infos)
 
-        info = copy.deepcopy(self.infos[index])
-        points = self.get_lidar_with_sweeps(index, max_sweeps=self.dataset_cfg.MAX_SWEEPS)
+        info = self.infos[index]  # a freshly deserialized dict, no deepcopy needed
+        if self.training or not self.dataset_cfg.get('DETERMINISTIC_EVAL_SWEEPS', False):
+            points = self.get_lidar_with_sweeps(index, max_sweeps=self.dataset_cfg.MAX_SWEEPS)
+        else:
+            points = self.get_eval_lidar_with_sweeps(index, max_sweeps=self.dataset_cfg.MAX_SWEEPS)
 
         input_dict = {
             'points': points,
@@ -251,49 +340,68 @@ class NuScenesDataset(DatasetTemplate):
         result_str, result_dict = nuscenes_utils.format_nuscene_results(metrics, self.class_names, version=eval_version)
         return result_str, result_dict
 
-    def create_groundtruth_database(self, used_classes=None, max_sweeps=10):
-        import torch
+    def get_gt_database_objects(self, idx, database_save_path, used_classes=None, max_sweeps=10):
+        """
+        Args:
+            idx: index of the sample in self.infos
+            database_save_path:
+            used_classes:
+            max_sweeps:
+
+        Returns:
+            objects: list of (name, gt_points, filepath, db_info) of the objects of the sample, db_info is None for
+                the objects of the unused classes
+        """
+        sample_idx = idx
+        info = self.infos[idx]
+        points = self.get_lidar_with_sweeps(idx, max_sweeps=max_sweeps)
+        gt_boxes = info['gt_boxes']
+        gt_names = info['gt_names']
+
+        # same margin as points_in_boxes_gpu, which built the nuScenes database before
+        box_idxs_of_pts = roiaware_pool3d_utils.points_in_boxes_idx_cpu(points[:, 0:3], gt_boxes[:, 0:7], margin=1e-5)
+
+        objects = []
+        for i in range(gt_boxes.shape[0]):
+            filename = '%s_%s_%d.bin' % (sample_idx, gt_names[i], i)
+            filepath = database_save_path / filename
+            gt_points = points[box_idxs_of_pts == i]
+
+            gt_points[:, :3] -= gt_boxes[i, :3]
+            db_info = None
+            if (used_classes is None) or gt_names[i] in used_classes:
+                db_path = str(filepath.relative_to(self.root_path))  # gt_database/xxxxx.bin
+                db_info = {'name': gt_names[i], 'path': db_path, 'image_idx': sample_idx, 'gt_idx': i,
+                           'box3d_lidar': gt_boxes[i], 'num_points_in_gt': gt_points.shape[0]}
+            objects.append((gt_names[i], gt_points, filepath, db_info))
+        return objects
+
+    def create_groundtruth_database(self, used_classes=None, max_sweeps=10, packed=False, num_workers=4,
+                                    resume=False):
+        """
+        Args:
+            used_classes:
+            max_sweeps:
+            packed: write the points of all objects into one gt_database blob and record their
+                (start_row, num_rows) in the db_infos instead of writing one file per object
+            num_workers: number of processes, 0 to build the database in the current process
+            resume: keep the finished shards of an interrupted build
+        """
+        import functools
 
         database_save_path = self.root_path / f'gt_database_{max_sweeps}sweeps_withvelo'
         db_info_save_path = self.root_path / f'nuscenes_dbinfos_{max_sweeps}sweeps_withvelo.pkl'
+        packed_db_path = self.root_path / f'gt_database_{max_sweeps}sweeps_withvelo_packed.bin' if packed else None
 
-        database_save_path.mkdir(parents=True, exist_ok=True)
-        all_db_infos = {}
-
-        for idx in tqdm(range(len(self.infos))):
-            sample_idx = idx
-            info = self.infos[idx]
-            points = self.get_lidar_with_sweeps(idx, max_sweeps=max_sweeps)
-            gt_boxes = info['gt_boxes']
-            gt_names = info['gt_names']
-
-            box_idxs_of_pts = roiaware_pool3d_utils.points_in_boxes_gpu(
-                torch.from_numpy(points[:, 0:3]).unsqueeze(dim=0).float().cuda(),
-                torch.from_numpy(gt_boxes[:, 0:7]).unsqueeze(dim=0).float().cuda()
-            ).long().squeeze(dim=0).cpu().numpy()
-
-            for i in range(gt_boxes.shape[0]):
-                filename = '%s_%s_%d.bin' % (sample_idx, gt_names[i], i)
-                filepath = database_save_path / filename
-                gt_points = points[box_idxs_of_pts == i]
-
-                gt_points[:, :3] -= gt_boxes[i, :3]
-                with open(filepath, 'w') as f:
-                    gt_points.tofile(f)
-
-                if (used_classes is None) or gt_names[i] in used_classes:
-                    db_path = str(filepath.relative_to(self.root_path))  # gt_database/xxxxx.bin
-                    db_info = {'name': gt_names[i], 'path': db_path, 'image_idx': sample_idx, 'gt_idx': i,
-                               'box3d_lidar': gt_boxes[i], 'num_points_in_gt': gt_points.shape[0]}
-                    if gt_names[i] in all_db_infos:
-                        all_db_infos[gt_names[i]].append(db_info)
-                    else:
-                        all_db_infos[gt_names[i]] = [db_info]
-        for k, v in all_db_infos.items():
-            print('Database %s: %d' % (k, len(v)))
-
-        with open(db_info_save_path, 'wb') as f:
-            pickle.dump(all_db_infos, f)
+        get_sample_objects = functools.partial(
+            self.get_gt_database_objects, database_save_path=database_save_path, used_classes=used_classes,
+            max_sweeps=max_sweeps
+        )
+        gt_database_utils.create_gt_database_sharded(
+            get_sample_objects, list(range(len(self.infos))), root_path=self.root_path,
+            database_save_path=database_save_path, db_info_save_path=db_info_save_path, num_features=5,
+            packed_db_path=packed_db_path, num_workers=num_workers, resume=resume
+        )
 
 
 def create_nuscenes_info(version, data_path, save_path, max_sweeps=10):
@@ -353,6 +461,8 @@ if __name__ == '__main__':
     parser.add_argument('--cfg_file', type=str, default=None, help='specify the config of dataset')
     parser.add_argument('--func', type=str, default='create_nuscenes_infos', help='')
     parser.add_argument('--version', type=str, default='v1.0-trainval', help='')
+    parser.add_argument('--workers', type=int, default=4, help='number of processes of the gt database creation')
+    parser.add_argument('--resume', action='store_true', default=False, help='resume the gt database creation')
     args = parser.parse_args()
 
     if args.func == 'create_nuscenes_infos':
@@ -371,4 +481,17 @@ if __name__ == '__main__':
             root_path=ROOT_DIR / 'data' / 'nuscenes',
             logger=common_utils.create_logger(), training=True
         )
-        nuscenes_dataset.create_groundtruth_database(max_sweeps=dataset_cfg.MAX_SWEEPS)
+        nuscenes_dataset.create_groundtruth_database(
+            max_sweeps=dataset_cfg.MAX_SWEEPS, packed=dataset_cfg.get('PACKED_GT_DATABASE', False),
+            num_workers=args.workers, resume=args.resume
+        )
+    elif args.func == 'create_packed_sweeps':
+        dataset_cfg = EasyDict(yaml.load(open(args.cfg_file)))
+        ROOT_DIR = (Path(__file__).resolve().parent / '../../../').resolve()
+        dataset_cfg.VERSION = args.version
+        nuscenes_dataset = NuScenesDataset(
+            dataset_cfg=dataset_cfg, class_names=None,
+            root_path=ROOT_DIR / 'data' / 'nuscenes',
+            logger=common_utils.create_logger(), training=False
+        )
+        nuscenes_dataset.create_packed_sweeps(max_sweeps=dataset_cfg.MAX_SWEEPS)
@@ -42,10 +42,17 @@ class DataProcessor(object):
 
     def transform_points_to_voxels(self, data_dict=None, config=None, voxel_generator=None):
         if data_dict is None:
-            try:
-                from spconv.utils import VoxelGeneratorV2 as VoxelGenerator
-            except:
-                from spconv.utils import VoxelGenerator
+            VoxelGenerator = None
+            if config.get('VOXEL_GENERATOR', 'spconv') == 'spconv':
+                try:
+                    from spconv.utils import VoxelGeneratorV2 as VoxelGenerator
+                except:
+                    try:
+                        from spconv.utils import VoxelGenerator
+                    except ImportError:
+                        VoxelGenerator = None
+            if VoxelGenerator is None:
+                from .voxel_generator import VoxelGenerator
 
             voxel_generator = VoxelGenerator(
                 voxel_size=config.VOXEL_SIZE,
@@ -74,6 +81,28 @@ class DataProcessor(object):
         data_dict['voxel_num_points'] = num_points
         return data_dict
 
+    def transform_points_to_dynamic_voxels(self, data_dict=None, config=None, voxel_generator=None):
+        """
+        Dynamic voxelization: only the voxel coordinates and the voxel index of each point are computed, the padded
+        (num_voxels, max_points_per_voxel, C) voxels are never built and no point of a voxel is dropped.
+        """
+        if data_dict is None:
+            from .voxel_generator import VoxelGenerator
+
+            voxel_generator = VoxelGenerator(
+                voxel_size=config.VOXEL_SIZE,
+                point_cloud_range=self.point_cloud_range,
+                max_voxels=config.MAX_NUMBER_OF_VOXELS[self.mode]
+            )
+            self.grid_size = voxel_generator.grid_size
+            self.voxel_size = config.VOXEL_SIZE
+            return partial(self.transform_points_to_dynamic_voxels, voxel_generator=voxel_generator)
+
+        point_voxel_ids, coordinates = voxel_generator.points_to_voxel_indices(data_dict['points'])
+        data_dict['voxel_coords'] = coordinates
+        data_dict['point_voxel_ids'] = point_voxel_ids
+        return data_dict
+
     def sample_points(self, data_dict=None, config=None):
         if data_dict is None:
             return partial(self.sample_points, config=config)
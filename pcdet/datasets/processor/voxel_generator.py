@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class VoxelGenerator(object):
+    def __init__(self, voxel_size, point_cloud_range, max_num_points=None, max_voxels=20000):
+        """
+        Sort-based NumPy voxelizer with the same outputs as spconv.utils.VoxelGenerator: voxels are created in the
+        order of their first point, the extra points of a full voxel are dropped and no voxel is created after
+        max_voxels, while the points of the existing voxels are still kept.
+        Args:
+            voxel_size: [vx, vy, vz]
+            point_cloud_range: [x_min, y_min, z_min, x_max, y_max, z_max]
+            max_num_points: max number of points per voxel, only used by generate()
+            max_voxels:
+        """
+        self.voxel_size = np.array(voxel_size, dtype=np.float32)
+        self.point_cloud_range = np.array(point_cloud_range, dtype=np.float32)
+        grid_size = (self.point_cloud_range[3:6] - self.point_cloud_range[0:3]) / self.voxel_size
+        self.grid_size = np.round(grid_size).astype(np.int64)
+        self.max_num_points = max_num_points
+        self.max_voxels = max_voxels
+
+    def points_to_voxel_indices(self, points):
+        """
+        Args:
+            points: (N, 3 + C)
+
+        Returns:
+            point_voxel_ids: (N), voxel index of each point in the order of their first point, -1 for the points
+                outside of the range or the points of the voxels beyond max_voxels
+            coordinates: (num_voxels, 3) [z_idx, y_idx, x_idx], int32
+        """
+        coords = np.floor((points[:, 0:3] - self.point_cloud_range[0:3]) / self.voxel_size).astype(np.int64)
+        valid_mask = ((coords >= 0) & (coords < self.grid_size)).all(axis=1)
+        nx, ny = self.grid_size[0], self.grid_size[1]
+        keys = (coords[:, 2] * ny + coords[:, 1]) * nx + coords[:, 0]
+
+        valid_idx = valid_mask.nonzero()[0]
+        _, first_idx, inverse = np.unique(keys[valid_idx], return_index=True, return_inverse=True)
+        voxel_order = np.argsort(first_idx, kind='stable')[:self.max_voxels]
+        voxel_rank = np.full(first_idx.shape[0], -1, dtype=np.int64)
+        voxel_rank[voxel_order] = np.arange(voxel_order.shape[0])
+
+        point_voxel_ids = np.full(points.shape[0], -1, dtype=np.int64)
+        point_voxel_ids[valid_idx] = voxel_rank[inverse.reshape(-1)]
+        coordinates = coords[valid_idx[first_idx[voxel_order]]][:, [2, 1, 0]].astype(np.int32)
+        return point_voxel_ids, coordinates
+
+    def generate(self, points):
+        """
+        Args:
+            points: (N, 3 + C)
+
+        Returns:
+            voxels: (num_voxels, max_num_points, 3 + C)
+            coordinates: (num_voxels, 3) [z_idx, y_idx, x_idx]
+            num_points_per_voxel: (num_voxels)
+        """
+        point_voxel_ids, coordinates = self.points_to_voxel_indices(points)
+        num_voxels = coordinates.shape[0]
+
+        kept_idx = (point_voxel_ids >= 0).nonzero()[0]
+        kept_voxel_ids = point_voxel_ids[kept_idx]
+        sorted_order = np.argsort(kept_voxel_ids, kind='stable')  # keep the point order inside each voxel
+        counts = np.bincount(kept_voxel_ids, minlength=num_voxels)
+        slots_sorted = np.arange(kept_idx.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+        slots = np.empty_like(slots_sorted)
+        slots[sorted_order] = slots_sorted
+
+        slot_mask = slots < self.max_num_points
+        voxels = np.zeros((num_voxels, self.max_num_points, points.shape[1]), dtype=points.dtype)
+        voxels[kept_voxel_ids[slot_mask], slots[slot_mask]] = points[kept_idx[slot_mask]]
+        num_points_per_voxel = np.minimum(counts, self.max_num_points).astype(np.int32)
+        return voxels, coordinates, num_points_per_voxel
@@ -13,20 +13,87 @@ def build_network(model_cfg, num_class, dataset):
     return model
 
 
-def load_data_to_gpu(batch_dict):
+def load_data_to_device(batch_dict, device, non_blocking=False):
+    """
+    Move the numpy arrays of a collated batch to device. Floating arrays become float32 and integer/bool arrays
+    keep their dtype, so that voxel_coords are not upcast to float and cast back later.
+    Args:
+        batch_dict:
+        device: torch.device
+        non_blocking: pin the host tensors and copy them asynchronously (only for cuda devices)
+    """
     for key, val in batch_dict.items():
         if not isinstance(val, np.ndarray):
             continue
         if key in ['frame_id', 'metadata', 'calib', 'image_shape']:
             continue
-        batch_dict[key] = torch.from_numpy(val).float().cuda()
+        val = torch.from_numpy(val)
+        if val.is_floating_point():
+            val = val.float()
+        if non_blocking and device.type == 'cuda':
+            val = val.pin_memory()
+        batch_dict[key] = val.to(device, non_blocking=non_blocking)
+
+
+def load_data_to_gpu(batch_dict):
+    load_data_to_device(batch_dict, torch.device('cuda'))
+
+
+class DataPrefetcher(object):
+    def __init__(self, dataloader, device=None):
+        """
+        Wrap a DataLoader so that batch N + 1 is copied to device on a side cuda stream while batch N is running.
+        On a cpu device the batches are converted synchronously with the same dtype logic.
+        Args:
+            dataloader: DataLoader from pcdet.datasets.build_dataloader
+            device: default to cuda if it is available
+        """
+        self.dataloader = dataloader
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.device = torch.device(device)
+        self.stream = torch.cuda.Stream(device=self.device) if self.device.type == 'cuda' else None
+
+    @property
+    def dataset(self):
+        return self.dataloader.dataset
+
+    def __len__(self):
+        return len(self.dataloader)
+
+    def preload(self, loader_iter):
+        try:
+            batch_dict = next(loader_iter)
+        except StopIteration:
+            return None
+
+        if self.stream is None:
+            load_data_to_device(batch_dict, self.device)
+        else:
+            with torch.cuda.stream(self.stream):
+                load_data_to_device(batch_dict, self.device, non_blocking=True)
+        return batch_dict
+
+    def __iter__(self):
+        loader_iter = iter(self.dataloader)
+        next_batch = self.preload(loader_iter)
+        while next_batch is not None:
+            batch_dict = next_batch
+            if self.stream is not None:
+                cur_stream = torch.cuda.current_stream(self.device)
+                cur_stream.wait_stream(self.stream)
+                for val in batch_dict.values():
+                    if isinstance(val, torch.Tensor):
+                        val.record_stream(cur_stream)
+            next_batch = self.preload(loader_iter)
+            yield batch_dict
 
 
 def model_fn_decorator():
     ModelReturn = namedtuple('ModelReturn', ['loss', 'tb_dict', 'disp_dict'])
 
     def model_func(model, batch_dict):
-        load_data_to_gpu(batch_dict)
+        load_data_to_gpu(batch_dict)  # no-op for the batches already moved by DataPrefetcher
         ret_dict, tb_dict, disp_dict = model(batch_dict)
 
         loss = ret_dict['loss'].mean()
@@ -13,25 +13,20 @@ class PointPillarScatter(nn.Module):
 
     def forward(self, batch_dict, **kwargs):
         pillar_features, coords = batch_dict['pillar_features'], batch_dict['voxel_coords']
-        batch_spatial_features = []
-        batch_size = coords[:, 0].max().int().item() + 1
-        for batch_idx in range(batch_size):
-            spatial_feature = torch.zeros(
-                self.num_bev_features,
-                self.nz * self.nx * self.ny,
-                dtype=pillar_features.dtype,
-                device=pillar_features.device)
+        if 'batch_size' in batch_dict:
+            batch_size = batch_dict['batch_size']
+        else:
+            batch_size = coords[:, 0].max().int().item() + 1
 
-            batch_mask = coords[:, 0] == batch_idx
-            this_coords = coords[batch_mask, :]
-            indices = this_coords[:, 1] + this_coords[:, 2] * self.nx + this_coords[:, 3]
-            indices = indices.type(torch.long)
-            pillars = pillar_features[batch_mask, :]
-            pillars = pillars.t()
-            spatial_feature[:, indices] = pillars
-            batch_spatial_features.append(spatial_feature)
+        # a new tensor per call, the spatial_features of a previous batch may still be in use
+        batch_spatial_features = torch.zeros(
+            batch_size, self.num_bev_features, self.nz * self.ny * self.nx,
+            dtype=pillar_features.dtype, device=pillar_features.device
+        )
+        coords = coords.long()
+        indices = coords[:, 1] + coords[:, 2] * self.nx + coords[:, 3]
+        batch_spatial_features[coords[:, 0], :, indices] = pillar_features
 
-        batch_spatial_features = torch.stack(batch_spatial_features, 0)
         batch_spatial_features = batch_spatial_features.view(batch_size, self.num_bev_features * self.nz, self.ny, self.nx)
         batch_dict['spatial_features'] = batch_spatial_features
         return batch_dict
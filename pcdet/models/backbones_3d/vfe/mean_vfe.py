@@ -22,10 +22,38 @@ class MeanVFE(VFETemplate):
         Returns:
             vfe_features: (num_voxels, C)
         """
+        if 'point_voxel_ids' in batch_dict:
+            return self.dynamic_forward(batch_dict)
+
         voxel_features, voxel_num_points = batch_dict['voxels'], batch_dict['voxel_num_points']
         points_mean = voxel_features[:, :, :].sum(dim=1, keepdim=False)
-        normalizer = torch.clamp_min(voxel_num_points.view(-1, 1), min=1.0).type_as(voxel_features)
+        normalizer = torch.clamp_min(voxel_num_points.view(-1, 1), min=1).type_as(voxel_features)
         points_mean = points_mean / normalizer
         batch_dict['voxel_features'] = points_mean.contiguous()
 
         return batch_dict
+
+    def dynamic_forward(self, batch_dict):
+        """
+        Args:
+            batch_dict:
+                points: (N, 1 + C) [bs_idx, x, y, z, ...]
+                point_voxel_ids: (N), -1 for the points not in any voxel
+                voxel_coords: (num_voxels, 4)
+
+        Returns:
+            vfe_features: (num_voxels, C)
+        """
+        points, point_voxel_ids = batch_dict['points'], batch_dict['point_voxel_ids'].long()
+        num_voxels = batch_dict['voxel_coords'].shape[0]
+        kept_mask = point_voxel_ids >= 0
+        point_features, point_voxel_ids = points[kept_mask, 1:], point_voxel_ids[kept_mask]
+
+        points_sum = point_features.new_zeros((num_voxels, point_features.shape[1]))
+        points_sum.index_add_(0, point_voxel_ids, point_features)
+        voxel_num_points = point_features.new_zeros(num_voxels)
+        voxel_num_points.index_add_(0, point_voxel_ids, point_features.new_ones(point_voxel_ids.shape[0]))
+        points_mean = points_sum / torch.clamp_min(voxel_num_points.view(-1, 1), min=1.0)
+        batch_dict['voxel_features'] = points_mean.contiguous()
+
+        return batch_dict
@@ -2,6 +2,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+from ....utils import common_utils
 from .vfe_template import VFETemplate
 
 
@@ -26,7 +27,7 @@ class PFNLayer(nn.Module):
 
         self.part = 50000
 
-    def forward(self, inputs):
+    def linear_forward(self, inputs):
         if inputs.shape[0] > self.part:
             # nn.Linear performs randomly when batch size is too large
             num_parts = inputs.shape[0] // self.part
@@ -35,6 +36,32 @@ class PFNLayer(nn.Module):
             x = torch.cat(part_linear_out, dim=0)
         else:
             x = self.linear(inputs)
+        return x
+
+    def dynamic_forward(self, inputs, point_voxel_ids, num_voxels):
+        """
+        Args:
+            inputs: (N, C_in) features of the points
+            point_voxel_ids: (N), voxel index of each point
+            num_voxels:
+
+        Returns:
+            (num_voxels, C_out) for the last layer, otherwise (N, C_out) per-point features
+        """
+        x = self.linear_forward(inputs)
+        torch.backends.cudnn.enabled = False
+        x = self.norm(x) if self.use_norm else x
+        torch.backends.cudnn.enabled = True
+        x = F.relu(x)
+        x_max = common_utils.scatter_reduce(x, point_voxel_ids, num_voxels, reduce='amax')
+
+        if self.last_vfe:
+            return x_max
+        else:
+            return torch.cat([x, x_max[point_voxel_ids]], dim=1)
+
+    def forward(self, inputs):
+        x = self.linear_forward(inputs)
         torch.backends.cudnn.enabled = False
         x = self.norm(x.permute(0, 2, 1)).permute(0, 2, 1) if self.use_norm else x
         torch.backends.cudnn.enabled = True
@@ -91,8 +118,59 @@ class PillarVFE(VFETemplate):
         paddings_indicator = actual_num.int() > max_num
         return paddings_indicator
 
+    def dynamic_forward(self, batch_dict):
+        """
+        Scatter-based PillarVFE over the raw points of dynamic voxelization, without any padded voxels
+        Args:
+            batch_dict:
+                points: (N, 1 + C) [bs_idx, x, y, z, ...]
+                point_voxel_ids: (N), -1 for the points not in any pillar
+                voxel_coords: (num_voxels, 4) [bs_idx, z_idx, y_idx, x_idx]
+
+        Returns:
+            batch_dict:
+                pillar_features: (num_voxels, C)
+        """
+        points, point_voxel_ids, coords = batch_dict['points'], batch_dict['point_voxel_ids'].long(), batch_dict['voxel_coords']
+        num_voxels = coords.shape[0]
+        kept_mask = point_voxel_ids >= 0
+        point_features, point_voxel_ids = points[kept_mask, 1:], point_voxel_ids[kept_mask]
+        point_xyz = point_features[:, :3]
+
+        points_sum = point_xyz.new_zeros((num_voxels, 3)).index_add_(0, point_voxel_ids, point_xyz)
+        voxel_num_points = point_xyz.new_zeros(num_voxels).index_add_(
+            0, point_voxel_ids, point_xyz.new_ones(point_voxel_ids.shape[0])
+        )
+        points_mean = points_sum / torch.clamp_min(voxel_num_points.view(-1, 1), min=1.0)
+        f_cluster = point_xyz - points_mean[point_voxel_ids]
+
+        coords = coords.to(point_xyz.dtype)
+        voxel_centers = torch.stack((
+            coords[:, 3] * self.voxel_x + self.x_offset,
+            coords[:, 2] * self.voxel_y + self.y_offset,
+            coords[:, 1] * self.voxel_z + self.z_offset
+        ), dim=1)
+        f_center = point_xyz - voxel_centers[point_voxel_ids]
+
+        if self.use_absolute_xyz:
+            features = [point_features, f_cluster, f_center]
+        else:
+            features = [point_features[:, 3:], f_cluster, f_center]
+
+        if self.with_distance:
+            points_dist = torch.norm(point_xyz, 2, 1, keepdim=True)
+            features.append(points_dist)
+        features = torch.cat(features, dim=-1)
+
+        for pfn in self.pfn_layers:
+            features = pfn.dynamic_forward(features, point_voxel_ids, num_voxels)
+        batch_dict['pillar_features'] = features
+        return batch_dict
+
     def forward(self, batch_dict, **kwargs):
-  
+        if 'point_voxel_ids' in batch_dict:
+            return self.dynamic_forward(batch_dict)
+
         voxel_features, voxel_num_points, coords = batch_dict['voxels'], batch_dict['voxel_num_points'], batch_dict['voxel_coords']
         points_mean = voxel_features[:, :, :3].sum(dim=1, keepdim=True) / voxel_num_points.type_as(voxel_features).view(-1, 1, 1)
         f_cluster = voxel_features[:, :, :3] - points_mean
@@ -1,3 +1,7 @@
+import hashlib
+import json
+from pathlib import Path
+
 import numpy as np
 import torch
 import torch.nn as nn
@@ -26,30 +30,78 @@ class AnchorHeadTemplate(nn.Module):
         anchor_generator_cfg = self.model_cfg.ANCHOR_GENERATOR_CONFIG
         anchors, self.num_anchors_per_location = self.generate_anchors(
             anchor_generator_cfg, grid_size=grid_size, point_cloud_range=point_cloud_range,
-            anchor_ndim=self.box_coder.code_size
+            anchor_ndim=self.box_coder.code_size, cache_dir=self.model_cfg.get('ANCHOR_CACHE_DIR', None)
         )
-        self.anchors = [x.cuda() for x in anchors]
+        self.anchors = anchors  # moved together with the module by _apply, like buffers
         self.target_assigner = self.get_target_assigner(anchor_target_cfg)
 
         self.forward_ret_dict = {}
         self.build_losses(self.model_cfg.LOSS_CONFIG)
 
+    _anchor_cache = {}
+
     @staticmethod
-    def generate_anchors(anchor_generator_cfg, grid_size, point_cloud_range, anchor_ndim=7):
-        anchor_generator = AnchorGenerator(
-            anchor_range=point_cloud_range,
-            anchor_generator_config=anchor_generator_cfg
+    def get_anchor_cache_key(anchor_generator_cfg, grid_size, point_cloud_range, anchor_ndim):
+        key_dict = {
+            'anchor_generator_cfg': anchor_generator_cfg,
+            'grid_size': np.asarray(grid_size).tolist(),
+            'point_cloud_range': np.asarray(point_cloud_range).tolist(),
+            'anchor_ndim': anchor_ndim
+        }
+        key_str = json.dumps(key_dict, sort_keys=True, default=str)
+        return hashlib.md5(key_str.encode()).hexdigest()
+
+    @staticmethod
+    def generate_anchors(anchor_generator_cfg, grid_size, point_cloud_range, anchor_ndim=7, cache_dir=None):
+        """
+        Anchors are generated on cpu and cached in-process (and in cache_dir if given) by the hash of the anchor
+        config, grid size and range, so that rebuilding the same model does not generate them again.
+        Args:
+            anchor_generator_cfg:
+            grid_size: (3), [grid_x, grid_y, grid_z]
+            point_cloud_range: (6)
+            anchor_ndim:
+            cache_dir: optional directory of the on-disk anchor cache
+
+        Returns:
+            anchors_list: list of (z, y, x, num_size, num_rot, anchor_ndim)
+            num_anchors_per_location_list: list of int
+        """
+        cache_key = AnchorHeadTemplate.get_anchor_cache_key(
+            anchor_generator_cfg, grid_size, point_cloud_range, anchor_ndim
         )
-        feature_map_size = [grid_size[:2] // config['feature_map_stride'] for config in anchor_generator_cfg]
-        anchors_list, num_anchors_per_location_list = anchor_generator.generate_anchors(feature_map_size)
+        cache_file = Path(cache_dir) / ('anchors_%s.pth' % cache_key) if cache_dir is not None else None
+        if cache_key not in AnchorHeadTemplate._anchor_cache and cache_file is not None and cache_file.exists():
+            cached = torch.load(str(cache_file), map_location='cpu')
+            AnchorHeadTemplate._anchor_cache[cache_key] = (cached['anchors'], cached['num_anchors_per_location'])
+
+        if cache_key not in AnchorHeadTemplate._anchor_cache:
+            anchor_generator = AnchorGenerator(
+                anchor_range=point_cloud_range,
+                anchor_generator_config=anchor_generator_cfg
+            )
+            feature_map_size = [grid_size[:2] // config['feature_map_stride'] for config in anchor_generator_cfg]
+            anchors_list, num_anchors_per_location_list = anchor_generator.generate_anchors(feature_map_size)
 
-        if anchor_ndim != 7:
-            for idx, anchors in enumerate(anchors_list):
-                pad_zeros = anchors.new_zeros([*anchors.shape[0:-1], anchor_ndim - 7])
-                new_anchors = torch.cat((anchors, pad_zeros), dim=-1)
-                anchors_list[idx] = new_anchors
+            if anchor_ndim != 7:
+                for idx, anchors in enumerate(anchors_list):
+                    pad_zeros = anchors.new_zeros([*anchors.shape[0:-1], anchor_ndim - 7])
+                    new_anchors = torch.cat((anchors, pad_zeros), dim=-1)
+                    anchors_list[idx] = new_anchors
 
-        return anchors_list, num_anchors_per_location_list
+            AnchorHeadTemplate._anchor_cache[cache_key] = (anchors_list, num_anchors_per_location_list)
+            if cache_file is not None:
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                torch.save({'anchors': anchors_list, 'num_anchors_per_location': num_anchors_per_location_list},
+                           str(cache_file))
+
+        anchors_list, num_anchors_per_location_list = AnchorHeadTemplate._anchor_cache[cache_key]
+        return [anchors.clone() for anchors in anchors_list], list(num_anchors_per_location_list)
+
+    def _apply(self, fn, *args, **kwargs):
+        super()._apply(fn, *args, **kwargs)
+        self.anchors = [fn(anchors) for anchors in self.anchors]
+        return self
 
     def get_target_assigner(self, anchor_target_cfg):
         if anchor_target_cfg.NAME == 'ATSS':
@@ -57,7 +109,8 @@ class AnchorHeadTemplate(nn.Module):
                 topk=anchor_target_cfg.TOPK,
                 box_coder=self.box_coder,
                 use_multihead=self.use_multihead,
-                match_height=anchor_target_cfg.MATCH_HEIGHT
+                match_height=anchor_target_cfg.MATCH_HEIGHT,
+                sparse_iou=anchor_target_cfg.get('SPARSE_IOU', False)
             )
         elif anchor_target_cfg.NAME == 'AxisAlignedTargetAssigner':
             target_assigner = AxisAlignedTargetAssigner(
@@ -15,6 +15,13 @@ class PointHeadTemplate(nn.Module):
         self.build_losses(self.model_cfg.LOSS_CONFIG)
         self.forward_ret_dict = None
 
+    def _apply(self, fn, *args, **kwargs):
+        super()._apply(fn, *args, **kwargs)
+        box_coder = getattr(self, 'box_coder', None)
+        if getattr(box_coder, 'mean_size', None) is not None:
+            box_coder.mean_size = fn(box_coder.mean_size)
+        return self
+
     def build_losses(self, losses_cfg):
         self.add_module(
             'cls_loss_func',
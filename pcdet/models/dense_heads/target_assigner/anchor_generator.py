@@ -14,7 +14,16 @@ class AnchorGenerator(object):
         assert len(self.anchor_sizes) == len(self.anchor_rotations) == len(self.anchor_heights)
         self.num_of_anchor_sets = len(self.anchor_sizes)
 
-    def generate_anchors(self, grid_sizes):
+    def generate_anchors(self, grid_sizes, device=None):
+        """
+        Args:
+            grid_sizes: list of [grid_x, grid_y] for each anchor set
+            device: device of the generated anchors, cpu by default
+
+        Returns:
+            all_anchors: list of (z, y, x, num_size, num_rot, 7)
+            num_anchors_per_location: list of int
+        """
         assert len(grid_sizes) == self.num_of_anchor_sets
         all_anchors = []
         num_anchors_per_location = []
@@ -33,10 +42,12 @@ class AnchorGenerator(object):
 
             x_shifts = torch.arange(
                 self.anchor_range[0] + x_offset, self.anchor_range[3] + 1e-5, step=x_stride, dtype=torch.float32,
-            ).cuda()
+                device=device
+            )
             y_shifts = torch.arange(
                 self.anchor_range[1] + y_offset, self.anchor_range[4] + 1e-5, step=y_stride, dtype=torch.float32,
-            ).cuda()
+                device=device
+            )
             z_shifts = x_shifts.new_tensor(anchor_height)
 
             num_anchor_size, num_anchor_rotation = anchor_size.__len__(), anchor_rotation.__len__()
@@ -45,13 +56,13 @@ class AnchorGenerator(object):
             x_shifts, y_shifts, z_shifts = torch.meshgrid([
                 x_shifts, y_shifts, z_shifts
             ])  # [x_grid, y_grid, z_grid]
-            anchors = torch.stack((x_shifts, y_shifts, z_shifts), dim=-1)  # [x, y, z, 3]
-            anchors = anchors[:, :, :, None, :].repeat(1, 1, 1, anchor_size.shape[0], 1)
-            anchor_size = anchor_size.view(1, 1, 1, -1, 3).repeat([*anchors.shape[0:3], 1, 1])
-            anchors = torch.cat((anchors, anchor_size), dim=-1)
-            anchors = anchors[:, :, :, :, None, :].repeat(1, 1, 1, 1, num_anchor_rotation, 1)
-            anchor_rotation = anchor_rotation.view(1, 1, 1, 1, -1, 1).repeat([*anchors.shape[0:3], num_anchor_size, 1, 1])
-            anchors = torch.cat((anchors, anchor_rotation), dim=-1)  # [x, y, z, num_size, num_rot, 7]
+            centers = torch.stack((x_shifts, y_shifts, z_shifts), dim=-1)  # [x, y, z, 3]
+            out_shape = [*centers.shape[0:3], num_anchor_size, num_anchor_rotation]
+            anchors = torch.cat((
+                centers[:, :, :, None, None, :].expand(*out_shape, 3),
+                anchor_size.view(1, 1, 1, -1, 1, 3).expand(*out_shape, 3),
+                anchor_rotation.view(1, 1, 1, 1, -1, 1).expand(*out_shape, 1)
+            ), dim=-1)  # [x, y, z, num_size, num_rot, 7]
 
             anchors = anchors.permute(2, 1, 0, 3, 4, 5).contiguous()
             #anchors = anchors.view(-1, anchors.shape[-1])
@@ -1,19 +1,21 @@
 import torch
 
 from ....ops.iou3d_nms import iou3d_nms_utils
-from ....utils import common_utils
+from ....utils import box_utils, common_utils
 
 
 class ATSSTargetAssigner(object):
     """
     Reference: https://arxiv.org/abs/1912.02424
     """
-    def __init__(self, topk, box_coder, match_height=False):
+    def __init__(self, topk, box_coder, match_height=False, use_multihead=False, sparse_iou=False):
         self.topk = topk
         self.box_coder = box_coder
         self.match_height = match_height
+        self.use_multihead = use_multihead
+        self.sparse_iou = sparse_iou
 
-    def assign_targets(self, anchors_list, gt_boxes_with_classes, use_multihead=False):
+    def assign_targets(self, anchors_list, gt_boxes_with_classes, use_multihead=None):
         """
         Args:
             anchors: [(N, 7), ...]
@@ -21,6 +23,8 @@ class ATSSTargetAssigner(object):
         Returns:
 
         """
+        if use_multihead is None:
+            use_multihead = self.use_multihead
         if not isinstance(anchors_list, list):
             anchors_list = [anchors_list]
             single_set_of_anchor = True
@@ -72,14 +76,42 @@ class ATSSTargetAssigner(object):
             }
         return ret_dict
 
-    def assign_targets_single(self, anchors, gt_boxes, gt_classes):
+    def get_candidate_anchor_idxs(self, anchors, gt_boxes):
         """
+        Anchors that can overlap the gt_boxes or be in their topk nearest anchors, found with a BEV grid of the anchor
+        centers: an anchor is a candidate if its center is inside the circumscribed square of a gt box enlarged by
+        the largest anchor half diagonal, and the candidates are only used if the topk nearest candidates of each
+        gt box are closer than this enlarged distance, so that no anchor outside could be one of them.
         Args:
             anchors: (N, 7) [x, y, z, dx, dy, dz, heading]
             gt_boxes: (M, 7) [x, y, z, dx, dy, dz, heading]
-            gt_classes: (M)
         Returns:
-
+            candidate_idxs: (K) sorted anchor indices, or None if the dense assignment is needed
+        """
+        gt_half_diagonal = gt_boxes[:, 3:5].norm(dim=-1) / 2
+        margin = anchors[:, 3:5].norm(dim=-1).max() / 2
+        gt_bev_squares = torch.cat((
+            gt_boxes[:, 0:2] - gt_half_diagonal[:, None], gt_boxes[:, 0:2] + gt_half_diagonal[:, None]
+        ), dim=-1)
+        anchor_idxs, _ = box_utils.bev_grid_candidate_pairs(anchors[:, 0:2], gt_bev_squares, margin)
+        candidate_idxs = torch.unique(anchor_idxs)
+        if candidate_idxs.shape[0] < self.topk:
+            return None
+
+        distance = (anchors[candidate_idxs, None, 0:3] - gt_boxes[None, :, 0:3]).norm(dim=-1)  # (K, M)
+        topk_distance = distance.topk(self.topk, dim=0, largest=False)[0][-1]
+        if not (topk_distance < gt_half_diagonal + margin).all():
+            return None
+        return candidate_idxs
+
+    def match_anchors(self, anchors, gt_boxes):
+        """
+        Args:
+            anchors: (N, 7) [x, y, z, dx, dy, dz, heading]
+            gt_boxes: (M, 7) [x, y, z, dx, dy, dz, heading]
+        Returns:
+            anchors_to_gt_values: (N), -0x7FFFFFFF for the negative anchors
+            anchors_to_gt_indexs: (N)
         """
         num_anchor = anchors.shape[0]
         num_gt = gt_boxes.shape[0]
@@ -126,6 +158,31 @@ class ATSSTargetAssigner(object):
         max_iou_of_each_gt, argmax_iou_of_each_gt = ious.max(dim=0)
         anchors_to_gt_indexs[argmax_iou_of_each_gt] = torch.arange(0, num_gt, device=ious.device)
         anchors_to_gt_values[argmax_iou_of_each_gt] = max_iou_of_each_gt
+        return anchors_to_gt_values, anchors_to_gt_indexs
+
+    def assign_targets_single(self, anchors, gt_boxes, gt_classes):
+        """
+        Args:
+            anchors: (N, 7) [x, y, z, dx, dy, dz, heading]
+            gt_boxes: (M, 7) [x, y, z, dx, dy, dz, heading]
+            gt_classes: (M)
+        Returns:
+
+        """
+        num_anchor = anchors.shape[0]
+        INF = -0x7FFFFFFF
+
+        candidate_idxs = self.get_candidate_anchor_idxs(anchors, gt_boxes) \
+            if self.sparse_iou and gt_boxes.shape[0] > 0 else None
+        if candidate_idxs is not None:
+            # the IoU of the other anchors with all gt boxes is zero
+            candidate_values, candidate_indexs = self.match_anchors(anchors[candidate_idxs], gt_boxes)
+            anchors_to_gt_values = anchors.new_full((num_anchor, ), INF)
+            anchors_to_gt_indexs = candidate_indexs.new_zeros(num_anchor)
+            anchors_to_gt_values[candidate_idxs] = candidate_values
+            anchors_to_gt_indexs[candidate_idxs] = candidate_indexs
+        else:
+            anchors_to_gt_values, anchors_to_gt_indexs = self.match_anchors(anchors, gt_boxes)
 
         cls_labels = gt_classes[anchors_to_gt_indexs]
         cls_labels[anchors_to_gt_values == INF] = 0
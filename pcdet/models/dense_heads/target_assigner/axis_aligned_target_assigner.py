@@ -2,7 +2,7 @@ import numpy as np
 import torch
 
 from ....ops.iou3d_nms import iou3d_nms_utils
-from ....utils import box_utils
+from ....utils import box_utils, common_utils
 
 
 class AxisAlignedTargetAssigner(object):
@@ -33,6 +33,23 @@ class AxisAlignedTargetAssigner(object):
                 for idx, name in enumerate(rpn_head_cfg['HEAD_CLS_NAME']):
                     self.gt_remapping[name] = idx + 1
 
+        # per anchor set lookup tables of the batched assignment
+        self.batched_assignment = anchor_target_cfg.get('BATCHED_ASSIGNMENT', True)
+        self.sparse_iou = anchor_target_cfg.get('SPARSE_IOU', False)
+        self.set_class_table = torch.from_numpy(np.array([
+            [False] + [name == class_name for class_name in self.class_names] for name in self.anchor_class_names
+        ], dtype=np.bool_))
+        self.set_matched_thresholds = torch.tensor(
+            [self.matched_thresholds[name] for name in self.anchor_class_names], dtype=torch.float32
+        )
+        self.set_unmatched_thresholds = torch.tensor(
+            [self.unmatched_thresholds[name] for name in self.anchor_class_names], dtype=torch.float32
+        )
+        if self.seperate_multihead:
+            self.set_remapped_labels = torch.tensor(
+                [self.gt_remapping[name] for name in self.anchor_class_names], dtype=torch.int32
+            )
+
     def assign_targets(self, all_anchors, gt_boxes_with_classes):
         """
         Args:
@@ -41,6 +58,8 @@ class AxisAlignedTargetAssigner(object):
         Returns:
 
         """
+        if self.batched_assignment and self.pos_fraction is None:
+            return self.assign_targets_batch(all_anchors, gt_boxes_with_classes)
 
         bbox_targets = []
         cls_labels = []
@@ -128,6 +147,165 @@ class AxisAlignedTargetAssigner(object):
         }
         return all_targets_dict
 
+    def assign_targets_batch(self, all_anchors, gt_boxes_with_classes):
+        """
+        Same targets as assign_targets_single without sampling (pos_fraction is None), but all samples and anchor
+        classes are assigned at once on the device of the anchors: the IoU of all anchors with the padded GTs of the
+        batch is computed in one call and the pairs of different classes or padded GTs are masked out.
+        Args:
+            all_anchors: [(N, 7), ...]
+            gt_boxes_with_classes: (B, M, 8)
+        Returns:
+
+        """
+        batch_size = gt_boxes_with_classes.shape[0]
+        if gt_boxes_with_classes.shape[1] == 0:
+            gt_boxes_with_classes = gt_boxes_with_classes.new_zeros((batch_size, 1, gt_boxes_with_classes.shape[2]))
+        max_gt = gt_boxes_with_classes.shape[1]
+        device = gt_boxes_with_classes.device
+        gt_classes = gt_boxes_with_classes[:, :, -1].long()
+        gt_boxes = gt_boxes_with_classes[:, :, :-1]
+
+        # only the trailing all-zero boxes are padding
+        nonempty_gt = (gt_boxes.sum(dim=-1) != 0).long()
+        num_gt = (nonempty_gt * torch.arange(1, max_gt + 1, device=device)).max(dim=1)[0]
+        valid_gt = torch.arange(max_gt, device=device)[None, :] < num_gt[:, None]
+
+        anchors_list = []
+        for anchors in all_anchors:
+            if self.use_multihead:
+                anchors = anchors.permute(3, 4, 0, 1, 2, 5).contiguous().view(-1, anchors.shape[-1])
+            else:
+                feature_map_size = anchors.shape[:3]
+                anchors = anchors.view(-1, anchors.shape[-1])
+            anchors_list.append(anchors)
+        num_anchors_per_set = [anchors.shape[0] for anchors in anchors_list]
+        anchors = torch.cat(anchors_list, dim=0)
+        num_anchors = anchors.shape[0]
+        anchor_set_ids = torch.cat([
+            torch.full((num, ), idx, dtype=torch.long, device=device) for idx, num in enumerate(num_anchors_per_set)
+        ])
+
+        if self.sparse_iou and not self.match_height:
+            anchor_to_gt_max, anchor_to_gt_argmax, anchors_with_max_overlap = self.get_sparse_batch_matches(
+                anchors, anchor_set_ids, gt_boxes, gt_classes, valid_gt
+            )
+        else:
+            anchor_to_gt_max, anchor_to_gt_argmax, anchors_with_max_overlap = self.get_dense_batch_matches(
+                anchors, anchor_set_ids, gt_boxes, gt_classes, valid_gt
+            )
+
+        if self.seperate_multihead:
+            matched_labels = self.set_remapped_labels.to(device)[anchor_set_ids][None, :].expand(batch_size, -1)
+        else:
+            matched_labels = gt_classes.gather(1, anchor_to_gt_argmax).int()
+        pos_mask = anchor_to_gt_max >= self.set_matched_thresholds.to(device)[anchor_set_ids]
+        bg_mask = anchor_to_gt_max < self.set_unmatched_thresholds.to(device)[anchor_set_ids]
+
+        labels = torch.full((batch_size, num_anchors), -1, dtype=torch.int32, device=device)
+        labels = torch.where(pos_mask, matched_labels, labels)
+        labels = torch.where(bg_mask, torch.zeros_like(labels), labels)
+        labels = torch.where(anchors_with_max_overlap, matched_labels, labels)
+        fg_mask = labels > 0
+
+        matched_gt_boxes = gt_boxes.gather(1, anchor_to_gt_argmax[:, :, None].expand(-1, -1, gt_boxes.shape[-1]))
+        bbox_targets = self.box_coder.encode_torch(
+            matched_gt_boxes.reshape(-1, gt_boxes.shape[-1]),
+            anchors[None, :, :].expand(batch_size, -1, -1).reshape(-1, anchors.shape[-1])
+        ).view(batch_size, num_anchors, -1)
+        bbox_targets = torch.where(fg_mask[:, :, None], bbox_targets, torch.zeros_like(bbox_targets))
+
+        if self.norm_by_num_examples:
+            set_ids = anchor_set_ids[None, :].expand(batch_size, -1)
+            num_examples = anchors.new_zeros((batch_size, len(num_anchors_per_set))).scatter_add_(
+                1, set_ids, (labels >= 0).float()
+            ).clamp_min(1.0)
+            reg_weights = fg_mask.float() / num_examples.gather(1, set_ids)
+        else:
+            reg_weights = fg_mask.float()
+
+        if not self.use_multihead:
+            # interleave the anchor sets per location as in assign_targets
+            labels = torch.cat([
+                x.reshape(batch_size, *feature_map_size, -1) for x in labels.split(num_anchors_per_set, dim=1)
+            ], dim=-1).view(batch_size, -1)
+            reg_weights = torch.cat([
+                x.reshape(batch_size, *feature_map_size, -1) for x in reg_weights.split(num_anchors_per_set, dim=1)
+            ], dim=-1).view(batch_size, -1)
+            bbox_targets = torch.cat([
+                x.reshape(batch_size, *feature_map_size, -1, self.box_coder.code_size)
+                for x in bbox_targets.split(num_anchors_per_set, dim=1)
+            ], dim=-2).view(batch_size, -1, self.box_coder.code_size)
+
+        all_targets_dict = {
+            'box_cls_labels': labels,
+            'box_reg_targets': bbox_targets,
+            'reg_weights': reg_weights
+        }
+        return all_targets_dict
+
+    def get_dense_batch_matches(self, anchors, anchor_set_ids, gt_boxes, gt_classes, valid_gt):
+        """
+        Args:
+            anchors: (N, 7 + C)
+            anchor_set_ids: (N)
+            gt_boxes: (B, M, 7 + C)
+            gt_classes: (B, M)
+            valid_gt: (B, M)
+        Returns:
+            anchor_to_gt_max: (B, N)
+            anchor_to_gt_argmax: (B, N)
+            anchors_with_max_overlap: (B, N)
+        """
+        batch_size, max_gt = gt_boxes.shape[0:2]
+        gt_boxes_flat = gt_boxes.view(-1, gt_boxes.shape[-1])
+        anchor_by_gt_overlap = iou3d_nms_utils.boxes_iou3d_gpu(anchors[:, 0:7], gt_boxes_flat[:, 0:7]) \
+            if self.match_height else box_utils.boxes3d_nearest_bev_iou(anchors[:, 0:7], gt_boxes_flat[:, 0:7])
+        anchor_by_gt_overlap = anchor_by_gt_overlap.view(anchors.shape[0], batch_size, max_gt).permute(1, 0, 2)
+
+        set_class_table = self.set_class_table.to(anchors.device)
+        pair_mask = set_class_table[anchor_set_ids[None, :, None], gt_classes[:, None, :]] & valid_gt[:, None, :]
+        anchor_by_gt_overlap = anchor_by_gt_overlap.masked_fill(~pair_mask, 0)  # (B, N, M)
+
+        anchor_to_gt_max, anchor_to_gt_argmax = anchor_by_gt_overlap.max(dim=2)
+        gt_to_anchor_max = anchor_by_gt_overlap.max(dim=1)[0]
+        gt_to_anchor_max = gt_to_anchor_max.masked_fill(gt_to_anchor_max == 0, -1)
+        anchors_with_max_overlap = (anchor_by_gt_overlap == gt_to_anchor_max[:, None, :]).any(dim=2)
+        return anchor_to_gt_max, anchor_to_gt_argmax, anchors_with_max_overlap
+
+    def get_sparse_batch_matches(self, anchors, anchor_set_ids, gt_boxes, gt_classes, valid_gt):
+        """
+        Same outputs as get_dense_batch_matches, but only the overlapping (anchor, gt) pairs found with the BEV grid of
+        box_utils.boxes3d_nearest_bev_iou_sparse are kept, instead of the dense (B, N, M) IoU matrix.
+        """
+        batch_size, max_gt = gt_boxes.shape[0:2]
+        num_anchors = anchors.shape[0]
+        gt_boxes_flat = gt_boxes.view(-1, gt_boxes.shape[-1])
+        anchor_idxs, gt_flat_idxs, ious = box_utils.boxes3d_nearest_bev_iou_sparse(
+            anchors[:, 0:7], gt_boxes_flat[:, 0:7]
+        )
+
+        set_class_table = self.set_class_table.to(anchors.device)
+        keep = set_class_table[anchor_set_ids[anchor_idxs], gt_classes.view(-1)[gt_flat_idxs]] & \
+            valid_gt.view(-1)[gt_flat_idxs]
+        anchor_idxs, gt_flat_idxs, ious = anchor_idxs[keep], gt_flat_idxs[keep], ious[keep]
+        gt_idxs = gt_flat_idxs % max_gt
+        anchor_keys = gt_flat_idxs // max_gt * num_anchors + anchor_idxs
+
+        anchor_to_gt_max = common_utils.scatter_reduce(ious, anchor_keys, batch_size * num_anchors, reduce='amax')
+        # the first gt with the max IoU, as numpy argmax
+        is_anchor_max = ious == anchor_to_gt_max[anchor_keys]
+        anchor_to_gt_argmax = common_utils.scatter_reduce(
+            gt_idxs[is_anchor_max], anchor_keys[is_anchor_max], batch_size * num_anchors, reduce='amin'
+        )
+
+        gt_to_anchor_max = common_utils.scatter_reduce(ious, gt_flat_idxs, batch_size * max_gt, reduce='amax')
+        anchors_with_max_overlap = anchor_keys.new_zeros(batch_size * num_anchors, dtype=torch.bool)
+        anchors_with_max_overlap[anchor_keys[ious == gt_to_anchor_max[gt_flat_idxs]]] = True
+
+        return anchor_to_gt_max.view(batch_size, num_anchors), anchor_to_gt_argmax.view(batch_size, num_anchors), \
+            anchors_with_max_overlap.view(batch_size, num_anchors)
+
     def assign_targets_single(self, anchors,
                          gt_boxes,
                          gt_classes,
@@ -145,12 +323,12 @@ class AxisAlignedTargetAssigner(object):
             anchor_by_gt_overlap = iou3d_nms_utils.boxes_iou3d_gpu(anchors[:, 0:7], gt_boxes[:, 0:7]) \
                 if self.match_height else box_utils.boxes3d_nearest_bev_iou(anchors[:, 0:7], gt_boxes[:, 0:7])
 
-            anchor_to_gt_argmax = torch.from_numpy(anchor_by_gt_overlap.cpu().numpy().argmax(axis=1)).cuda()
+            anchor_to_gt_argmax = anchor_by_gt_overlap.argmax(dim=1)
             anchor_to_gt_max = anchor_by_gt_overlap[
                 torch.arange(num_anchors, device=anchors.device), anchor_to_gt_argmax
             ]
 
-            gt_to_anchor_argmax = torch.from_numpy(anchor_by_gt_overlap.cpu().numpy().argmax(axis=0)).cuda()
+            gt_to_anchor_argmax = anchor_by_gt_overlap.argmax(dim=0)
             gt_to_anchor_max = anchor_by_gt_overlap[gt_to_anchor_argmax, torch.arange(num_gt, device=anchors.device)]
             empty_gt_mask = gt_to_anchor_max == 0
             gt_to_anchor_max[empty_gt_mask] = -1
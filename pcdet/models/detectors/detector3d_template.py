@@ -186,6 +186,14 @@ class Detector3DTemplate(nn.Module):
         batch_size = batch_dict['batch_size']
         recall_dict = {}
         pred_dicts = []
+        # one NMS call for the whole batch pays off on the cuda kernel, the cpu NMS is faster per sample and class
+        batched_nms = post_process_cfg.NMS_CONFIG.MULTI_CLASSES_NMS and post_process_cfg.NMS_CONFIG.get(
+            'BATCHED_NMS', batch_dict['batch_box_preds'].is_cuda
+        )
+        if batched_nms:
+            batch_pred_scores, batch_pred_labels, batch_pred_boxes, batch_pred_index = \
+                self.batched_multi_classes_nms(batch_dict)
+
         for index in range(batch_size):
             if batch_dict.get('batch_index', None) is not None:
                 assert batch_dict['batch_box_preds'].shape.__len__() == 2
@@ -197,47 +205,22 @@ class Detector3DTemplate(nn.Module):
             box_preds = batch_dict['batch_box_preds'][batch_mask]
             src_box_preds = box_preds
 
-            if not isinstance(batch_dict['batch_cls_preds'], list):
+            if batched_nms:
+                cur_mask = batch_pred_index == index
+                final_scores = batch_pred_scores[cur_mask]
+                final_labels = batch_pred_labels[cur_mask]
+                final_boxes = batch_pred_boxes[cur_mask]
+            elif post_process_cfg.NMS_CONFIG.MULTI_CLASSES_NMS:
+                final_scores, final_labels, final_boxes = self.multi_classes_nms_of_sample(
+                    batch_dict, batch_mask, box_preds
+                )
+            else:
                 cls_preds = batch_dict['batch_cls_preds'][batch_mask]
-
                 src_cls_preds = cls_preds
                 assert cls_preds.shape[1] in [1, self.num_class]
-
                 if not batch_dict['cls_preds_normalized']:
                     cls_preds = torch.sigmoid(cls_preds)
-            else:
-                cls_preds = [x[batch_mask] for x in batch_dict['batch_cls_preds']]
-                src_cls_preds = cls_preds
-                if not batch_dict['cls_preds_normalized']:
-                    cls_preds = [torch.sigmoid(x) for x in cls_preds]
 
-            if post_process_cfg.NMS_CONFIG.MULTI_CLASSES_NMS:
-                if not isinstance(cls_preds, list):
-                    cls_preds = [cls_preds]
-                    multihead_label_mapping = [torch.arange(1, self.num_class, device=cls_preds[0].device)]
-                else:
-                    multihead_label_mapping = batch_dict['multihead_label_mapping']
-
-                cur_start_idx = 0
-                pred_scores, pred_labels, pred_boxes = [], [], []
-                for cur_cls_preds, cur_label_mapping in zip(cls_preds, multihead_label_mapping):
-                    assert cur_cls_preds.shape[1] == len(cur_label_mapping)
-                    cur_box_preds = box_preds[cur_start_idx: cur_start_idx + cur_cls_preds.shape[0]]
-                    cur_pred_scores, cur_pred_labels, cur_pred_boxes = model_nms_utils.multi_classes_nms(
-                        cls_scores=cur_cls_preds, box_preds=cur_box_preds,
-                        nms_config=post_process_cfg.NMS_CONFIG,
-                        score_thresh=post_process_cfg.SCORE_THRESH
-                    )
-                    cur_pred_labels = cur_label_mapping[cur_pred_labels]
-                    pred_scores.append(cur_pred_scores)
-                    pred_labels.append(cur_pred_labels)
-                    pred_boxes.append(cur_pred_boxes)
-                    cur_start_idx += cur_cls_preds.shape[0]
-
-                final_scores = torch.cat(pred_scores, dim=0)
-                final_labels = torch.cat(pred_labels, dim=0)
-                final_boxes = torch.cat(pred_boxes, dim=0)
-            else:
                 cls_preds, label_preds = torch.max(cls_preds, dim=-1)
                 if batch_dict.get('has_class_labels', False):
                     label_key = 'roi_labels' if 'roi_labels' in batch_dict else 'batch_pred_labels'
@@ -273,6 +256,97 @@ class Detector3DTemplate(nn.Module):
 
         return pred_dicts, recall_dict
 
+    def multi_classes_nms_of_sample(self, batch_dict, batch_mask, box_preds):
+        """
+        Multi-classes NMS of one sample, one NMS call per head and class
+        Args:
+            batch_dict: see post_processing
+            batch_mask: index or mask of the sample in batch_dict
+            box_preds: (num_boxes, 7 + C) boxes of the sample
+
+        Returns:
+            pred_scores: (K)
+            pred_labels: (K) 1 .. num_classes
+            pred_boxes: (K, 7 + C)
+        """
+        post_process_cfg = self.model_cfg.POST_PROCESSING
+        if not isinstance(batch_dict['batch_cls_preds'], list):
+            cls_preds = [batch_dict['batch_cls_preds'][batch_mask]]
+            multihead_label_mapping = [torch.arange(1, self.num_class + 1, device=box_preds.device)]
+        else:
+            cls_preds = [x[batch_mask] for x in batch_dict['batch_cls_preds']]
+            multihead_label_mapping = batch_dict['multihead_label_mapping']
+        if not batch_dict['cls_preds_normalized']:
+            cls_preds = [torch.sigmoid(x) for x in cls_preds]
+
+        cur_start_idx = 0
+        pred_scores, pred_labels, pred_boxes = [], [], []
+        for cur_cls_preds, cur_label_mapping in zip(cls_preds, multihead_label_mapping):
+            assert cur_cls_preds.shape[1] == len(cur_label_mapping)
+            cur_box_preds = box_preds[cur_start_idx: cur_start_idx + cur_cls_preds.shape[0]]
+            cur_pred_scores, cur_pred_labels, cur_pred_boxes = model_nms_utils.multi_classes_nms(
+                cls_scores=cur_cls_preds, box_preds=cur_box_preds,
+                nms_config=post_process_cfg.NMS_CONFIG,
+                score_thresh=post_process_cfg.SCORE_THRESH
+            )
+            pred_scores.append(cur_pred_scores)
+            pred_labels.append(cur_label_mapping[cur_pred_labels])
+            pred_boxes.append(cur_pred_boxes)
+            cur_start_idx += cur_cls_preds.shape[0]
+
+        return torch.cat(pred_scores, dim=0), torch.cat(pred_labels, dim=0), torch.cat(pred_boxes, dim=0)
+
+    def batched_multi_classes_nms(self, batch_dict):
+        """
+        Multi-classes NMS of all samples and heads with one NMS call
+        Args:
+            batch_dict: see post_processing
+
+        Returns:
+            batch_pred_scores: (K)
+            batch_pred_labels: (K) 1 .. num_classes
+            batch_pred_boxes: (K, 7 + C)
+            batch_pred_index: (K)
+        """
+        post_process_cfg = self.model_cfg.POST_PROCESSING
+        box_preds = batch_dict['batch_box_preds']
+        cls_preds = batch_dict['batch_cls_preds']
+        if not isinstance(cls_preds, list):
+            cls_preds = [cls_preds]
+            multihead_label_mapping = [torch.arange(1, self.num_class + 1, device=box_preds.device)]
+        else:
+            multihead_label_mapping = batch_dict['multihead_label_mapping']
+        cls_preds = [torch.sigmoid(x) for x in cls_preds] if not batch_dict['cls_preds_normalized'] \
+            else list(cls_preds)
+
+        if batch_dict.get('batch_index', None) is not None:
+            assert box_preds.shape.__len__() == 2 and len(cls_preds) == 1
+            batch_index = batch_dict['batch_index']
+            box_idxs = None
+        else:
+            assert box_preds.shape.__len__() == 3
+            batch_size, num_boxes = box_preds.shape[0:2]
+            batch_box_idxs = torch.arange(batch_size * num_boxes, device=box_preds.device).view(batch_size, num_boxes)
+            batch_index = torch.arange(batch_size, device=box_preds.device)[:, None].expand(-1, num_boxes).reshape(-1)
+            box_preds = box_preds.view(-1, box_preds.shape[-1])
+
+            # the boxes of each head are consecutive in every sample
+            cur_start_idx = 0
+            box_idxs = []
+            for idx, cur_cls_preds in enumerate(cls_preds):
+                assert cur_cls_preds.shape[-1] == len(multihead_label_mapping[idx])
+                num_head_boxes = cur_cls_preds.shape[1]
+                box_idxs.append(batch_box_idxs[:, cur_start_idx:cur_start_idx + num_head_boxes].reshape(-1))
+                cls_preds[idx] = cur_cls_preds.reshape(-1, cur_cls_preds.shape[-1])
+                cur_start_idx += num_head_boxes
+
+        pred_scores, pred_columns, pred_boxes, pred_batch_index = model_nms_utils.batched_multi_classes_nms(
+            cls_scores=cls_preds, box_preds=box_preds, batch_index=batch_index,
+            nms_config=post_process_cfg.NMS_CONFIG, score_thresh=post_process_cfg.SCORE_THRESH, box_idxs=box_idxs
+        )
+        pred_labels = torch.cat(multihead_label_mapping, dim=0)[pred_columns]
+        return pred_scores, pred_labels, pred_boxes, pred_batch_index
+
     @staticmethod
     def generate_recall_record(box_preds, recall_dict, batch_index, data_dict=None, thresh_list=None):
         if 'gt_boxes' not in data_dict:
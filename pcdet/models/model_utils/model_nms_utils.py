@@ -1,6 +1,9 @@
+import math
+
 import torch
 
 from ...ops.iou3d_nms import iou3d_nms_utils
+from ...utils import common_utils
 
 
 def class_agnostic_nms(box_scores, box_preds, nms_config, score_thresh=None):
@@ -44,6 +47,7 @@ def multi_classes_nms(cls_scores, box_preds, nms_config, score_thresh=None):
             cur_box_preds = box_preds[scores_mask]
         else:
             box_scores = cls_scores[:, k]
+            cur_box_preds = box_preds
 
         selected = []
         if box_scores.shape[0] > 0:
@@ -63,3 +67,118 @@ def multi_classes_nms(cls_scores, box_preds, nms_config, score_thresh=None):
     pred_boxes = torch.cat(pred_boxes, dim=0)
 
     return pred_scores, pred_labels, pred_boxes
+
+
+def get_rank_in_group(sorted_group_ids):
+    """
+    Args:
+        sorted_group_ids: (N) sorted group index of each element
+
+    Returns:
+        rank: (N) position of each element inside its group
+    """
+    _, counts = torch.unique_consecutive(sorted_group_ids, return_counts=True)
+    group_start = torch.cumsum(counts, dim=0) - counts
+    return torch.arange(sorted_group_ids.shape[0], device=sorted_group_ids.device) - \
+        group_start.repeat_interleave(counts)
+
+
+def grouped_nms(box_scores, box_preds, group_ids, nms_config):
+    """
+    NMS of independent groups of boxes (e.g. one group per sample and class) in one NMS call: the boxes of each group
+    are moved to their own BEV tile, so that boxes of different groups never overlap and the result equals running
+    the NMS of every group separately. NMS_PRE_MAXSIZE and NMS_POST_MAXSIZE are applied per group.
+    Args:
+        box_scores: (N)
+        box_preds: (N, 7 + C)
+        group_ids: (N)
+        nms_config:
+
+    Returns:
+        selected: (K) sorted by group, then by descending score
+    """
+    if box_scores.shape[0] == 0:
+        return group_ids.new_zeros(0)
+
+    # sort by group, then by descending score, with unique composite keys instead of a stable sort (torch>=1.9)
+    num_boxes = box_scores.shape[0]
+    order = box_scores.sort(descending=True)[1]
+    order = order[(group_ids[order] * num_boxes + torch.arange(num_boxes, device=order.device)).argsort()]
+    order = order[get_rank_in_group(group_ids[order]) < nms_config.NMS_PRE_MAXSIZE]
+
+    _, cur_groups = torch.unique(group_ids[order], return_inverse=True)
+    num_groups = cur_groups.max().item() + 1
+    num_tiles_per_row = int(math.ceil(math.sqrt(num_groups)))
+    boxes_for_nms = box_preds[order, 0:7].clone()
+
+    # each group is moved from its own xy extent to its tile in float64, the tiles are as large as the largest group
+    # extent plus the largest box, with a margin, so that the shifted boxes stay close to their true relative positions
+    centers = boxes_for_nms[:, 0:2].double()
+    group_min = common_utils.scatter_reduce(centers, cur_groups, num_groups, reduce='amin')
+    group_max = common_utils.scatter_reduce(centers, cur_groups, num_groups, reduce='amax')
+    box_radius = boxes_for_nms[:, 3:5].double().norm(dim=1).max().item() / 2
+    tile_size = (group_max - group_min).max().item() + 2 * box_radius + 1.0
+    tiles = torch.arange(num_groups, device=centers.device)
+    tile_offsets = torch.stack((tiles % num_tiles_per_row, tiles // num_tiles_per_row), dim=1).double() * tile_size
+    tile_offsets += box_radius - group_min
+    boxes_for_nms[:, 0:2] = (centers + tile_offsets[cur_groups]).to(boxes_for_nms.dtype)
+
+    keep_idx, _ = getattr(iou3d_nms_utils, nms_config.NMS_TYPE)(
+            boxes_for_nms, box_scores[order], nms_config.NMS_THRESH, **nms_config
+    )
+    num_keep = keep_idx.shape[0]
+    keep_idx = keep_idx[(cur_groups[keep_idx] * num_keep + torch.arange(num_keep, device=keep_idx.device)).argsort()]
+    keep_idx = keep_idx[get_rank_in_group(cur_groups[keep_idx]) < nms_config.NMS_POST_MAXSIZE]
+    return order[keep_idx]
+
+
+def batched_multi_classes_nms(cls_scores, box_preds, batch_index, nms_config, score_thresh=None, box_idxs=None):
+    """
+    multi_classes_nms of all samples and classes (and heads) at once with grouped_nms, one group per sample and class
+    Args:
+        cls_scores: (N, num_class) or [(N1, num_class1), (N2, num_class2), ...] of several heads
+        box_preds: (M, 7 + C)
+        batch_index: (M)
+        nms_config:
+        score_thresh:
+        box_idxs: optional [(N1), (N2), ...], the rows of box_preds of each head, all rows by default
+
+    Returns:
+        pred_scores: (K)
+        pred_labels: (K) class index starting from 0, the classes of the heads are numbered one after another
+        pred_boxes: (K, 7 + C)
+        pred_batch_index: (K)
+    """
+    if not isinstance(cls_scores, list):
+        cls_scores = [cls_scores]
+    if box_idxs is None:
+        box_idxs = [torch.arange(box_preds.shape[0], device=box_preds.device)] * len(cls_scores)
+    num_columns = sum([x.shape[1] for x in cls_scores])
+
+    pair_box_idxs, pair_labels, pair_scores = [], [], []
+    column_offset = 0
+    for cur_cls_scores, cur_box_idxs in zip(cls_scores, box_idxs):
+        if score_thresh is not None:
+            rows, columns = (cur_cls_scores >= score_thresh).nonzero(as_tuple=True)
+        else:
+            rows = torch.arange(cur_cls_scores.shape[0], device=cur_cls_scores.device)
+            rows = rows[:, None].expand_as(cur_cls_scores).reshape(-1)
+            columns = torch.arange(cur_cls_scores.shape[1], device=cur_cls_scores.device).repeat(
+                cur_cls_scores.shape[0]
+            )
+        pair_box_idxs.append(cur_box_idxs[rows])
+        pair_labels.append(columns + column_offset)
+        pair_scores.append(cur_cls_scores[rows, columns])
+        column_offset += cur_cls_scores.shape[1]
+
+    pair_box_idxs = torch.cat(pair_box_idxs, dim=0)
+    pair_labels = torch.cat(pair_labels, dim=0)
+    pair_scores = torch.cat(pair_scores, dim=0)
+    pair_batch_index = batch_index[pair_box_idxs].long()
+
+    selected = grouped_nms(
+        box_scores=pair_scores, box_preds=box_preds[pair_box_idxs],
+        group_ids=pair_batch_index * num_columns + pair_labels, nms_config=nms_config
+    )
+    return pair_scores[selected], pair_labels[selected], box_preds[pair_box_idxs[selected]], \
+        pair_batch_index[selected]
@@ -3,10 +3,15 @@
 Written by Shaoshuai Shi
 All Rights Reserved 2019-2020.
 """
+import numpy as np
 import torch
 
 from ...utils import common_utils
-from . import iou3d_nms_cuda
+
+try:
+    from . import iou3d_nms_cuda
+except ImportError:
+    iou3d_nms_cuda = None  # cpu-only build, the cpu tensors use the torch implementations below
 
 
 def boxes_bev_iou_cpu(boxes_a, boxes_b):
@@ -22,8 +27,11 @@ def boxes_bev_iou_cpu(boxes_a, boxes_b):
     boxes_b, is_numpy = common_utils.check_numpy_to_torch(boxes_b)
     assert not (boxes_a.is_cuda or boxes_b.is_cuda), 'Only support CPU tensors'
     assert boxes_a.shape[1] == 7 and boxes_b.shape[1] == 7
-    ans_iou = boxes_a.new_zeros(torch.Size((boxes_a.shape[0], boxes_b.shape[0])))
-    iou3d_nms_cuda.boxes_iou_bev_cpu(boxes_a.contiguous(), boxes_b.contiguous(), ans_iou)
+    if iou3d_nms_cuda is None:
+        ans_iou = boxes_iou_bev(boxes_a.float(), boxes_b.float())
+    else:
+        ans_iou = boxes_a.new_zeros(torch.Size((boxes_a.shape[0], boxes_b.shape[0])))
+        iou3d_nms_cuda.boxes_iou_bev_cpu(boxes_a.contiguous(), boxes_b.contiguous(), ans_iou)
 
     return ans_iou.numpy() if is_numpy else ans_iou
 
@@ -38,6 +46,12 @@ def boxes_iou_bev(boxes_a, boxes_b):
         ans_iou: (N, M)
     """
     assert boxes_a.shape[1] == boxes_b.shape[1] == 7
+    if not boxes_a.is_cuda:
+        overlaps_bev = boxes_overlap_bev_cpu(boxes_a, boxes_b)
+        area_a = (boxes_a[:, 3] * boxes_a[:, 4]).view(-1, 1)
+        area_b = (boxes_b[:, 3] * boxes_b[:, 4]).view(1, -1)
+        return overlaps_bev / torch.clamp(area_a + area_b - overlaps_bev, min=1e-8)
+
     ans_iou = torch.cuda.FloatTensor(torch.Size((boxes_a.shape[0], boxes_b.shape[0]))).zero_()
 
     iou3d_nms_cuda.boxes_iou_bev_gpu(boxes_a.contiguous(), boxes_b.contiguous(), ans_iou)
@@ -63,8 +77,11 @@ def boxes_iou3d_gpu(boxes_a, boxes_b):
     boxes_b_height_min = (boxes_b[:, 2] - boxes_b[:, 5] / 2).view(1, -1)
 
     # bev overlap
-    overlaps_bev = torch.cuda.FloatTensor(torch.Size((boxes_a.shape[0], boxes_b.shape[0]))).zero_()  # (N, M)
-    iou3d_nms_cuda.boxes_overlap_bev_gpu(boxes_a.contiguous(), boxes_b.contiguous(), overlaps_bev)
+    if boxes_a.is_cuda:
+        overlaps_bev = torch.cuda.FloatTensor(torch.Size((boxes_a.shape[0], boxes_b.shape[0]))).zero_()  # (N, M)
+        iou3d_nms_cuda.boxes_overlap_bev_gpu(boxes_a.contiguous(), boxes_b.contiguous(), overlaps_bev)
+    else:
+        overlaps_bev = boxes_overlap_bev_cpu(boxes_a, boxes_b)
 
     max_of_min = torch.max(boxes_a_height_min, boxes_b_height_min)
     min_of_max = torch.min(boxes_a_height_max, boxes_b_height_max)
@@ -94,12 +111,15 @@ def nms_gpu(boxes, scores, thresh, pre_maxsize=None, **kwargs):
         order = order[:pre_maxsize]
 
     boxes = boxes[order].contiguous()
+    if not boxes.is_cuda:
+        return order[nms_cpu(boxes, thresh)], None
+
     keep = torch.LongTensor(boxes.size(0))
     num_out = iou3d_nms_cuda.nms_gpu(boxes, keep, thresh)
     return order[keep[:num_out].cuda()].contiguous(), None
 
 
-def nms_normal_gpu(boxes, scores, thresh, **kwargs):
+def nms_normal_gpu(boxes, scores, thresh, pre_maxsize=None, **kwargs):
     """
     :param boxes: (N, 7) [x, y, z, dx, dy, dz, heading]
     :param scores: (N)
@@ -108,9 +128,210 @@ def nms_normal_gpu(boxes, scores, thresh, **kwargs):
     """
     assert boxes.shape[1] == 7
     order = scores.sort(0, descending=True)[1]
+    if pre_maxsize is not None:
+        order = order[:pre_maxsize]
 
     boxes = boxes[order].contiguous()
+    if not boxes.is_cuda:
+        return order[nms_cpu(boxes, thresh, normal=True)], None
 
     keep = torch.LongTensor(boxes.size(0))
     num_out = iou3d_nms_cuda.nms_normal_gpu(boxes, keep, thresh)
     return order[keep[:num_out].cuda()].contiguous(), None
+
+
+def boxes_to_bev_corners_torch(boxes):
+    """
+    Args:
+        boxes: (N, 7) [x, y, z, dx, dy, dz, heading]
+
+    Returns:
+        corners: (N, 4, 2) in the same order as the cuda kernel
+    """
+    template = boxes.new_tensor([[-1, -1], [1, -1], [1, 1], [-1, 1]]) / 2
+    corners = boxes[:, None, 3:5] * template[None, :, :]
+    cos, sin = torch.cos(boxes[:, 6])[:, None], torch.sin(boxes[:, 6])[:, None]
+    rot_x = corners[:, :, 0] * cos - corners[:, :, 1] * sin
+    rot_y = corners[:, :, 0] * sin + corners[:, :, 1] * cos
+    return torch.stack((rot_x, rot_y), dim=-1) + boxes[:, None, 0:2]
+
+
+def points_in_boxes_bev_torch(points, boxes, margin=1e-2):
+    """
+    Args:
+        points: (N, K, 2)
+        boxes: (N, 7) [x, y, z, dx, dy, dz, heading], the box of each row of points
+
+    Returns:
+        in_flag: (N, K)
+    """
+    local = points - boxes[:, None, 0:2]
+    cos, sin = torch.cos(boxes[:, 6])[:, None], torch.sin(boxes[:, 6])[:, None]
+    local_x = local[:, :, 0] * cos + local[:, :, 1] * sin
+    local_y = -local[:, :, 0] * sin + local[:, :, 1] * cos
+    return (local_x.abs() < boxes[:, None, 3] / 2 + margin) & (local_y.abs() < boxes[:, None, 4] / 2 + margin)
+
+
+def paired_boxes_overlap_bev_torch(boxes_a, boxes_b):
+    """
+    Rotated BEV overlap of the pairs (boxes_a[i], boxes_b[i]), same polygon as the cuda kernel: the edge
+    intersections and the corners inside the other box, sorted by angle around their center
+    Args:
+        boxes_a: (N, 7) [x, y, z, dx, dy, dz, heading]
+        boxes_b: (N, 7) [x, y, z, dx, dy, dz, heading]
+
+    Returns:
+        overlap: (N)
+    """
+    corners_a, corners_b = boxes_to_bev_corners_torch(boxes_a), boxes_to_bev_corners_torch(boxes_b)
+    p0, q0 = corners_a[:, :, None, :], corners_b[:, None, :, :]
+    r = corners_a.roll(-1, dims=1)[:, :, None, :] - p0  # (N, 4, 1, 2)
+    s = corners_b.roll(-1, dims=1)[:, None, :, :] - q0  # (N, 1, 4, 2)
+    qp = q0 - p0
+
+    denom = r[..., 0] * s[..., 1] - r[..., 1] * s[..., 0]  # (N, 4, 4)
+    safe_denom = torch.where(denom.abs() > 1e-8, denom, torch.ones_like(denom))
+    t = (qp[..., 0] * s[..., 1] - qp[..., 1] * s[..., 0]) / safe_denom
+    u = (qp[..., 0] * r[..., 1] - qp[..., 1] * r[..., 0]) / safe_denom
+    cross_valid = (denom.abs() > 1e-8) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    cross_points = p0 + t[..., None] * r
+
+    points = torch.cat((cross_points.view(-1, 16, 2), corners_a, corners_b), dim=1)  # (N, 24, 2)
+    valid = torch.cat((
+        cross_valid.view(-1, 16), points_in_boxes_bev_torch(corners_a, boxes_b),
+        points_in_boxes_bev_torch(corners_b, boxes_a)
+    ), dim=1)
+
+    num_valid = valid.sum(dim=1)
+    center = (points * valid[..., None]).sum(dim=1) / torch.clamp_min(num_valid, 1)[:, None]
+    points = points - center[:, None, :]
+    angle = torch.atan2(points[..., 1], points[..., 0]).masked_fill(~valid, float('inf'))
+    order = angle.argsort(dim=1)
+    points = points.gather(1, order[..., None].expand(-1, -1, 2))
+    valid = valid.gather(1, order)
+    # the invalid points at the end are replaced by the first one and do not change the area
+    points = torch.where(valid[..., None], points, points[:, 0:1, :].expand_as(points))
+    next_points = points.roll(-1, dims=1)
+    area = (points[..., 0] * next_points[..., 1] - points[..., 1] * next_points[..., 0]).sum(dim=1).abs() / 2
+    return torch.where(num_valid >= 3, area, torch.zeros_like(area))
+
+
+def iter_circle_overlapping_pairs(boxes_a, boxes_b, max_pairs_per_chunk=262144):
+    """
+    Pairs of boxes whose circumscribed BEV circles intersect, the only pairs that can overlap, computed by chunks of
+    rows of boxes_a to bound the memory of the distance matrix
+    Args:
+        boxes_a: (N, 7) [x, y, z, dx, dy, dz, heading]
+        boxes_b: (M, 7) [x, y, z, dx, dy, dz, heading]
+        max_pairs_per_chunk:
+
+    Returns:
+        iterator of (idx_a, idx_b), the pairs of each chunk sorted by idx_a, then idx_b
+    """
+    if boxes_a.shape[0] == 0 or boxes_b.shape[0] == 0:
+        return
+    radius_a, radius_b = boxes_a[:, 3:5].norm(dim=-1) / 2, boxes_b[:, 3:5].norm(dim=-1) / 2
+    chunk_size = max(max_pairs_per_chunk // boxes_b.shape[0], 1)
+    for start in range(0, boxes_a.shape[0], chunk_size):
+        distance = (boxes_a[start:start + chunk_size, None, 0:2] - boxes_b[None, :, 0:2]).norm(dim=-1)
+        idx_a, idx_b = (distance < radius_a[start:start + chunk_size, None] + radius_b[None, :]).nonzero(as_tuple=True)
+        if idx_a.shape[0] > 0:
+            yield start + idx_a, idx_b
+
+
+def boxes_overlap_bev_cpu(boxes_a, boxes_b, max_pairs_per_chunk=262144):
+    """
+    Torch implementation of the rotated BEV overlap for cpu tensors, only the pairs with intersecting circumscribed
+    circles are computed
+    Args:
+        boxes_a: (N, 7) [x, y, z, dx, dy, dz, heading]
+        boxes_b: (M, 7) [x, y, z, dx, dy, dz, heading]
+
+    Returns:
+        overlaps_bev: (N, M)
+    """
+    boxes_a, boxes_b = boxes_a[:, 0:7].float(), boxes_b[:, 0:7].float()
+    overlaps_bev = boxes_a.new_zeros((boxes_a.shape[0], boxes_b.shape[0]))
+    for idx_a, idx_b in iter_circle_overlapping_pairs(boxes_a, boxes_b, max_pairs_per_chunk=max_pairs_per_chunk):
+        overlaps_bev[idx_a, idx_b] = paired_boxes_overlap_bev_torch(boxes_a[idx_a], boxes_b[idx_b])
+    return overlaps_bev
+
+
+def paired_boxes_iou_bev_torch(boxes_a, boxes_b, normal=False):
+    """
+    BEV IoU of the pairs (boxes_a[i], boxes_b[i]), rotated as boxes_iou_bev or axis-aligned as boxes_iou_normal_cpu
+    Args:
+        boxes_a: (N, 7) [x, y, z, dx, dy, dz, heading]
+        boxes_b: (N, 7) [x, y, z, dx, dy, dz, heading]
+        normal: ignore the heading
+
+    Returns:
+        iou: (N)
+    """
+    if normal:
+        min_a, max_a = boxes_a[:, 0:2] - boxes_a[:, 3:5] / 2, boxes_a[:, 0:2] + boxes_a[:, 3:5] / 2
+        min_b, max_b = boxes_b[:, 0:2] - boxes_b[:, 3:5] / 2, boxes_b[:, 0:2] + boxes_b[:, 3:5] / 2
+        overlap = torch.clamp_min(torch.min(max_a, max_b) - torch.max(min_a, min_b), 0).prod(dim=1)
+    else:
+        overlap = paired_boxes_overlap_bev_torch(boxes_a, boxes_b)
+    area_a, area_b = boxes_a[:, 3] * boxes_a[:, 4], boxes_b[:, 3] * boxes_b[:, 4]
+    return overlap / torch.clamp(area_a + area_b - overlap, min=1e-8)
+
+
+def boxes_iou_normal_cpu(boxes_a, boxes_b):
+    """
+    Axis-aligned BEV IoU ignoring the heading, as used by nms_normal_gpu
+    Args:
+        boxes_a: (N, 7) [x, y, z, dx, dy, dz, heading]
+        boxes_b: (M, 7) [x, y, z, dx, dy, dz, heading]
+
+    Returns:
+        ans_iou: (N, M)
+    """
+    left = torch.max(boxes_a[:, 0, None] - boxes_a[:, 3, None] / 2, boxes_b[None, :, 0] - boxes_b[None, :, 3] / 2)
+    right = torch.min(boxes_a[:, 0, None] + boxes_a[:, 3, None] / 2, boxes_b[None, :, 0] + boxes_b[None, :, 3] / 2)
+    top = torch.max(boxes_a[:, 1, None] - boxes_a[:, 4, None] / 2, boxes_b[None, :, 1] - boxes_b[None, :, 4] / 2)
+    bottom = torch.min(boxes_a[:, 1, None] + boxes_a[:, 4, None] / 2, boxes_b[None, :, 1] + boxes_b[None, :, 4] / 2)
+    inter = torch.clamp_min(right - left, 0) * torch.clamp_min(bottom - top, 0)
+    area_a = (boxes_a[:, 3] * boxes_a[:, 4]).view(-1, 1)
+    area_b = (boxes_b[:, 3] * boxes_b[:, 4]).view(1, -1)
+    return inter / torch.clamp(area_a + area_b - inter, min=1e-8)
+
+
+def nms_cpu(boxes, thresh, normal=False, max_pairs_per_chunk=262144):
+    """
+    Greedy NMS of cpu boxes sorted by descending score. The IoU is only computed for the pairs whose circumscribed
+    circles intersect, and the greedy pass runs over the sparse list of the overlapped pairs, so that the memory
+    grows with the number of overlapping pairs instead of N * N
+    Args:
+        boxes: (N, 7) [x, y, z, dx, dy, dz, heading]
+        thresh:
+        normal: axis-aligned IoU ignoring the heading, as nms_normal_gpu
+        max_pairs_per_chunk:
+
+    Returns:
+        keep: (K) indices of the kept boxes
+    """
+    boxes = boxes[:, 0:7].float()
+    num_boxes = boxes.shape[0]
+    pairs_a, pairs_b = [], []
+    for idx_a, idx_b in iter_circle_overlapping_pairs(boxes, boxes, max_pairs_per_chunk=max_pairs_per_chunk):
+        # a box can only suppress the boxes of lower scores
+        mask = idx_a < idx_b
+        idx_a, idx_b = idx_a[mask], idx_b[mask]
+        mask = paired_boxes_iou_bev_torch(boxes[idx_a], boxes[idx_b], normal=normal) > thresh
+        pairs_a.append(idx_a[mask].numpy())
+        pairs_b.append(idx_b[mask].numpy())
+
+    pairs_a = np.concatenate(pairs_a) if len(pairs_a) > 0 else np.zeros(0, dtype=np.int64)
+    pairs_b = np.concatenate(pairs_b) if len(pairs_b) > 0 else np.zeros(0, dtype=np.int64)
+    # the pairs come sorted by their first box, pairs_b[row_start[i]:row_start[i + 1]] are suppressed by box i
+    row_start = np.searchsorted(pairs_a, np.arange(num_boxes + 1))
+    suppressed = np.zeros(num_boxes, dtype=np.bool_)
+    keep = []
+    for i in range(num_boxes):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed[pairs_b[row_start[i]:row_start[i + 1]]] = True
+    return torch.from_numpy(np.array(keep, dtype=np.int64))
@@ -1,9 +1,15 @@
+import numba
+import numpy as np
 import torch
 import torch.nn as nn
 from torch.autograd import Function
 
 from ...utils import common_utils
-from . import roiaware_pool3d_cuda
+
+try:
+    from . import roiaware_pool3d_cuda
+except ImportError:
+    roiaware_pool3d_cuda = None  # cpu-only build, only the numba points-in-boxes functions are available
 
 
 def points_in_boxes_cpu(points, boxes):
@@ -25,6 +31,164 @@ def points_in_boxes_cpu(points, boxes):
     return point_indices.numpy() if is_numpy else point_indices
 
 
+@numba.jit(nopython=True)
+def check_pt_in_box3d_numba(x, y, z, box, margin):
+    # same test as check_pt_in_box3d_cpu (margin 1e-2) and check_pt_in_box3d (margin 1e-5) of the cuda extension
+    if abs(z - box[2]) > box[5] / 2.0:
+        return False
+    cosa, sina = np.cos(-box[6]), np.sin(-box[6])
+    local_x = (x - box[0]) * cosa + (y - box[1]) * (-sina)
+    local_y = (x - box[0]) * sina + (y - box[1]) * cosa
+    return abs(local_x) < box[3] / 2.0 + margin and abs(local_y) < box[4] / 2.0 + margin
+
+
+@numba.jit(nopython=True, parallel=True)
+def points_in_boxes_grid_kernel(points, boxes, grid_origin, cell_size, grid_shape, cell_start, cell_box_idxs,
+                                margin, num_boxes_of_pts, first_only):
+    """
+    For each point, count (or find the first of) the boxes containing it, only the boxes listed in its BEV cell are
+    tested
+    """
+    box_idxs_of_pts = np.full(points.shape[0], -1, dtype=np.int32)
+    for i in numba.prange(points.shape[0]):
+        cell_x = int(np.floor((points[i, 0] - grid_origin[0]) / cell_size))
+        cell_y = int(np.floor((points[i, 1] - grid_origin[1]) / cell_size))
+        if cell_x < 0 or cell_y < 0 or cell_x >= grid_shape[0] or cell_y >= grid_shape[1]:
+            continue
+        cell = cell_y * grid_shape[0] + cell_x
+        cnt = 0
+        for k in range(cell_start[cell], cell_start[cell + 1]):
+            box_idx = cell_box_idxs[k]
+            if check_pt_in_box3d_numba(points[i, 0], points[i, 1], points[i, 2], boxes[box_idx], margin):
+                if cnt == 0:
+                    box_idxs_of_pts[i] = box_idx
+                cnt += 1
+                if first_only:
+                    break
+        num_boxes_of_pts[i] = cnt
+    return box_idxs_of_pts
+
+
+@numba.jit(nopython=True, parallel=True)
+def fill_point_box_pairs_kernel(points, boxes, grid_origin, cell_size, grid_shape, cell_start, cell_box_idxs,
+                                margin, pair_start, box_idxs):
+    for i in numba.prange(points.shape[0]):
+        if pair_start[i + 1] == pair_start[i]:
+            continue
+        cell_x = int(np.floor((points[i, 0] - grid_origin[0]) / cell_size))
+        cell_y = int(np.floor((points[i, 1] - grid_origin[1]) / cell_size))
+        cell = cell_y * grid_shape[0] + cell_x
+        cnt = pair_start[i]
+        for k in range(cell_start[cell], cell_start[cell + 1]):
+            box_idx = cell_box_idxs[k]
+            if check_pt_in_box3d_numba(points[i, 0], points[i, 1], points[i, 2], boxes[box_idx], margin):
+                box_idxs[cnt] = box_idx
+                cnt += 1
+
+
+def build_boxes_bev_grid(boxes, cell_size=2.0, max_cells_per_axis=512, margin=1e-2):
+    """
+    Args:
+        boxes: (N, 7) [x, y, z, dx, dy, dz, heading] numpy float32
+        cell_size: BEV cell size in meters, enlarged if the grid of the boxes exceeds max_cells_per_axis
+        margin: margin of the points-in-box test, the boxes are enlarged by it and 1e-2 of rounding slack
+
+    Returns:
+        grid_origin: (2)
+        cell_size:
+        grid_shape: (2) [num_cells_x, num_cells_y]
+        cell_start: (num_cells + 1) the boxes of cell c are cell_box_idxs[cell_start[c]:cell_start[c + 1]]
+        cell_box_idxs: ascending box indices in each cell
+    """
+    cosa, sina = np.abs(np.cos(boxes[:, 6])), np.abs(np.sin(boxes[:, 6]))
+    half_extent = np.stack((
+        boxes[:, 3] / 2 * cosa + boxes[:, 4] / 2 * sina, boxes[:, 3] / 2 * sina + boxes[:, 4] / 2 * cosa
+    ), axis=1) + margin + 1e-2
+    box_min, box_max = boxes[:, 0:2] - half_extent, boxes[:, 0:2] + half_extent
+
+    grid_origin = box_min.min(axis=0)
+    cell_size = max(cell_size, float((box_max.max(axis=0) - grid_origin).max()) / max_cells_per_axis)
+    cell_lo = np.floor((box_min - grid_origin) / cell_size).astype(np.int64)
+    cell_hi = np.floor((box_max - grid_origin) / cell_size).astype(np.int64)
+    grid_shape = cell_hi.max(axis=0) + 1
+
+    cells, cell_boxes = [], []
+    for k in range(boxes.shape[0]):
+        xs, ys = np.meshgrid(np.arange(cell_lo[k, 0], cell_hi[k, 0] + 1), np.arange(cell_lo[k, 1], cell_hi[k, 1] + 1))
+        cells.append((ys * grid_shape[0] + xs).reshape(-1))
+        cell_boxes.append(np.full(cells[-1].shape[0], k, dtype=np.int64))
+    cells, cell_boxes = np.concatenate(cells), np.concatenate(cell_boxes)
+    order = np.lexsort((cell_boxes, cells))
+    counts = np.bincount(cells, minlength=int(grid_shape[0] * grid_shape[1]))
+    cell_start = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    return grid_origin.astype(np.float32), cell_size, grid_shape, cell_start, cell_boxes[order]
+
+
+def points_in_boxes_idx_cpu(points, boxes, margin=1e-2):
+    """
+    Multithreaded cpu version of points_in_boxes_gpu, each point is only tested against the boxes of its BEV cell
+    Args:
+        points: (num_points, 3)
+        boxes: (N, 7) [x, y, z, dx, dy, dz, heading], (x, y, z) is the box center, each box DO NOT overlaps
+        margin: BEV margin of the boxes, 1e-2 as points_in_boxes_cpu, 1e-5 as points_in_boxes_gpu
+
+    Returns:
+        box_idxs_of_pts: (num_points), the first box containing each point, default background = -1
+    """
+    assert boxes.shape[1] == 7
+    assert points.shape[1] == 3
+    points, is_numpy = common_utils.check_numpy_to_torch(points)
+    boxes, is_numpy = common_utils.check_numpy_to_torch(boxes)
+    points_np = points.float().numpy()
+    boxes_np = boxes.float().numpy()
+
+    if boxes_np.shape[0] == 0:
+        box_idxs_of_pts = np.full(points_np.shape[0], -1, dtype=np.int32)
+    else:
+        grid = build_boxes_bev_grid(boxes_np, margin=margin)
+        num_boxes_of_pts = np.zeros(points_np.shape[0], dtype=np.int32)
+        box_idxs_of_pts = points_in_boxes_grid_kernel(
+            np.ascontiguousarray(points_np), np.ascontiguousarray(boxes_np), *grid, margin, num_boxes_of_pts, True
+        )
+
+    return box_idxs_of_pts if is_numpy else torch.from_numpy(box_idxs_of_pts)
+
+
+def points_in_boxes_sparse_cpu(points, boxes, margin=1e-2):
+    """
+    Sparse cpu version of points_in_boxes_cpu, all the (point, box) pairs with the point inside the box
+    Args:
+        points: (num_points, 3)
+        boxes: (N, 7) [x, y, z, dx, dy, dz, heading], (x, y, z) is the box center
+        margin: BEV margin of the boxes, see points_in_boxes_idx_cpu
+
+    Returns:
+        point_idxs: (K) ascending
+        box_idxs: (K) ascending box indices of each point
+    """
+    assert boxes.shape[1] == 7
+    assert points.shape[1] == 3
+    points, is_numpy = common_utils.check_numpy_to_torch(points)
+    boxes, is_numpy = common_utils.check_numpy_to_torch(boxes)
+    points_np = np.ascontiguousarray(points.float().numpy())
+    boxes_np = np.ascontiguousarray(boxes.float().numpy())
+
+    if boxes_np.shape[0] == 0:
+        point_idxs, box_idxs = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    else:
+        grid = build_boxes_bev_grid(boxes_np, margin=margin)
+        num_boxes_of_pts = np.zeros(points_np.shape[0], dtype=np.int32)
+        points_in_boxes_grid_kernel(points_np, boxes_np, *grid, margin, num_boxes_of_pts, False)
+        pair_start = np.concatenate(([0], np.cumsum(num_boxes_of_pts))).astype(np.int64)
+        box_idxs = np.zeros(pair_start[-1], dtype=np.int64)
+        fill_point_box_pairs_kernel(points_np, boxes_np, *grid, margin, pair_start, box_idxs)
+        point_idxs = np.repeat(np.arange(points_np.shape[0], dtype=np.int64), num_boxes_of_pts)
+
+    if is_numpy:
+        return point_idxs, box_idxs
+    return torch.from_numpy(point_idxs), torch.from_numpy(box_idxs)
+
+
 def points_in_boxes_gpu(points, boxes):
     """
     :param points: (B, M, 3)
@@ -147,7 +147,8 @@ class PointResidualCoder(object):
         self.code_size = code_size
         self.use_mean_size = use_mean_size
         if self.use_mean_size:
-            self.mean_size = torch.from_numpy(np.array(kwargs['mean_size'])).cuda().float()
+            # moved to the device of the point heads by PointHeadTemplate._apply
+            self.mean_size = torch.from_numpy(np.array(kwargs['mean_size'])).float()
             assert self.mean_size.min() > 0
 
     def encode_torch(self, gt_boxes, points, gt_classes=None):
@@ -82,12 +82,70 @@ def remove_points_in_boxes3d(points, boxes3d):
     """
     boxes3d, is_numpy = common_utils.check_numpy_to_torch(boxes3d)
     points, is_numpy = common_utils.check_numpy_to_torch(points)
-    point_masks = roiaware_pool3d_utils.points_in_boxes_cpu(points[:, 0:3], boxes3d)
-    points = points[point_masks.sum(dim=0) == 0]
+    box_idxs_of_pts = roiaware_pool3d_utils.points_in_boxes_idx_cpu(points[:, 0:3], boxes3d)
+    points = points[box_idxs_of_pts == -1]
 
     return points.numpy() if is_numpy else points
 
 
+def boxes_to_bev_corners_numpy(boxes3d):
+    """
+    Args:
+        boxes3d: (N, 7 + C) [x, y, z, dx, dy, dz, heading], (x, y, z) is the box center
+
+    Returns:
+        corners_bev: (N, 4, 2) corners in the same order as boxes_to_corners_3d
+    """
+    cosa, sina = np.cos(boxes3d[:, 6]), np.sin(boxes3d[:, 6])
+    template = np.array([[1, 1], [1, -1], [-1, -1], [-1, 1]], dtype=np.float64) / 2
+    local_corners = boxes3d[:, None, 3:5] * template[None, :, :]  # (N, 4, 2)
+    corners_x = local_corners[:, :, 0] * cosa[:, None] - local_corners[:, :, 1] * sina[:, None]
+    corners_y = local_corners[:, :, 0] * sina[:, None] + local_corners[:, :, 1] * cosa[:, None]
+    corners_bev = np.stack((corners_x, corners_y), axis=-1) + boxes3d[:, None, 0:2]
+    return corners_bev
+
+
+def boxes_bev_collision_numpy(boxes_a, boxes_b):
+    """
+    Pure NumPy test of whether the BEV rotated boxes overlap with a positive area, which equals to (bev_iou > 0).
+    Pairs are pre-filtered by their circumscribed circles and the separating axis test only runs on the candidates.
+    Args:
+        boxes_a: (N, 7 + C) [x, y, z, dx, dy, dz, heading]
+        boxes_b: (M, 7 + C) [x, y, z, dx, dy, dz, heading]
+
+    Returns:
+        collision: (N, M) bool
+    """
+    collision = np.zeros((boxes_a.shape[0], boxes_b.shape[0]), dtype=np.bool_)
+    if collision.size == 0:
+        return collision
+    boxes_a = boxes_a[:, 0:7].astype(np.float64)
+    boxes_b = boxes_b[:, 0:7].astype(np.float64)
+
+    radius_a = np.linalg.norm(boxes_a[:, 3:5], axis=1) / 2
+    radius_b = np.linalg.norm(boxes_b[:, 3:5], axis=1) / 2
+    center_dist = np.linalg.norm(boxes_a[:, None, 0:2] - boxes_b[None, :, 0:2], axis=-1)
+    idx_a, idx_b = (center_dist < radius_a[:, None] + radius_b[None, :]).nonzero()
+    if idx_a.shape[0] == 0:
+        return collision
+
+    corners_a = boxes_to_bev_corners_numpy(boxes_a)[idx_a]  # (K, 4, 2)
+    corners_b = boxes_to_bev_corners_numpy(boxes_b)[idx_b]
+    heading_a, heading_b = boxes_a[idx_a, 6], boxes_b[idx_b, 6]
+    axes = np.stack((
+        np.stack((np.cos(heading_a), np.sin(heading_a)), axis=-1),
+        np.stack((-np.sin(heading_a), np.cos(heading_a)), axis=-1),
+        np.stack((np.cos(heading_b), np.sin(heading_b)), axis=-1),
+        np.stack((-np.sin(heading_b), np.cos(heading_b)), axis=-1),
+    ), axis=1)  # (K, 4, 2) the edge normals of both boxes
+
+    proj_a = np.einsum('kpd,kad->kap', corners_a, axes)  # (K, 4 axes, 4 corners)
+    proj_b = np.einsum('kpd,kad->kap', corners_b, axes)
+    separated = (proj_a.max(axis=-1) <= proj_b.min(axis=-1)) | (proj_b.max(axis=-1) <= proj_a.min(axis=-1))
+    collision[idx_a, idx_b] = ~separated.any(axis=1)
+    return collision
+
+
 def boxes3d_kitti_camera_to_lidar(boxes3d_camera, calib):
     """
     Args:
@@ -287,3 +345,90 @@ def boxes3d_nearest_bev_iou(boxes_a, boxes_b):
     boxes_bev_b = boxes3d_lidar_to_aligned_bev_boxes(boxes_b)
 
     return boxes_iou_normal(boxes_bev_a, boxes_bev_b)
+
+
+def bev_grid_candidate_pairs(points_xy, boxes_bev, margin, cell_size=None):
+    """
+    Find the (point, box) pairs with the point inside the box enlarged by margin through a BEV grid of the points,
+    so that only the points of the grid cells covered by each box are visited instead of all (N, M) pairs.
+    Args:
+        points_xy: (N, 2) [x, y]
+        boxes_bev: (M, 4) [x1, y1, x2, y2]
+        margin: float or scalar tensor
+        cell_size: grid cell size, 2 * margin by default
+
+    Returns:
+        point_idxs: (K)
+        box_idxs: (K)
+    """
+    empty = points_xy.new_zeros(0, dtype=torch.long)
+    if points_xy.shape[0] == 0 or boxes_bev.shape[0] == 0:
+        return empty, empty
+    if cell_size is None:
+        cell_size = torch.clamp_min(torch.as_tensor(margin, dtype=points_xy.dtype, device=points_xy.device) * 2, 1e-2)
+    device = points_xy.device
+
+    origin = points_xy.min(dim=0)[0]
+    point_cells = torch.floor((points_xy - origin) / cell_size).long()
+    num_cells = point_cells.max(dim=0)[0] + 1
+    point_keys = point_cells[:, 1] * num_cells[0] + point_cells[:, 0]
+    sorted_keys, point_order = point_keys.sort()
+
+    cell_lo = torch.floor((boxes_bev[:, 0:2] - margin - origin) / cell_size).long()
+    cell_hi = torch.floor((boxes_bev[:, 2:4] + margin - origin) / cell_size).long()
+    cell_lo = torch.max(cell_lo, torch.zeros_like(cell_lo))
+    cell_hi = torch.min(cell_hi, (num_cells - 1)[None, :])
+
+    # the points of the cells [x_lo, x_hi] of one cell row are contiguous in the sorted order
+    num_rows = torch.clamp_min(cell_hi[:, 1] - cell_lo[:, 1] + 1, 0)
+    row_box_idxs = torch.arange(boxes_bev.shape[0], device=device).repeat_interleave(num_rows)
+    row_offsets = torch.arange(row_box_idxs.shape[0], device=device) - \
+        (torch.cumsum(num_rows, dim=0) - num_rows).repeat_interleave(num_rows)
+    rows = cell_lo[row_box_idxs, 1] + row_offsets
+    row_start = common_utils.searchsorted(sorted_keys, rows * num_cells[0] + cell_lo[row_box_idxs, 0])
+    row_end = common_utils.searchsorted(sorted_keys, rows * num_cells[0] + cell_hi[row_box_idxs, 0], right=True)
+    row_len = torch.clamp_min(row_end - row_start, 0) * (cell_hi[row_box_idxs, 0] >= cell_lo[row_box_idxs, 0])
+
+    pair_rows = torch.arange(row_len.shape[0], device=device).repeat_interleave(row_len)
+    pair_offsets = torch.arange(pair_rows.shape[0], device=device) - \
+        (torch.cumsum(row_len, dim=0) - row_len).repeat_interleave(row_len)
+    point_idxs = point_order[row_start[pair_rows] + pair_offsets]
+    box_idxs = row_box_idxs[pair_rows]
+
+    keep = ((points_xy[point_idxs] > boxes_bev[box_idxs, 0:2] - margin) &
+            (points_xy[point_idxs] < boxes_bev[box_idxs, 2:4] + margin)).all(dim=-1)
+    return point_idxs[keep], box_idxs[keep]
+
+
+def boxes3d_nearest_bev_iou_sparse(boxes_a, boxes_b):
+    """
+    Sparse version of boxes3d_nearest_bev_iou, only the pairs with positive IoU are computed and returned, found
+    with bev_grid_candidate_pairs on the centers of boxes_a. Memory scales with the number of overlapping pairs.
+    Args:
+        boxes_a: (N, 7) [x, y, z, dx, dy, dz, heading], many small boxes like anchors
+        boxes_b: (M, 7) [x, y, z, dx, dy, dz, heading]
+
+    Returns:
+        idx_a: (K)
+        idx_b: (K)
+        iou: (K)
+    """
+    boxes_bev_a = boxes3d_lidar_to_aligned_bev_boxes(boxes_a)
+    boxes_bev_b = boxes3d_lidar_to_aligned_bev_boxes(boxes_b)
+    if boxes_a.shape[0] == 0 or boxes_b.shape[0] == 0:
+        empty = boxes_a.new_zeros(0, dtype=torch.long)
+        return empty, empty, boxes_a.new_zeros(0)
+
+    margin = (boxes_bev_a[:, 2:4] - boxes_bev_a[:, 0:2]).max() / 2
+    idx_a, idx_b = bev_grid_candidate_pairs(boxes_a[:, 0:2], boxes_bev_b, margin)
+
+    bev_a, bev_b = boxes_bev_a[idx_a], boxes_bev_b[idx_b]
+    x_len = torch.clamp_min(torch.min(bev_a[:, 2], bev_b[:, 2]) - torch.max(bev_a[:, 0], bev_b[:, 0]), min=0)
+    y_len = torch.clamp_min(torch.min(bev_a[:, 3], bev_b[:, 3]) - torch.max(bev_a[:, 1], bev_b[:, 1]), min=0)
+    area_a = (bev_a[:, 2] - bev_a[:, 0]) * (bev_a[:, 3] - bev_a[:, 1])
+    area_b = (bev_b[:, 2] - bev_b[:, 0]) * (bev_b[:, 3] - bev_b[:, 1])
+    a_intersect_b = x_len * y_len
+    iou = a_intersect_b / torch.clamp_min(area_a + area_b - a_intersect_b, min=1e-6)
+
+    keep = iou > 0
+    return idx_a[keep], idx_b[keep], iou[keep]
@@ -20,6 +20,20 @@ def get_calib_from_file(calib_file):
             'Tr_velo2cam': Tr_velo_to_cam.reshape(3, 4)}
 
 
+def get_calib_from_info(calib_info):
+    """
+    Args:
+        calib_info: info['calib'] of the kitti infos, {'P2', 'R0_rect', 'Tr_velo_to_cam'} as 4 x 4 matrices
+
+    Returns:
+        calib: dict in the format of get_calib_from_file, without P3
+    """
+    return {'P2': np.array(calib_info['P2'][:3, :], dtype=np.float32),
+            'P3': None,
+            'R0': np.array(calib_info['R0_rect'][:3, :3], dtype=np.float32),
+            'Tr_velo2cam': np.array(calib_info['Tr_velo_to_cam'][:3, :], dtype=np.float32)}
+
+
 class Calibration(object):
     def __init__(self, calib_file):
         if not isinstance(calib_file, dict):
@@ -31,7 +45,12 @@ class Calibration(object):
         self.P3 = calib['P3']  # 3 x 4
         self.R0 = calib['R0']  # 3 x 3
         self.V2C = calib['Tr_velo2cam']  # 3 x 4
+        self.update_matrices()
 
+    def update_matrices(self):
+        """
+        Precompute the composed transforms, to be called again after P2, R0 or V2C are modified
+        """
         # Camera intrinsics and extrinsics
         self.cu = self.P2[0, 2]
         self.cv = self.P2[1, 2]
@@ -40,6 +59,42 @@ class Calibration(object):
         self.tx = self.P2[0, 3] / (-self.fu)
         self.ty = self.P2[1, 3] / (-self.fv)
 
+        # row-vector 4 x 4 transforms, pts @ M[:3] + M[3] applies M without homogeneous coordinates
+        R0_ext = np.eye(4, dtype=np.float32)
+        R0_ext[:3, :3] = self.R0
+        V2C_ext = np.eye(4, dtype=np.float32)
+        V2C_ext[:3, :] = self.V2C
+        self.lidar_to_rect_mat = np.dot(R0_ext, V2C_ext).T.astype(np.float32)  # (4, 4)
+        self.rect_to_lidar_mat = np.linalg.inv(np.dot(R0_ext, V2C_ext)).T.astype(np.float32)  # (4, 4)
+        self.rect_to_img_mat = self.P2.T.astype(np.float32)  # (4, 3)
+        # lidar => [u * depth_rect, v * depth_rect, P2 depth, z_rect] in one matmul
+        self.lidar_to_img_mat = np.concatenate([
+            np.dot(self.lidar_to_rect_mat, self.rect_to_img_mat), self.lidar_to_rect_mat[:, 2:3]
+        ], axis=1).astype(np.float32)  # (4, 4)
+
+    def get_fov_planes(self, img_shape):
+        """
+        Planes of the image frustum in lidar coordinates, a point is inside the field of view when
+        pts @ planes[:, :3].T + planes[:, 3] is >= 0 for the planes 0 and 2 (u >= 0, v >= 0) and > 0 for the planes
+        1, 3 and 4 (u < W, v < H, depth > 0), which matches the projection test of rect_to_img
+        :param img_shape: [H, W]
+        :return planes: (5, 4) [nx, ny, nz, d]
+        """
+        M = self.lidar_to_img_mat.astype(np.float64)  # columns: u * depth, v * depth, P2 depth, depth
+        planes = np.stack([
+            M[:, 0], img_shape[1] * M[:, 3] - M[:, 0], M[:, 1], img_shape[0] * M[:, 3] - M[:, 1], M[:, 3]
+        ], axis=0)
+        return planes.astype(np.float32)
+
+    @staticmethod
+    def apply_transform(pts, transform_mat):
+        """
+        :param pts: (N, 3)
+        :param transform_mat: (4, M) row-vector transform of homogeneous points
+        :return pts_out: (N, M)
+        """
+        return np.dot(pts, transform_mat[:3]) + transform_mat[3]
+
     def cart_to_hom(self, pts):
         """
         :param pts: (N, 3 or 2)
@@ -53,35 +108,23 @@ class Calibration(object):
         :param pts_lidar: (N, 3)
         :return pts_rect: (N, 3)
         """
-        pts_rect_hom = self.cart_to_hom(pts_rect)  # (N, 4)
-        R0_ext = np.hstack((self.R0, np.zeros((3, 1), dtype=np.float32)))  # (3, 4)
-        R0_ext = np.vstack((R0_ext, np.zeros((1, 4), dtype=np.float32)))  # (4, 4)
-        R0_ext[3, 3] = 1
-        V2C_ext = np.vstack((self.V2C, np.zeros((1, 4), dtype=np.float32)))  # (4, 4)
-        V2C_ext[3, 3] = 1
-
-        pts_lidar = np.dot(pts_rect_hom, np.linalg.inv(np.dot(R0_ext, V2C_ext).T))
-        return pts_lidar[:, 0:3]
+        return self.apply_transform(pts_rect, self.rect_to_lidar_mat[:, 0:3])
 
     def lidar_to_rect(self, pts_lidar):
         """
         :param pts_lidar: (N, 3)
         :return pts_rect: (N, 3)
         """
-        pts_lidar_hom = self.cart_to_hom(pts_lidar)
-        pts_rect = np.dot(pts_lidar_hom, np.dot(self.V2C.T, self.R0.T))
-        # pts_rect = reduce(np.dot, (pts_lidar_hom, self.V2C.T, self.R0.T))
-        return pts_rect
+        return self.apply_transform(pts_lidar, self.lidar_to_rect_mat[:, 0:3])
 
     def rect_to_img(self, pts_rect):
         """
         :param pts_rect: (N, 3)
         :return pts_img: (N, 2)
         """
-        pts_rect_hom = self.cart_to_hom(pts_rect)
-        pts_2d_hom = np.dot(pts_rect_hom, self.P2.T)
-        pts_img = (pts_2d_hom[:, 0:2].T / pts_rect_hom[:, 2]).T  # (N, 2)
-        pts_rect_depth = pts_2d_hom[:, 2] - self.P2.T[3, 2]  # depth in rect camera coord
+        pts_2d_hom = self.apply_transform(pts_rect, self.rect_to_img_mat)
+        pts_img = pts_2d_hom[:, 0:2] / pts_rect[:, 2:3]  # (N, 2)
+        pts_rect_depth = pts_2d_hom[:, 2] - self.rect_to_img_mat[3, 2]  # depth in rect camera coord
         return pts_img, pts_rect_depth
 
     def lidar_to_img(self, pts_lidar):
@@ -89,8 +132,9 @@ class Calibration(object):
         :param pts_lidar: (N, 3)
         :return pts_img: (N, 2)
         """
-        pts_rect = self.lidar_to_rect(pts_lidar)
-        pts_img, pts_depth = self.rect_to_img(pts_rect)
+        pts_2d_hom = self.apply_transform(pts_lidar, self.lidar_to_img_mat)  # (N, 4)
+        pts_img = pts_2d_hom[:, 0:2] / pts_2d_hom[:, 3:4]
+        pts_depth = pts_2d_hom[:, 2] - self.rect_to_img_mat[3, 2]
         return pts_img, pts_depth
 
     def img_to_rect(self, u, v, depth_rect):
@@ -1,3 +1,4 @@
+import collections
 import logging
 import os
 import pickle
@@ -81,6 +82,68 @@ def get_voxel_centers(voxel_coords, downsample_times, voxel_size, point_cloud_ra
     return voxel_centers
 
 
+def scatter_reduce(src, index, dim_size, reduce='amax', fill_value=0):
+    """
+    Max or min of the rows of src sharing the same index, with Tensor.scatter_reduce_ on torch>=1.12 and
+    scatter_reduce_sorted on the older versions
+    Args:
+        src: (N) or (N, C)
+        index: (N) long, in [0, dim_size)
+        dim_size:
+        reduce: 'amax' or 'amin'
+        fill_value: value of the indices without any row
+
+    Returns:
+        out: (dim_size) or (dim_size, C)
+    """
+    assert reduce in ['amax', 'amin']
+    if not hasattr(src, 'scatter_reduce_'):
+        return scatter_reduce_sorted(src, index, dim_size, reduce=reduce, fill_value=fill_value)
+    out = src.new_full((dim_size, ) + tuple(src.shape[1:]), fill_value)
+    expanded_index = index.view((-1, ) + (1, ) * (src.dim() - 1)).expand_as(src)
+    return out.scatter_reduce_(0, expanded_index, src, reduce=reduce, include_self=False)
+
+
+def scatter_reduce_sorted(src, index, dim_size, reduce='amax', fill_value=0):
+    """
+    Sort-based version of scatter_reduce for any torch version: the values of each column are ranked, and one sort
+    of the unique (index, rank) keys puts the min and the max of each index at the ends of its segment
+    """
+    assert reduce in ['amax', 'amin']
+    out = src.new_full((dim_size, ) + tuple(src.shape[1:]), fill_value)
+    num_rows = src.shape[0]
+    if num_rows == 0:
+        return out
+    flat_src = src.view(num_rows, -1)
+    value_order = flat_src.argsort(dim=0)
+    ranks = torch.zeros_like(value_order).scatter_(
+        0, value_order, torch.arange(num_rows, device=src.device).view(-1, 1).expand_as(value_order)
+    )
+    order = (index.view(-1, 1) * num_rows + ranks).argsort(dim=0)
+
+    counts = torch.bincount(index, minlength=dim_size)
+    nonempty = counts > 0
+    segment_end = torch.cumsum(counts, dim=0)[nonempty]
+    pos = segment_end - 1 if reduce == 'amax' else segment_end - counts[nonempty]
+    out.view(dim_size, -1)[nonempty] = flat_src.gather(0, order[pos])
+    return out
+
+
+def searchsorted(sorted_sequence, values, right=False):
+    """
+    torch.searchsorted of 1-D integer tensors, with a sort-based fallback for torch<1.6
+    """
+    if hasattr(torch, 'searchsorted'):
+        return torch.searchsorted(sorted_sequence, values, right=right)
+    # with the flag bit, the values go before (left) or after (right) the equal elements of the sequence
+    keys = torch.cat((sorted_sequence * 2 + int(not right), values * 2 + int(right)))
+    is_sequence = torch.cat((torch.ones_like(sorted_sequence), torch.zeros_like(values)))
+    order = keys.argsort()
+    num_before = torch.cumsum(is_sequence[order], dim=0)
+    positions = torch.zeros_like(order).scatter_(0, order, torch.arange(order.shape[0], device=order.device))
+    return num_before[positions[sorted_sequence.shape[0]:]]
+
+
 def create_logger(log_file=None, rank=0, log_level=logging.INFO):
     logger = logging.getLogger(__name__)
     logger.setLevel(log_level if rank == 0 else 'ERROR')
@@ -193,3 +256,62 @@ def merge_results_dist(result_part, size, tmpdir):
     ordered_results = ordered_results[:size]
     shutil.rmtree(tmpdir)
     return ordered_results
+
+
+def dump_pickle_atomic(obj, path):
+    """
+    Dump obj to path through a temporary file, so that an interrupted dump never leaves a truncated file
+    """
+    tmp_path = '%s.tmp' % str(path)
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(tmp_path, str(path))
+
+
+class ArrayLRUCache(object):
+    def __init__(self, max_bytes):
+        """
+        Least recently used cache of numpy arrays bounded by their total size in bytes. The cached arrays are
+        read-only, copy them before in-place edits. Each DataLoader worker fills its own cache.
+        Args:
+            max_bytes: 0 to disable the cache
+        """
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self._arrays = collections.OrderedDict()
+
+    def __getstate__(self):
+        d = dict(self.__dict__)
+        d['num_bytes'] = 0
+        d['_arrays'] = collections.OrderedDict()
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+
+    def __len__(self):
+        return len(self._arrays)
+
+    def get(self, key, load_func):
+        """
+        Args:
+            key:
+            load_func: function of key returning the array on a cache miss
+
+        Returns:
+            array:
+        """
+        if key in self._arrays:
+            self._arrays.move_to_end(key)
+            return self._arrays[key]
+
+        array = load_func(key)
+        if self.max_bytes <= 0 or array.nbytes > self.max_bytes:
+            return array
+        array.setflags(write=False)
+        self._arrays[key] = array
+        self.num_bytes += array.nbytes
+        while self.num_bytes > self.max_bytes:
+            _, old_array = self._arrays.popitem(last=False)
+            self.num_bytes -= old_array.nbytes
+        return array
@@ -0,0 +1,160 @@
+import pickle
+import shutil
+import time
+from pathlib import Path
+
+from . import common_utils, packed_utils
+
+# state of the shard workers, set once per process by _init_shard_worker instead of being pickled with every shard
+_shard_worker_data = {}
+
+
+def build_gt_database_shard(get_sample_objects, samples, shard_path, num_features, packed=False):
+    """
+    Build the gt database of one shard of samples. The db_infos fragment is written last, so that its existence
+    marks the shard as done
+    Args:
+        get_sample_objects: function of a sample returning the list of (name, gt_points, filepath, db_info) of
+            its objects, db_info is None for the objects of the unused classes
+        samples: samples of the shard
+        shard_path: path of the db_infos fragment, the packed points of the shard go to shard_path.bin
+        num_features:
+        packed:
+
+    Returns:
+        num_objects:
+    """
+    shard_path = Path(shard_path)
+    if packed:
+        packed_db_writer = packed_utils.PackedPointsWriter(shard_path.with_suffix('.bin'), num_features=num_features)
+
+    shard_db_infos = []
+    num_objects = 0
+    for sample in samples:
+        for name, gt_points, filepath, db_info in get_sample_objects(sample):
+            num_objects += 1
+            if packed:
+                packed_offset = packed_db_writer.add(gt_points)
+            else:
+                with open(filepath, 'w') as f:
+                    gt_points.tofile(f)
+
+            if db_info is not None:
+                if packed:
+                    # offsets are local to the shard until the shards are merged
+                    db_info.update({'packed_path': None, 'packed_offset': packed_offset})
+                shard_db_infos.append((name, db_info))
+    if packed:
+        packed_db_writer.close()
+
+    common_utils.dump_pickle_atomic(shard_db_infos, shard_path)
+    return num_objects
+
+
+def _init_shard_worker(get_sample_objects, num_features, packed):
+    _shard_worker_data.update({'get_sample_objects': get_sample_objects, 'num_features': num_features,
+                               'packed': packed})
+
+
+def _build_shard_in_worker(samples, shard_path):
+    return build_gt_database_shard(
+        _shard_worker_data['get_sample_objects'], samples, shard_path,
+        num_features=_shard_worker_data['num_features'], packed=_shard_worker_data['packed']
+    )
+
+
+def create_gt_database_sharded(get_sample_objects, samples, root_path, database_save_path, db_info_save_path,
+                               num_features, packed_db_path=None, num_workers=4, shard_size=64, resume=False):
+    """
+    Build the gt database with a process pool over shards of samples. Each shard writes a db_infos fragment into
+    db_info_save_path.shards/, an interrupted build is resumed from the finished shards. The fragments are merged
+    in the order of the samples, so the files are the same as the ones of a single-process build
+    Args:
+        get_sample_objects: picklable function, see build_gt_database_shard, it is sent once to each worker
+        samples: list of picklable samples
+        root_path:
+        database_save_path: directory of the per-object .bin files
+        db_info_save_path:
+        num_features: number of float32 values per point
+        packed_db_path: write the points of all objects into this blob instead of one file per object
+        num_workers: number of processes, 0 to build the shards in the current process
+        shard_size: number of samples per shard
+        resume: keep the shards of a previous build
+
+    Returns:
+        all_db_infos: dict, class name => list of db_info
+    """
+    import concurrent.futures as futures
+    import multiprocessing
+
+    packed = packed_db_path is not None
+    shard_dir = Path(str(db_info_save_path) + '.shards')
+    if not resume and shard_dir.exists():
+        shutil.rmtree(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    if not packed:
+        database_save_path.mkdir(parents=True, exist_ok=True)
+
+    shard_samples = [samples[k:k + shard_size] for k in range(0, len(samples), shard_size)]
+    shard_paths = [shard_dir / ('shard_%05d.pkl' % k) for k in range(len(shard_samples))]
+    todo_shards = [k for k in range(len(shard_samples)) if not shard_paths[k].exists()]
+    if len(todo_shards) < len(shard_samples):
+        print('gt_database: resume from %d/%d shards of %s' % (
+            len(shard_samples) - len(todo_shards), len(shard_samples), shard_dir
+        ))
+
+    start_time = time.time()
+    num_samples = 0
+    executor = None
+    if num_workers > 0:
+        # the tasks only carry the samples of their shard, the dataset behind get_sample_objects is not resent.
+        # spawned workers, a forked child of a process that ran the parallel numba kernels hangs at exit
+        executor = futures.ProcessPoolExecutor(
+            num_workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_shard_worker,
+            initargs=(get_sample_objects, num_features, packed)
+        )
+        shard_results = executor.map(
+            _build_shard_in_worker, [shard_samples[k] for k in todo_shards], [shard_paths[k] for k in todo_shards]
+        )
+    else:
+        shard_results = (build_gt_database_shard(get_sample_objects, shard_samples[k], shard_paths[k],
+                                                 num_features=num_features, packed=packed) for k in todo_shards)
+    try:
+        for k, num_objects in zip(todo_shards, shard_results):
+            num_samples += len(shard_samples[k])
+            print('gt_database shard: %d/%d, %d objects, %.1f samples/s' % (
+                k + 1, len(shard_samples), num_objects, num_samples / (time.time() - start_time)
+            ))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if packed:
+        packed_db_rel_path = str(Path(packed_db_path).relative_to(root_path))
+        packed_db_file = open(str(packed_db_path), 'wb')
+    all_db_infos = {}
+    row_offset = 0
+    for shard_path in shard_paths:
+        with open(shard_path, 'rb') as f:
+            shard_db_infos = pickle.load(f)
+        for name, db_info in shard_db_infos:
+            if packed:
+                start_row, num_rows = db_info['packed_offset']
+                db_info.update({'packed_path': packed_db_rel_path, 'packed_offset': (start_row + row_offset, num_rows)})
+            if name in all_db_infos:
+                all_db_infos[name].append(db_info)
+            else:
+                all_db_infos[name] = [db_info]
+        if packed:
+            with open(str(shard_path.with_suffix('.bin')), 'rb') as f:
+                shutil.copyfileobj(f, packed_db_file)
+            row_offset += shard_path.with_suffix('.bin').stat().st_size // (4 * num_features)
+    if packed:
+        packed_db_file.close()
+    for k, v in all_db_infos.items():
+        print('Database %s: %d' % (k, len(v)))
+
+    with open(db_info_save_path, 'wb') as f:
+        pickle.dump(all_db_infos, f)
+    shutil.rmtree(shard_dir)
+    return all_db_infos
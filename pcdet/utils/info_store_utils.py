@@ -0,0 +1,38 @@
+import pickle
+
+import numpy as np
+
+
+class SerializedInfoList(object):
+    def __init__(self, infos):
+        """
+        Read-only list of info dicts held in one flat uint8 buffer plus an int64 offset array. Unlike a list of
+        dicts, the two arrays have no per-object refcounts, so the pages shared with forked DataLoader workers are
+        never copied, and pickling the dataset into a worker only copies two buffers.
+        Indexing deserializes a fresh dict, which callers could modify without a deepcopy.
+        Args:
+            infos: list of info dicts
+        """
+        serialized = [np.frombuffer(pickle.dumps(info, protocol=pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+                      for info in infos]
+        self._addr = np.cumsum([len(x) for x in serialized], dtype=np.int64)
+        self._buffer = np.concatenate(serialized) if len(serialized) > 0 else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self._addr)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('info index %d out of range' % index)
+        start = 0 if index == 0 else self._addr[index - 1].item()
+        end = self._addr[index].item()
+        return pickle.loads(memoryview(self._buffer[start:end]))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def tolist(self):
+        return list(self)
@@ -92,9 +92,16 @@ class WeightedSmoothL1Loss(nn.Module):
         """
         super(WeightedSmoothL1Loss, self).__init__()
         self.beta = beta
+        self.code_weights = None
         if code_weights is not None:
-            self.code_weights = np.array(code_weights, dtype=np.float32)
-            self.code_weights = torch.from_numpy(self.code_weights).cuda()
+            # created on cpu and moved together with the module by _apply, like the anchors
+            self.code_weights = torch.from_numpy(np.array(code_weights, dtype=np.float32))
+
+    def _apply(self, fn, *args, **kwargs):
+        super()._apply(fn, *args, **kwargs)
+        if self.code_weights is not None:
+            self.code_weights = fn(self.code_weights)
+        return self
 
     @staticmethod
     def smooth_l1_loss(diff, beta):
@@ -144,9 +151,15 @@ class WeightedL1Loss(nn.Module):
                 Code-wise weights.
         """
         super(WeightedL1Loss, self).__init__()
+        self.code_weights = None
         if code_weights is not None:
-            self.code_weights = np.array(code_weights, dtype=np.float32)
-            self.code_weights = torch.from_numpy(self.code_weights).cuda()
+            self.code_weights = torch.from_numpy(np.array(code_weights, dtype=np.float32))
+
+    def _apply(self, fn, *args, **kwargs):
+        super()._apply(fn, *args, **kwargs)
+        if self.code_weights is not None:
+            self.code_weights = fn(self.code_weights)
+        return self
 
     def forward(self, input: torch.Tensor, target: torch.Tensor, weights: torch.Tensor = None):
         """
@@ -0,0 +1,94 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+
+class PackedPointsWriter(object):
+    def __init__(self, blob_path, num_features):
+        """
+        Append point clouds into one contiguous float32 blob
+        Args:
+            blob_path: path of the packed .bin file to create
+            num_features: number of float32 values per point
+        """
+        self.blob_path = Path(blob_path)
+        self.num_features = num_features
+        self.num_rows = 0
+        self.offsets = {}
+        self.blob_file = open(str(self.blob_path), 'wb')
+
+    def add(self, points, key=None):
+        """
+        Args:
+            points: (N, num_features)
+            key: optional key recorded in the offset index
+
+        Returns:
+            offset: (start_row, num_rows) of the points inside the blob
+        """
+        points = np.ascontiguousarray(points, dtype=np.float32).reshape(-1, self.num_features)
+        points.tofile(self.blob_file)
+        offset = (self.num_rows, points.shape[0])
+        self.num_rows += points.shape[0]
+        if key is not None:
+            self.offsets[key] = offset
+        return offset
+
+    def close(self, index_path=None):
+        self.blob_file.close()
+        index = {'num_features': self.num_features, 'num_rows': self.num_rows, 'offsets': self.offsets}
+        if index_path is not None:
+            with open(str(index_path), 'wb') as f:
+                pickle.dump(index, f)
+        return index
+
+
+class PackedPointsReader(object):
+    def __init__(self, blob_path, num_features, offsets=None):
+        """
+        Zero-copy reader of a packed float32 blob through np.memmap. The memmap is opened lazily so that the reader
+        can be pickled into DataLoader workers. Returned slices are read-only views, copy them before in-place edits.
+        Args:
+            blob_path: path of the packed .bin file
+            num_features: number of float32 values per point
+            offsets: optional dict, key => (start_row, num_rows)
+        """
+        self.blob_path = str(blob_path)
+        self.num_features = num_features
+        self.offsets = offsets if offsets is not None else {}
+        self._blob = None
+
+    @classmethod
+    def from_index_file(cls, blob_path, index_path):
+        with open(str(index_path), 'rb') as f:
+            index = pickle.load(f)
+        return cls(blob_path, num_features=index['num_features'], offsets=index['offsets'])
+
+    def __getstate__(self):
+        d = dict(self.__dict__)
+        d['_blob'] = None
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    @property
+    def blob(self):
+        if self._blob is None:
+            self._blob = np.memmap(self.blob_path, dtype=np.float32, mode='r').reshape(-1, self.num_features)
+        return self._blob
+
+    def get_slice(self, start, num_rows):
+        """
+        Returns:
+            points: (num_rows, num_features), a read-only view into the memory-mapped blob
+        """
+        return np.asarray(self.blob[start:start + num_rows])
+
+    def get(self, key):
+        start, num_rows = self.offsets[key]
+        return self.get_slice(start, num_rows)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the ROS helpers of tools/ are imported as in tools/inference.py, from the tools directory
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'tools'))
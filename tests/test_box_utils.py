@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from pcdet.ops.iou3d_nms import iou3d_nms_utils
+from pcdet.utils import box_utils
+
+
+def get_random_boxes(num_boxes, rng, extent=20.0):
+    boxes = np.zeros((num_boxes, 7), dtype=np.float32)
+    boxes[:, 0:2] = rng.uniform(-extent, extent, size=(num_boxes, 2))
+    boxes[:, 2] = rng.uniform(-2, 0, size=num_boxes)
+    boxes[:, 3:6] = rng.uniform(0.5, 5, size=(num_boxes, 3))
+    boxes[:, 6] = rng.uniform(-np.pi, np.pi, size=num_boxes)
+    return boxes
+
+
+def get_touching_mask(boxes_a, boxes_b, eps=2e-2):
+    """
+    Pairs whose overlap changes when the boxes are shrunk or enlarged by eps, their collision is numerically
+    ambiguous
+    """
+    shrunk_a, shrunk_b, large_a, large_b = boxes_a.copy(), boxes_b.copy(), boxes_a.copy(), boxes_b.copy()
+    shrunk_a[:, 3:5] -= eps
+    shrunk_b[:, 3:5] -= eps
+    large_a[:, 3:5] += eps
+    large_b[:, 3:5] += eps
+    shrunk_overlap = iou3d_nms_utils.boxes_bev_iou_cpu(shrunk_a, shrunk_b) > 0
+    large_overlap = iou3d_nms_utils.boxes_bev_iou_cpu(large_a, large_b) > 0
+    return shrunk_overlap != large_overlap
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_boxes_bev_collision_numpy_matches_bev_iou(seed):
+    rng = np.random.RandomState(seed)
+    boxes_a = get_random_boxes(60, rng)
+    boxes_b = get_random_boxes(40, rng)
+
+    collision = box_utils.boxes_bev_collision_numpy(boxes_a, boxes_b)
+    iou_collision = iou3d_nms_utils.boxes_bev_iou_cpu(boxes_a, boxes_b) > 0
+    valid = ~get_touching_mask(boxes_a, boxes_b)
+    assert iou_collision[valid].any()
+    np.testing.assert_array_equal(collision[valid], iou_collision[valid])
+
+
+def test_boxes_bev_collision_numpy_touching_and_empty():
+    boxes = np.array([
+        [0, 0, 0, 2, 2, 2, 0],
+        [2, 0, 0, 2, 2, 2, 0],  # shares an edge with the first box
+        [0.5, 0.5, 0, 1, 1, 1, np.pi / 4],  # inside the first box
+    ], dtype=np.float32)
+    collision = box_utils.boxes_bev_collision_numpy(boxes, boxes)
+    assert not collision[0, 1] and not collision[1, 0]
+    assert collision[0, 2] and collision[2, 0]
+    assert collision.diagonal().all()
+
+    assert box_utils.boxes_bev_collision_numpy(boxes, np.zeros((0, 7), dtype=np.float32)).shape == (3, 0)
+    assert box_utils.boxes_bev_collision_numpy(np.zeros((0, 7), dtype=np.float32), boxes).shape == (0, 3)
@@ -0,0 +1,76 @@
+import numpy as np
+
+from pcdet.utils import calibration_kitti
+from test_kitti_dataset import CALIB
+
+
+def cart_to_hom(pts):
+    return np.hstack((pts, np.ones((pts.shape[0], 1), dtype=np.float32)))
+
+
+def rect_to_lidar_baseline(calib, pts_rect):
+    """
+    The original Calibration.rect_to_lidar, inverting R0 V2C on every call
+    """
+    R0_ext = np.hstack((calib.R0, np.zeros((3, 1), dtype=np.float32)))
+    R0_ext = np.vstack((R0_ext, np.zeros((1, 4), dtype=np.float32)))
+    R0_ext[3, 3] = 1
+    V2C_ext = np.vstack((calib.V2C, np.zeros((1, 4), dtype=np.float32)))
+    V2C_ext[3, 3] = 1
+    return np.dot(cart_to_hom(pts_rect), np.linalg.inv(np.dot(R0_ext, V2C_ext).T))[:, 0:3]
+
+
+def lidar_to_rect_baseline(calib, pts_lidar):
+    return np.dot(cart_to_hom(pts_lidar), np.dot(calib.V2C.T, calib.R0.T))
+
+
+def rect_to_img_baseline(calib, pts_rect):
+    pts_rect_hom = cart_to_hom(pts_rect)
+    pts_2d_hom = np.dot(pts_rect_hom, calib.P2.T)
+    pts_img = (pts_2d_hom[:, 0:2].T / pts_rect_hom[:, 2]).T
+    return pts_img, pts_2d_hom[:, 2] - calib.P2.T[3, 2]
+
+
+def get_calib(tmp_path):
+    calib_file = tmp_path / '000000.txt'
+    calib_file.write_text(CALIB)
+    return calibration_kitti.Calibration(calib_file)
+
+
+def test_transforms_match_baseline(tmp_path):
+    calib = get_calib(tmp_path)
+    pts_lidar = np.random.RandomState(0).uniform([0, -40, -3], [70, 40, 1], size=(10000, 3)).astype(np.float32)
+
+    pts_rect = calib.lidar_to_rect(pts_lidar)
+    ref_pts_rect = lidar_to_rect_baseline(calib, pts_lidar)
+    assert pts_rect.shape == (10000, 3) and pts_rect.dtype == ref_pts_rect.dtype
+    assert np.allclose(pts_rect, ref_pts_rect, atol=1e-4)
+    assert np.allclose(calib.rect_to_lidar(pts_rect), rect_to_lidar_baseline(calib, pts_rect), atol=1e-4)
+    assert np.allclose(calib.rect_to_lidar(pts_rect), pts_lidar, atol=1e-3)
+
+    pts_img, pts_depth = calib.rect_to_img(pts_rect)
+    ref_pts_img, ref_pts_depth = rect_to_img_baseline(calib, pts_rect)
+    assert np.allclose(pts_img, ref_pts_img, rtol=1e-5, atol=1e-3) and np.allclose(pts_depth, ref_pts_depth, atol=1e-4)
+
+    # lidar_to_img composes the two transforms in one matmul
+    pts_img, pts_depth = calib.lidar_to_img(pts_lidar)
+    ref_pts_img, ref_pts_depth = rect_to_img_baseline(calib, ref_pts_rect)
+    assert np.allclose(pts_img, ref_pts_img, rtol=1e-5, atol=1e-3) and np.allclose(pts_depth, ref_pts_depth, atol=1e-4)
+
+
+def test_calib_from_info_and_update_matrices(tmp_path):
+    calib = get_calib(tmp_path)
+    calib_info = {'P2': np.concatenate([calib.P2, [[0., 0., 0., 1.]]], axis=0), 'R0_rect': np.eye(4),
+                  'Tr_velo_to_cam': np.concatenate([calib.V2C, [[0., 0., 0., 1.]]], axis=0)}
+    calib_info['R0_rect'][:3, :3] = calib.R0
+    info_calib = calibration_kitti.Calibration(calibration_kitti.get_calib_from_info(calib_info))
+    pts_lidar = np.random.RandomState(1).uniform([0, -40, -3], [70, 40, 1], size=(100, 3)).astype(np.float32)
+    assert np.array_equal(info_calib.lidar_to_rect(pts_lidar), calib.lidar_to_rect(pts_lidar))
+
+    # the composed transforms follow the modified matrices
+    info_calib.V2C = info_calib.V2C.copy()
+    info_calib.V2C[:, 3] += 1.0
+    info_calib.update_matrices()
+    assert np.allclose(info_calib.lidar_to_rect(pts_lidar), lidar_to_rect_baseline(info_calib, pts_lidar), atol=1e-4)
+    assert np.allclose(info_calib.lidar_to_img(pts_lidar)[0],
+                       rect_to_img_baseline(info_calib, lidar_to_rect_baseline(info_calib, pts_lidar))[0], atol=1e-3)
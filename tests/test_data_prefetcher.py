@@ -0,0 +1,54 @@
+import numpy as np
+import torch
+
+import pcdet.models
+from pcdet.models import DataPrefetcher, load_data_to_device
+
+
+def get_batch(k):
+    return {
+        'points': np.full((5, 5), k, dtype=np.float64),
+        'voxel_coords': np.full((3, 4), k, dtype=np.int32),
+        'gt_boxes_mask': np.ones(3, dtype=np.bool_),
+        'frame_id': np.array(['%06d' % k]),
+        'image_shape': np.array([[375, 1242]], dtype=np.int32),
+        'batch_size': 1,
+    }
+
+
+def test_load_data_to_device_keeps_integer_dtypes():
+    batch_dict = get_batch(3)
+    load_data_to_device(batch_dict, torch.device('cpu'), non_blocking=True)
+
+    assert batch_dict['points'].dtype == torch.float32
+    assert batch_dict['voxel_coords'].dtype == torch.int32
+    assert batch_dict['gt_boxes_mask'].dtype == torch.bool
+    assert (batch_dict['voxel_coords'] == 3).all()
+    assert isinstance(batch_dict['frame_id'], np.ndarray)
+    assert isinstance(batch_dict['image_shape'], np.ndarray)
+    assert batch_dict['batch_size'] == 1
+
+
+def test_data_prefetcher_cpu():
+    dataloader = [get_batch(k) for k in range(4)]
+    prefetcher = DataPrefetcher(dataloader, device='cpu')
+    assert prefetcher.stream is None and len(prefetcher) == 4
+
+    batches = list(prefetcher)
+    assert [int(x['voxel_coords'][0, 0]) for x in batches] == [0, 1, 2, 3]
+    assert all(isinstance(x['points'], torch.Tensor) for x in batches)
+    assert list(DataPrefetcher([], device='cpu')) == []
+
+
+def test_data_prefetcher_copies_next_batch_ahead(monkeypatch):
+    copied = []
+
+    def fake_load_data_to_device(batch_dict, device, non_blocking=False):
+        copied.append(int(batch_dict['voxel_coords'][0, 0]))
+
+    monkeypatch.setattr(pcdet.models, 'load_data_to_device', fake_load_data_to_device)
+    seen = []
+    for batch_dict in DataPrefetcher([get_batch(k) for k in range(3)], device='cpu'):
+        # the next batch is already copied when the current one is handed to the model
+        seen.append((int(batch_dict['voxel_coords'][0, 0]), list(copied)))
+    assert seen == [(0, [0, 1]), (1, [0, 1, 2]), (2, [0, 1, 2])]
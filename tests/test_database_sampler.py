@@ -0,0 +1,164 @@
+import copy
+import pickle
+
+import numpy as np
+import pytest
+from easydict import EasyDict
+
+from pcdet.datasets.augmentor.database_sampler import DataBaseSampler
+from pcdet.ops.iou3d_nms import iou3d_nms_utils
+from pcdet.utils import box_utils
+
+CLASS_NAMES = ['Car', 'Pedestrian']
+
+
+def write_db_infos(root_path, rng, num_infos=60, name='dbinfos.pkl'):
+    """
+    Per-object gt database of random Car and Pedestrian objects, in the format of create_groundtruth_database
+    """
+    database_path = root_path / 'gt_database'
+    database_path.mkdir(exist_ok=True)
+    all_db_infos = {}
+    for class_name, size in zip(CLASS_NAMES, [(3.9, 1.6, 1.5), (0.8, 0.6, 1.7)]):
+        db_infos = []
+        for k in range(num_infos):
+            num_points = rng.randint(0, 30)
+            box = np.concatenate((rng.uniform([-30, -30, -1], [30, 30, 0]), size, [rng.uniform(-np.pi, np.pi)]))
+            path = database_path / ('%s_%s_%d.bin' % (name, class_name, k))
+            (rng.uniform(-0.5, 0.5, size=(num_points, 4)).astype(np.float32)).tofile(str(path))
+            db_infos.append({
+                'name': class_name, 'path': str(path.relative_to(root_path)), 'image_idx': '%06d' % k, 'gt_idx': 0,
+                'box3d_lidar': box, 'num_points_in_gt': num_points, 'difficulty': rng.randint(-1, 3),
+                'bbox': rng.uniform(0, 100, size=4), 'score': -1.0
+            })
+        all_db_infos[class_name] = db_infos
+    with open(str(root_path / name), 'wb') as f:
+        pickle.dump(all_db_infos, f)
+    return all_db_infos
+
+
+def get_sampler_cfg(db_info_paths):
+    return EasyDict({
+        'DB_INFO_PATH': db_info_paths,
+        'PREPARE': {'filter_by_min_points': ['Car:5', 'Pedestrian:5'], 'filter_by_difficulty': [-1]},
+        'SAMPLE_GROUPS': ['Car:6', 'Pedestrian:4'],
+        'NUM_POINT_FEATURES': 4,
+        'DATABASE_WITH_FAKELIDAR': False,
+        'REMOVE_EXTRA_WIDTH': [0.0, 0.0, 0.0],
+        'LIMIT_WHOLE_SCENE': True
+    })
+
+
+def filter_list_of_dicts(db_infos):
+    """
+    filter_by_min_points and filter_by_difficulty of the list-of-dicts db_infos
+    """
+    return {key: [info for info in infos if info['num_points_in_gt'] >= 5 and info['difficulty'] != -1]
+            for key, infos in db_infos.items()}
+
+
+def sample_list_of_dicts(root_path, db_infos, sample_groups, data_dict):
+    """
+    gt sampling of the list-of-dicts db_infos, the original DataBaseSampler.__call__
+    """
+    gt_boxes, gt_names = data_dict['gt_boxes'], data_dict['gt_names'].astype(str)
+    existed_boxes = gt_boxes
+    total_valid_sampled_dict = []
+    for class_name, sample_group in sample_groups.items():
+        sample_group['sample_num'] = str(int(sample_group['class_num']) - np.sum(class_name == gt_names))
+        sample_num, pointer, indices = int(sample_group['sample_num']), sample_group['pointer'], sample_group['indices']
+        if sample_num <= 0:
+            continue
+        if pointer >= len(db_infos[class_name]):
+            indices = np.random.permutation(len(db_infos[class_name]))
+            pointer = 0
+        sampled_dict = [db_infos[class_name][idx] for idx in indices[pointer: pointer + sample_num]]
+        sample_group['pointer'], sample_group['indices'] = pointer + sample_num, indices
+
+        sampled_boxes = np.stack([x['box3d_lidar'] for x in sampled_dict], axis=0).astype(np.float32)
+        iou1 = iou3d_nms_utils.boxes_bev_iou_cpu(sampled_boxes[:, 0:7], existed_boxes[:, 0:7])
+        iou2 = iou3d_nms_utils.boxes_bev_iou_cpu(sampled_boxes[:, 0:7], sampled_boxes[:, 0:7])
+        iou2[range(sampled_boxes.shape[0]), range(sampled_boxes.shape[0])] = 0
+        iou1 = iou1 if iou1.shape[1] > 0 else iou2
+        valid_mask = ((iou1.max(axis=1) + iou2.max(axis=1)) == 0).nonzero()[0]
+        existed_boxes = np.concatenate((existed_boxes, sampled_boxes[valid_mask]), axis=0)
+        total_valid_sampled_dict.extend([sampled_dict[x] for x in valid_mask])
+
+    sampled_gt_boxes = existed_boxes[gt_boxes.shape[0]:, :]
+    obj_points_list = []
+    for info in total_valid_sampled_dict:
+        obj_points = np.fromfile(str(root_path / info['path']), dtype=np.float32).reshape(-1, 4)
+        obj_points[:, :3] += info['box3d_lidar'][:3]
+        obj_points_list.append(obj_points)
+    points = box_utils.remove_points_in_boxes3d(data_dict['points'], sampled_gt_boxes[:, 0:7])
+    points = np.concatenate(obj_points_list + [points], axis=0)
+    gt_names = np.concatenate([gt_names, [x['name'] for x in total_valid_sampled_dict]], axis=0)
+    return np.concatenate([gt_boxes, sampled_gt_boxes], axis=0), gt_names, points
+
+
+def test_infos_to_columns():
+    infos = [{'name': 'Car', 'box3d_lidar': np.arange(7) + k, 'num_points_in_gt': k, 'packed_offset': (k, 2)}
+             for k in range(5)]
+    columns = DataBaseSampler.infos_to_columns(infos)
+    assert DataBaseSampler.get_num_infos(columns) == 5
+    for k, info in enumerate(infos):
+        for key, val in info.items():
+            assert np.array_equal(columns[key][k], val)
+    assert columns['box3d_lidar'].shape == (5, 7) and columns['packed_offset'].shape == (5, 2)
+    assert DataBaseSampler.infos_to_columns([]) == {}
+
+    infos[3].pop('packed_offset')
+    with pytest.raises(ValueError, match='different keys'):
+        DataBaseSampler.infos_to_columns(infos)
+
+
+def test_filters_and_sampling_match_list_of_dicts(tmp_path):
+    rng = np.random.RandomState(0)
+    db_infos = filter_list_of_dicts(write_db_infos(tmp_path, rng))
+    sampler = DataBaseSampler(tmp_path, get_sampler_cfg(['dbinfos.pkl']), CLASS_NAMES)
+    for class_name in CLASS_NAMES:
+        assert 0 < sampler.get_num_infos(sampler.db_infos[class_name]) == len(db_infos[class_name])
+        for key in ['path', 'box3d_lidar', 'num_points_in_gt', 'difficulty']:
+            assert np.array_equal(sampler.db_infos[class_name][key], [info[key] for info in db_infos[class_name]])
+
+    sample_groups = {name: {'class_num': num, 'pointer': len(db_infos[name]), 'indices': np.arange(len(db_infos[name]))}
+                     for name, num in [('Car', 6), ('Pedestrian', 4)]}
+    # enough calls to go around the shuffled db_infos several times
+    for k in range(40):
+        data_dict = {
+            'gt_boxes': np.array([[0, 0, -0.5, 3.9, 1.6, 1.5, 0.3]], dtype=np.float32),
+            'gt_names': np.array(['Car']), 'gt_boxes_mask': np.array([True]),
+            'points': rng.uniform([-30, -30, -2, 0], [30, 30, 1, 1], size=(2000, 4)).astype(np.float32)
+        }
+        np.random.seed(k)
+        ref_gt_boxes, ref_gt_names, ref_points = sample_list_of_dicts(tmp_path, db_infos, sample_groups,
+                                                                      copy.deepcopy(data_dict))
+        np.random.seed(k)
+        data_dict = sampler(data_dict)
+        assert np.array_equal(data_dict['gt_boxes'], ref_gt_boxes)
+        assert data_dict['gt_names'].tolist() == ref_gt_names.tolist()
+        assert np.array_equal(data_dict['points'], ref_points)
+    assert data_dict['gt_boxes'].shape[0] > 1
+
+
+def test_mixed_packed_and_per_file_db_infos(tmp_path):
+    rng = np.random.RandomState(1)
+    write_db_infos(tmp_path, rng, name='dbinfos.pkl')
+    packed_db_infos = write_db_infos(tmp_path, rng, name='dbinfos_packed.pkl')
+    for infos in packed_db_infos.values():
+        for k, info in enumerate(infos):
+            info.update({'packed_path': 'gt_database_packed.bin', 'packed_offset': (k, 1)})
+    with open(str(tmp_path / 'dbinfos_packed.pkl'), 'wb') as f:
+        pickle.dump(packed_db_infos, f)
+
+    with pytest.raises(ValueError, match='different keys'):
+        DataBaseSampler(tmp_path, get_sampler_cfg(['dbinfos.pkl', 'dbinfos_packed.pkl']), CLASS_NAMES)
+
+    # packed Car and per-file Pedestrian db_infos, each class is consistent but the sampled rows are not
+    with open(str(tmp_path / 'dbinfos_packed.pkl'), 'wb') as f:
+        pickle.dump({'Car': packed_db_infos['Car'], 'Pedestrian': []}, f)
+    db_infos = write_db_infos(tmp_path, rng, name='dbinfos_pedestrian.pkl')
+    with open(str(tmp_path / 'dbinfos_pedestrian.pkl'), 'wb') as f:
+        pickle.dump({'Car': [], 'Pedestrian': db_infos['Pedestrian']}, f)
+    with pytest.raises(ValueError, match='mixes db_infos'):
+        DataBaseSampler(tmp_path, get_sampler_cfg(['dbinfos_packed.pkl', 'dbinfos_pedestrian.pkl']), CLASS_NAMES)
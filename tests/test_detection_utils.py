@@ -0,0 +1,115 @@
+import math
+
+import numpy as np
+
+from ros_utils import detection_utils
+
+
+def rotz(t):
+    c = np.cos(t)
+    s = np.sin(t)
+    return np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+
+
+def sort_corners_per_object(box, x_offset):
+    """
+    Location and corners of one bev_obstacle, the original per-object loop of anno_to_sort in tools/inference.py
+    """
+    rotation = box[6]
+    if rotation > math.pi:
+        rotation = rotation - math.pi
+    R = rotz(-rotation)
+    l, w = float(box[3]), float(box[4])
+    location_x = -float(box[1])
+    location_y = -(float(box[0]) - x_offset)
+    x_corners = [-l / 2, -l / 2, l / 2, l / 2]
+    y_corners = [w / 2, -w / 2, w / 2, -w / 2]
+    corners_3d = np.dot(R, np.vstack([x_corners, y_corners, [0, 0, 0, 0]]))[0:2]
+    corners_3d = corners_3d + np.vstack([location_x, location_y])
+    return [location_x, location_y], corners_3d.T, rotation
+
+
+def sort_3d_corners_per_object(box, x_offset):
+    """
+    Location and corners of one bev_obstacle_3D, the original per-object loop of anno_to_3Dsort
+    """
+    rotation = box[6]
+    if rotation > math.pi:
+        rotation = rotation - math.pi
+    R = rotz(rotation)
+    l, w, h = float(box[3]), float(box[4]), float(box[5])
+    location = [float(box[0]) - x_offset, float(box[1]), float(box[2])]
+    x_corners = [-l / 2, -l / 2, l / 2, l / 2, -l / 2, -l / 2, l / 2, l / 2]
+    y_corners = [w / 2, -w / 2, w / 2, -w / 2, w / 2, -w / 2, w / 2, -w / 2]
+    z_corners = [-h / 2, -h / 2, -h / 2, -h / 2, h / 2, h / 2, h / 2, h / 2]
+    corners_3d = np.dot(R, np.vstack([x_corners, y_corners, z_corners])) + np.vstack(location)
+    return location, corners_3d.T, rotation
+
+
+def sort_by_distance_per_object(boxes, scores, threshold, x_offset):
+    """
+    The original sortbydistance, with np.append of one row per object
+    """
+    index = np.where(scores < threshold)
+    annos = np.delete(np.copy(boxes), obj=index, axis=0)
+    scores_over_threshold = np.delete(np.copy(scores), obj=index, axis=0)
+    arr = np.empty((0, 2), float)
+    for i in range(len(annos)):
+        x_lidar = float(annos[i][0]) - x_offset
+        y_lidar = float(annos[i][1])
+        arr = np.append(arr, np.array([[np.sqrt(x_lidar ** 2 + y_lidar ** 2), np.arctan2(y_lidar, x_lidar)]]), axis=0)
+    annos_with_distance = np.append(annos, arr, axis=1)
+    annos_with_distance = np.append(annos_with_distance, scores_over_threshold.reshape((-1, 1)), axis=1)
+    return annos_with_distance[annos_with_distance[:, -3].argsort()]
+
+
+def get_random_boxes(num_boxes, rng):
+    boxes = rng.uniform(-40, 40, size=(num_boxes, 7)).astype(np.float32)
+    boxes[:, 3:6] = rng.uniform(0.5, 5, size=(num_boxes, 3))
+    # headings of the models are not limited to [-pi, pi]
+    boxes[:, 6] = rng.uniform(-np.pi, 2 * np.pi, size=num_boxes)
+    return boxes
+
+
+def test_sort_corners_match_per_object_loops():
+    boxes = get_random_boxes(200, np.random.RandomState(0))
+    assert (boxes[:, 6] > np.pi).any()
+    locations, corners, rotations = detection_utils.get_sort_corners(boxes, x_offset=20)
+    locations_3d, corners_3d, rotations_3d = detection_utils.get_3d_sort_corners(boxes, x_offset=20)
+    for i, box in enumerate(boxes):
+        ref_location, ref_corners, ref_rotation = sort_corners_per_object(box, x_offset=20)
+        assert np.allclose(locations[i], ref_location) and rotations[i] == ref_rotation
+        assert np.allclose(corners[i], ref_corners, atol=1e-4)
+
+        ref_location, ref_corners, ref_rotation = sort_3d_corners_per_object(box, x_offset=20)
+        assert np.allclose(locations_3d[i], ref_location) and rotations_3d[i] == ref_rotation
+        assert np.allclose(corners_3d[i], ref_corners, atol=1e-4)
+
+    for func, corners_shape in [(detection_utils.get_sort_corners, (0, 4, 2)),
+                                (detection_utils.get_3d_sort_corners, (0, 8, 3))]:
+        locations, corners, rotations = func(boxes[:0], x_offset=20)
+        assert corners.shape == corners_shape and rotations.shape == (0,)
+
+
+def test_yaw_to_quaternions():
+    yaw = get_random_boxes(50, np.random.RandomState(1))[:, 6].astype(np.float64)
+    quaternions = detection_utils.yaw_to_quaternions(yaw)
+    # Quaternion(axis=[0, 0, 1], radians=yaw) of pyquaternion, as [w, x, y, z]
+    expected = np.stack([np.cos(yaw / 2), np.zeros_like(yaw), np.zeros_like(yaw), np.sin(yaw / 2)], axis=1)
+    assert np.allclose(quaternions, expected)
+    assert np.allclose(np.linalg.norm(quaternions, axis=1), 1)
+
+
+def test_sort_by_distance_matches_per_object_loop():
+    rng = np.random.RandomState(2)
+    boxes = get_random_boxes(300, rng)
+    scores = rng.uniform(size=300).astype(np.float32)
+    scores[:10] = 0.5  # on the threshold, kept as before
+    annos_sorted, order = detection_utils.sort_by_distance(boxes, scores, 0.5, x_offset=20)
+    expected = sort_by_distance_per_object(boxes, scores, 0.5, x_offset=20)
+    assert annos_sorted.shape == expected.shape and annos_sorted.shape[1] == 10
+    assert np.allclose(annos_sorted, expected, atol=1e-4)
+    assert np.array_equal(boxes[order], annos_sorted[:, 0:7]) and np.array_equal(scores[order], annos_sorted[:, -1])
+
+    annos_sorted, order = detection_utils.sort_by_distance(boxes, scores, 2.0, x_offset=20)
+    assert annos_sorted.shape == (0, 10) and order.shape == (0,)
@@ -0,0 +1,95 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from pcdet.ops.roiaware_pool3d import roiaware_pool3d_utils
+from pcdet.utils import gt_database_utils
+
+
+class SampleObjects(object):
+    """
+    Picklable get_sample_objects of fake samples, each unpickling is recorded in log_path
+    """
+    def __init__(self, database_save_path, log_path):
+        self.database_save_path = database_save_path
+        self.log_path = log_path
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        with open(str(self.log_path), 'a') as f:
+            f.write('unpickled\n')
+
+    def __call__(self, sample):
+        rng = np.random.RandomState(sample)
+        objects = []
+        for i in range(sample % 3 + 1):
+            name = ['Car', 'Pedestrian', 'DontCare'][i]
+            gt_points = rng.uniform(size=(rng.randint(0, 20), 4)).astype(np.float32)
+            filepath = self.database_save_path / ('%d_%s_%d.bin' % (sample, name, i))
+            db_info = None if name == 'DontCare' else {'name': name, 'image_idx': sample, 'gt_idx': i,
+                                                       'num_points_in_gt': gt_points.shape[0]}
+            objects.append((name, gt_points, filepath, db_info))
+        return objects
+
+
+def build_database(tmp_path, num_workers, packed):
+    root_path = tmp_path / ('workers_%d' % num_workers)
+    database_save_path = root_path / 'gt_database'
+    root_path.mkdir()
+    get_sample_objects = SampleObjects(database_save_path, tmp_path / 'unpickled.log')
+    all_db_infos = gt_database_utils.create_gt_database_sharded(
+        get_sample_objects, list(range(40)), root_path=root_path, database_save_path=database_save_path,
+        db_info_save_path=root_path / 'dbinfos.pkl', num_features=4,
+        packed_db_path=root_path / 'gt_database_packed.bin' if packed else None, num_workers=num_workers,
+        shard_size=3
+    )
+    with open(str(root_path / 'dbinfos.pkl'), 'rb') as f:
+        assert pickle.load(f) == all_db_infos
+    if packed:
+        files = {'packed': (root_path / 'gt_database_packed.bin').read_bytes()}
+    else:
+        files = {path.name: path.read_bytes() for path in database_save_path.iterdir()}
+    return all_db_infos, files
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_sharded_database_is_independent_of_workers(tmp_path, packed):
+    db_infos, files = build_database(tmp_path, 0, packed)
+    assert set(db_infos.keys()) == {'Car', 'Pedestrian'}
+    for name, infos in db_infos.items():
+        for info in infos:
+            info.pop('packed_path', None)
+
+    # the parallel numba kernels of the gt sampling have started their threads in this process before the pool
+    roiaware_pool3d_utils.points_in_boxes_idx_cpu(np.zeros((100, 3), dtype=np.float32),
+                                                  np.array([[0, 0, 0, 1, 1, 1, 0]], dtype=np.float32))
+    worker_db_infos, worker_files = build_database(tmp_path, 2, packed)
+    for name, infos in worker_db_infos.items():
+        for info in infos:
+            info.pop('packed_path', None)
+    assert worker_db_infos == db_infos
+    assert worker_files == files
+
+    # get_sample_objects reaches each worker once instead of with each of the 14 shards
+    log_path = tmp_path / 'unpickled.log'
+    num_unpickled = len(log_path.read_text().split()) if log_path.exists() else 0
+    assert num_unpickled <= 2
+
+
+def test_points_in_boxes_margin():
+    boxes = np.array([[0, 0, 0, 2, 4, 2, 0], [5, 5, 0, 2, 2, 2, np.pi / 4]], dtype=np.float32)
+    points = np.array([
+        [1.005, 0, 0],  # 5e-3 outside the x face of box 0
+        [0.99, 1.99, 0.5],
+        [0, 2.00001, 0],  # 1e-5 outside the y face of box 0
+        [5, 5, 1.5],  # above box 1
+        [3, 3, 0],
+    ], dtype=np.float32)
+    box_idxs = roiaware_pool3d_utils.points_in_boxes_idx_cpu(points, boxes)
+    assert box_idxs.tolist() == [0, 0, 0, -1, -1]
+    box_idxs = roiaware_pool3d_utils.points_in_boxes_idx_cpu(points, boxes, margin=1e-5)
+    assert box_idxs.tolist() == [-1, 0, -1, -1, -1]
+
+    point_idxs, box_idxs = roiaware_pool3d_utils.points_in_boxes_sparse_cpu(points, boxes, margin=1e-5)
+    assert point_idxs.tolist() == [1] and box_idxs.tolist() == [0]
@@ -0,0 +1,56 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from pcdet.utils import info_store_utils
+
+
+def get_infos(num_infos, rng):
+    return [{'point_cloud': {'lidar_idx': '%06d' % k}, 'annos': {
+        'name': np.array(['Car'] * (k % 4)), 'gt_boxes_lidar': rng.uniform(size=(k % 4, 7))
+    }} for k in range(num_infos)]
+
+
+def assert_infos_equal(info, ref_info):
+    assert info['point_cloud'] == ref_info['point_cloud']
+    for key, val in ref_info['annos'].items():
+        assert np.array_equal(info['annos'][key], val)
+
+
+def test_serialized_info_list():
+    infos = get_infos(10, np.random.RandomState(0))
+    info_list = info_store_utils.SerializedInfoList(infos)
+    assert len(info_list) == 10
+    for k in [0, 3, 9, -1, -10]:
+        assert_infos_equal(info_list[k], infos[k])
+    for k in [10, -11]:
+        with pytest.raises(IndexError):
+            info_list[k]
+
+    # a fresh dict per indexing, the modifications of the caller are not stored
+    info_list[2]['annos']['gt_boxes_lidar'][:] = 0
+    info_list[2]['point_cloud']['lidar_idx'] = 'modified'
+    assert_infos_equal(info_list[2], infos[2])
+
+    for info, ref_info in zip(info_list, infos):
+        assert_infos_equal(info, ref_info)
+    assert len(list(info_list)) == len(info_list.tolist()) == 10
+
+    # pickled into the DataLoader workers as the two buffers
+    worker_info_list = pickle.loads(pickle.dumps(info_list))
+    assert np.array_equal(worker_info_list._buffer, info_list._buffer)
+    for k in range(10):
+        assert_infos_equal(worker_info_list[k], infos[k])
+
+    # the infos of several files are appended by rebuilding the list
+    info_list = info_store_utils.SerializedInfoList(list(info_list) + infos[:2])
+    assert len(info_list) == 12
+    assert_infos_equal(info_list[11], infos[1])
+
+
+def test_empty_serialized_info_list():
+    info_list = info_store_utils.SerializedInfoList([])
+    assert len(info_list) == 0 and list(info_list) == []
+    with pytest.raises(IndexError):
+        info_list[0]
@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+import torch
+
+from pcdet.ops.iou3d_nms import iou3d_nms_utils
+
+requires_cuda_ops = pytest.mark.skipif(
+    iou3d_nms_utils.iou3d_nms_cuda is None or not torch.cuda.is_available(), reason='iou3d_nms_cuda is not built'
+)
+
+
+def get_random_boxes(num_boxes, rng, xy_range=6.0):
+    boxes = np.zeros((num_boxes, 7), dtype=np.float32)
+    boxes[:, 0:2] = rng.uniform(-xy_range, xy_range, size=(num_boxes, 2))
+    boxes[:, 2] = rng.uniform(-1, 1, size=num_boxes)
+    boxes[:, 3:6] = rng.uniform(0.5, 4, size=(num_boxes, 3))
+    boxes[:, 6] = rng.uniform(-np.pi, np.pi, size=num_boxes)
+    return torch.from_numpy(boxes)
+
+
+def grid_overlap_bev(box_a, box_b, resolution=0.01):
+    """
+    BEV overlap of two boxes counted on a regular grid of points
+    """
+    extent = max(box_a[3:5].norm(), box_b[3:5].norm()) / 2 + resolution
+    center = box_a[0:2]
+    xs = torch.arange(-extent, extent, resolution) + resolution / 2
+    grid = torch.stack(torch.meshgrid(xs, xs), dim=-1).view(1, -1, 2) + center
+    boxes = torch.stack((box_a, box_b), dim=0)
+    in_flag = iou3d_nms_utils.points_in_boxes_bev_torch(grid.expand(2, -1, -1), boxes, margin=0)
+    return (in_flag[0] & in_flag[1]).sum().item() * resolution ** 2
+
+
+def greedy_nms(iou_matrix, thresh):
+    keep = []
+    for i in range(iou_matrix.shape[0]):
+        if all(iou_matrix[i, j] <= thresh for j in keep):
+            keep.append(i)
+    return keep
+
+
+def test_boxes_iou_bev_analytic():
+    boxes = torch.tensor([
+        [0, 0, 0, 2, 2, 1, 0],
+        [0, 0, 0, 2, 2, 1, np.pi / 2],  # same square rotated by 90 degrees
+        [1, 0, 0, 2, 2, 1, 0],  # shifted by half a side
+        [0, 0, 0, 2, 2, 1, np.pi / 4],  # octagon of area 8 * (sqrt(2) - 1)
+        [10, 10, 0, 2, 2, 1, 0.3],  # disjoint
+    ], dtype=torch.float32)
+    iou = iou3d_nms_utils.boxes_iou_bev(boxes[0:1], boxes)[0]
+    octagon = 8 * (np.sqrt(2) - 1)
+    expected = torch.tensor([1, 1, 2 / 6, octagon / (8 - octagon), 0], dtype=torch.float32)
+    assert torch.allclose(iou, expected, atol=1e-5)
+
+
+def test_boxes_iou3d_analytic():
+    boxes_a = torch.tensor([[0, 0, 0, 2, 2, 2, 0]], dtype=torch.float32)
+    boxes_b = torch.tensor([
+        [0, 0, 1, 2, 2, 2, 0],  # half of the height
+        [1, 1, 1, 2, 2, 2, 0],  # an eighth of the volume
+        [0, 0, 3, 2, 2, 2, 0],  # touching faces
+    ], dtype=torch.float32)
+    iou3d = iou3d_nms_utils.boxes_iou3d_gpu(boxes_a, boxes_b)[0]
+    assert torch.allclose(iou3d, torch.tensor([4 / 12, 1 / 15, 0], dtype=torch.float32), atol=1e-5)
+
+
+def test_boxes_overlap_bev_matches_grid_count():
+    rng = np.random.RandomState(0)
+    boxes_a, boxes_b = get_random_boxes(30, rng, xy_range=1.5), get_random_boxes(30, rng, xy_range=1.5)
+    overlaps = iou3d_nms_utils.boxes_overlap_bev_cpu(boxes_a, boxes_b)
+    for i in range(boxes_a.shape[0]):
+        expected = grid_overlap_bev(boxes_a[i], boxes_b[i])
+        assert abs(overlaps[i, i].item() - expected) < 0.02 * max(expected, 1)
+
+
+def test_boxes_iou_bev_without_heading_matches_normal_iou():
+    rng = np.random.RandomState(1)
+    boxes_a, boxes_b = get_random_boxes(60, rng, xy_range=3), get_random_boxes(80, rng, xy_range=3)
+    boxes_a[:, 6] = 0
+    boxes_b[:, 6] = 0
+    iou = iou3d_nms_utils.boxes_iou_bev(boxes_a, boxes_b)
+    assert (iou > 0).any()
+    # as in the cuda kernel, the corners within 1e-2 of the other box count as inside it
+    assert torch.allclose(iou, iou3d_nms_utils.boxes_iou_normal_cpu(boxes_a, boxes_b), atol=1e-2)
+
+
+def test_boxes_overlap_bev_chunks():
+    rng = np.random.RandomState(2)
+    boxes_a, boxes_b = get_random_boxes(50, rng), get_random_boxes(70, rng)
+    overlaps = iou3d_nms_utils.boxes_overlap_bev_cpu(boxes_a, boxes_b)
+    assert torch.equal(overlaps, iou3d_nms_utils.boxes_overlap_bev_cpu(boxes_a, boxes_b, max_pairs_per_chunk=1))
+    assert iou3d_nms_utils.boxes_overlap_bev_cpu(boxes_a[:0], boxes_b).shape == (0, 70)
+
+
+@pytest.mark.parametrize('nms_type', ['nms_gpu', 'nms_normal_gpu'])
+def test_nms_cpu_matches_greedy_nms(nms_type):
+    rng = np.random.RandomState(3)
+    boxes = get_random_boxes(200, rng)
+    scores = torch.from_numpy(rng.permutation(200).astype(np.float32))
+    keep, _ = getattr(iou3d_nms_utils, nms_type)(boxes, scores, 0.1)
+
+    order = scores.argsort(descending=True)
+    sorted_boxes = boxes[order]
+    if nms_type == 'nms_gpu':
+        iou = iou3d_nms_utils.boxes_iou_bev(sorted_boxes, sorted_boxes)
+    else:
+        iou = iou3d_nms_utils.boxes_iou_normal_cpu(sorted_boxes, sorted_boxes)
+    assert keep.tolist() == order[greedy_nms(iou, 0.1)].tolist()
+    assert 0 < keep.shape[0] < 200
+
+
+@pytest.mark.parametrize('normal', [False, True])
+def test_sparse_nms_cpu(normal):
+    rng = np.random.RandomState(6)
+    boxes = get_random_boxes(3000, rng, xy_range=60)
+    scores = torch.from_numpy(rng.permutation(3000).astype(np.float32))
+    nms_func = iou3d_nms_utils.nms_normal_gpu if normal else iou3d_nms_utils.nms_gpu
+    keep, _ = nms_func(boxes, scores, 0.1)
+
+    order = scores.argsort(descending=True)
+    chunked_keep = iou3d_nms_utils.nms_cpu(boxes[order], 0.1, normal=normal, max_pairs_per_chunk=100000)
+    assert keep.tolist() == order[chunked_keep].tolist()
+    assert 0 < keep.shape[0] < 3000
+
+    # the pre-NMS cap is applied before any IoU is computed
+    top_keep, _ = nms_func(boxes, scores, 0.1, pre_maxsize=500)
+    assert top_keep.tolist() == order[iou3d_nms_utils.nms_cpu(boxes[order[:500]], 0.1, normal=normal)].tolist()
+    assert nms_func(boxes[:0], scores[:0], 0.1)[0].shape == (0, )
+
+
+@requires_cuda_ops
+def test_boxes_iou_matches_cuda_kernels():
+    rng = np.random.RandomState(4)
+    boxes_a, boxes_b = get_random_boxes(300, rng), get_random_boxes(400, rng)
+    iou_bev = iou3d_nms_utils.boxes_iou_bev(boxes_a, boxes_b)
+    assert torch.allclose(iou_bev, iou3d_nms_utils.boxes_iou_bev(boxes_a.cuda(), boxes_b.cuda()).cpu(), atol=1e-4)
+
+    ans_iou = boxes_a.new_zeros((300, 400))
+    iou3d_nms_utils.iou3d_nms_cuda.boxes_iou_bev_cpu(boxes_a.contiguous(), boxes_b.contiguous(), ans_iou)
+    assert torch.allclose(iou_bev, ans_iou, atol=1e-4)
+
+    iou3d = iou3d_nms_utils.boxes_iou3d_gpu(boxes_a, boxes_b)
+    assert torch.allclose(iou3d, iou3d_nms_utils.boxes_iou3d_gpu(boxes_a.cuda(), boxes_b.cuda()).cpu(), atol=1e-4)
+
+
+@requires_cuda_ops
+@pytest.mark.parametrize('nms_type', ['nms_gpu', 'nms_normal_gpu'])
+def test_nms_matches_cuda_kernels(nms_type):
+    rng = np.random.RandomState(5)
+    boxes = get_random_boxes(500, rng)
+    scores = torch.from_numpy(rng.permutation(500).astype(np.float32))
+    keep, _ = getattr(iou3d_nms_utils, nms_type)(boxes, scores, 0.1)
+    cuda_keep, _ = getattr(iou3d_nms_utils, nms_type)(boxes.cuda(), scores.cuda(), 0.1)
+    assert keep.tolist() == cuda_keep.cpu().tolist()
@@ -0,0 +1,134 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+import yaml
+from easydict import EasyDict
+from skimage import io
+
+from pcdet.datasets.kitti.kitti_dataset import KittiDataset
+from pcdet.utils import box_utils
+
+CFG_PATH = Path(__file__).resolve().parents[1] / 'tools' / 'cfgs' / 'dataset_configs' / 'kitti_dataset.yaml'
+CLASS_NAMES = ['Car', 'Pedestrian', 'Cyclist']
+
+# calibration of the KITTI object sample 000000
+CALIB = """P0: 7.215377e+02 0.000000e+00 6.095593e+02 0.000000e+00 0.000000e+00 7.215377e+02 1.728540e+02 0.000000e+00 0.000000e+00 0.000000e+00 1.000000e+00 0.000000e+00
+P1: 7.215377e+02 0.000000e+00 6.095593e+02 -3.875744e+02 0.000000e+00 7.215377e+02 1.728540e+02 0.000000e+00 0.000000e+00 0.000000e+00 1.000000e+00 0.000000e+00
+P2: 7.215377e+02 0.000000e+00 6.095593e+02 4.485728e+01 0.000000e+00 7.215377e+02 1.728540e+02 2.163791e-01 0.000000e+00 0.000000e+00 1.000000e+00 2.745884e-03
+P3: 7.215377e+02 0.000000e+00 6.095593e+02 -3.395242e+02 0.000000e+00 7.215377e+02 1.728540e+02 2.199936e+00 0.000000e+00 0.000000e+00 1.000000e+00 2.729905e-03
+R0_rect: 9.999239e-01 9.837760e-03 -7.445048e-03 -9.869795e-03 9.999421e-01 -4.278459e-03 7.402527e-03 4.351614e-03 9.999631e-01
+Tr_velo_to_cam: 7.533745e-03 -9.999714e-01 -6.166020e-04 -4.069766e-03 1.480249e-02 7.280733e-04 -9.998902e-01 -7.631618e-02 9.998621e-01 7.523790e-03 1.480755e-02 -2.717806e-01
+Tr_imu_to_velo: 9.999976e-01 7.553071e-04 -2.035826e-03 -8.086759e-01 -7.854027e-04 9.998898e-01 -1.482298e-02 3.195559e-01 2.024406e-03 1.482454e-02 9.998881e-01 -7.997231e-01
+"""
+
+
+def write_kitti_samples(root_path, num_samples, rng):
+    """
+    KITTI training split of num_samples random scenes, with a few labeled objects in front of the camera
+    """
+    split_path = root_path / 'training'
+    for name in ['velodyne', 'image_2', 'calib', 'label_2']:
+        (split_path / name).mkdir(parents=True)
+    sample_ids = ['%06d' % k for k in range(num_samples)]
+    for sample_idx in sample_ids:
+        points = rng.uniform([2, -15, -2.5, 0], [35, 15, 1, 1], size=(30000, 4)).astype(np.float32)
+        points.tofile(str(split_path / 'velodyne' / ('%s.bin' % sample_idx)))
+        io.imsave(str(split_path / 'image_2' / ('%s.png' % sample_idx)), np.zeros((375, 1242, 3), dtype=np.uint8),
+                  check_contrast=False)
+        (split_path / 'calib' / ('%s.txt' % sample_idx)).write_text(CALIB)
+
+        lines = []
+        for name, (h, w, l) in zip(CLASS_NAMES, [(1.5, 1.6, 3.9), (1.7, 0.6, 0.8), (1.7, 0.6, 1.8)]):
+            x, z, ry = rng.uniform(-5, 5), rng.uniform(8, 30), rng.uniform(-np.pi, np.pi)
+            lines.append('%s 0.00 0 0.0 100.0 150.0 200.0 250.0 %.2f %.2f %.2f %.2f 1.60 %.2f %.2f' % (
+                name, h, w, l, x, z, ry
+            ))
+        lines.append('DontCare -1 -1 -10 503.89 169.71 590.61 190.13 -1 -1 -1 -1000 -1000 -1000 -10')
+        (split_path / 'label_2' / ('%s.txt' % sample_idx)).write_text('\n'.join(lines) + '\n')
+    return sample_ids
+
+
+def get_dataset(root_path):
+    with open(CFG_PATH, 'r') as f:
+        dataset_cfg = EasyDict(yaml.safe_load(f))
+    return KittiDataset(dataset_cfg=dataset_cfg, class_names=CLASS_NAMES, training=False, root_path=root_path)
+
+
+def test_num_points_in_gt_matches_in_hull(tmp_path):
+    sample_ids = write_kitti_samples(tmp_path, 3, np.random.RandomState(0))
+    dataset = get_dataset(tmp_path)
+    infos = dataset.get_infos(num_workers=2, sample_id_list=sample_ids)
+    assert [info['point_cloud']['lidar_idx'] for info in infos] == sample_ids
+
+    for info in infos:
+        # per-object count of the points of the camera field of view inside the box corners, as before
+        sample_idx = info['point_cloud']['lidar_idx']
+        calib = dataset.get_calib(sample_idx)
+        points = dataset.get_lidar(sample_idx)
+        fov_flag = dataset.get_fov_flag(calib.lidar_to_rect(points[:, 0:3]), info['image']['image_shape'], calib)
+        pts_fov = points[fov_flag]
+        annos = info['annos']
+        corners_lidar = box_utils.boxes_to_corners_3d(annos['gt_boxes_lidar'])
+        expected = [box_utils.in_hull(pts_fov[:, 0:3], corners).sum() for corners in corners_lidar] + [-1]
+
+        assert annos['num_points_in_gt'].tolist() == expected
+        assert annos['num_points_in_gt'][0] > 0
+
+
+def test_get_infos_resume(tmp_path, monkeypatch):
+    sample_ids = write_kitti_samples(tmp_path, 5, np.random.RandomState(1))
+    dataset = get_dataset(tmp_path)
+    resume_path = tmp_path / 'kitti_infos_train.pkl.partial'
+    dataset.get_infos(num_workers=0, sample_id_list=sample_ids[:3], resume_path=resume_path, report_interval=1)
+    with open(resume_path, 'rb') as f:
+        assert [info['point_cloud']['lidar_idx'] for info in pickle.load(f)] == sample_ids[:3]
+
+    processed = []
+    process_single_scene = dataset.process_single_scene
+
+    def record_process_single_scene(sample_idx, **kwargs):
+        processed.append(sample_idx)
+        return process_single_scene(sample_idx, **kwargs)
+    monkeypatch.setattr(dataset, 'process_single_scene', record_process_single_scene)
+    infos = dataset.get_infos(num_workers=0, sample_id_list=sample_ids, resume_path=resume_path, report_interval=1)
+    assert processed == sample_ids[3:]
+
+    ref_infos = get_dataset(tmp_path).get_infos(num_workers=0, sample_id_list=sample_ids)
+    assert [info['point_cloud']['lidar_idx'] for info in infos] == sample_ids
+    for info, ref_info in zip(infos, ref_infos):
+        assert np.array_equal(info['annos']['num_points_in_gt'], ref_info['annos']['num_points_in_gt'])
+        assert np.array_equal(info['annos']['gt_boxes_lidar'], ref_info['annos']['gt_boxes_lidar'])
+
+
+def test_fov_planes_match_get_fov_flag(tmp_path):
+    sample_ids = write_kitti_samples(tmp_path, 1, np.random.RandomState(2))
+    dataset = get_dataset(tmp_path)
+    calib = dataset.get_calib(sample_ids[0])
+    img_shape = np.array([375, 1242], dtype=np.int32)
+    fov_planes = calib.get_fov_planes(img_shape)
+
+    rng = np.random.RandomState(3)
+    # points all around the sensor, most of them outside the frustum, some behind the camera
+    points = rng.uniform([-70, -70, -3], [70, 70, 3], size=(200000, 3)).astype(np.float32)
+    # and points close to the image borders, 1e-2 pixel inside or outside
+    num_border = 4000
+    border_u = rng.choice([0, img_shape[1]], size=num_border) + rng.choice([-1e-2, 1e-2], size=num_border)
+    border_v = rng.choice([0, img_shape[0]], size=num_border) + rng.choice([-1e-2, 1e-2], size=num_border)
+    u = np.concatenate([border_u, rng.uniform(0, img_shape[1], size=num_border)])
+    v = np.concatenate([rng.uniform(0, img_shape[0], size=num_border), border_v])
+    depth = rng.uniform(1, 70, size=2 * num_border)
+    border_points = calib.rect_to_lidar(calib.img_to_rect(u, v, depth).astype(np.float32))
+    points = np.concatenate([points, border_points.astype(np.float32)], axis=0)
+
+    fov_flag = dataset.get_fov_flag_from_planes(points, fov_planes)
+    expected = dataset.get_fov_flag(calib.lidar_to_rect(points), img_shape, calib)
+    assert 0 < fov_flag.sum() < points.shape[0]
+    assert 0 < fov_flag[-2 * num_border:].sum() < 2 * num_border
+    assert np.array_equal(fov_flag, expected)
+
+    # the infos created before the planes were stored compute them from the calibration
+    infos = dataset.get_infos(num_workers=0, sample_id_list=sample_ids)
+    assert np.array_equal(infos[0]['image']['fov_planes'], fov_planes)
+    infos[0]['image'].pop('fov_planes')
+    assert np.array_equal(dataset.get_fov_planes(infos[0]), fov_planes)
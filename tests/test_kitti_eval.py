@@ -0,0 +1,54 @@
+import numba.cuda
+import numpy as np
+import pytest
+
+if not numba.cuda.is_available():
+    # rotate_iou compiles its numba.cuda kernels at import
+    pytest.skip('numba.cuda is not available', allow_module_level=True)
+
+from pcdet.datasets.kitti.kitti_object_eval_python import eval as kitti_eval  # noqa: E402
+
+CLASS_NAMES = ['Car', 'Pedestrian', 'Cyclist']
+
+
+def get_random_annos(num_samples, rng):
+    """
+    Image-box annotations and noisy detections of them, enough for the bbox metric, whose overlaps run on cpu
+    """
+    gt_annos, dt_annos = [], []
+    for _ in range(num_samples):
+        num_gt = rng.randint(1, 8)
+        corners = rng.uniform([0, 150], [1100, 300], size=(num_gt, 2))
+        bbox = np.concatenate((corners, corners + rng.uniform([30, 30], [150, 80], size=(num_gt, 2))), axis=1)
+        names = np.array(rng.choice(CLASS_NAMES + ['DontCare'], size=num_gt))
+        gt_annos.append({
+            'name': names, 'bbox': bbox, 'alpha': rng.uniform(-np.pi, np.pi, size=num_gt),
+            'occluded': rng.randint(0, 3, size=num_gt), 'truncated': rng.uniform(0, 0.5, size=num_gt)
+        })
+
+        keep = rng.uniform(size=num_gt) < 0.8
+        dt_bbox = bbox[keep] + rng.normal(0, 5, size=(keep.sum(), 4))
+        num_fp = rng.randint(0, 3)
+        fp_corners = rng.uniform([0, 150], [1100, 300], size=(num_fp, 2))
+        dt_bbox = np.concatenate((dt_bbox, np.concatenate((fp_corners, fp_corners + 60), axis=1)), axis=0)
+        num_dt = dt_bbox.shape[0]
+        dt_annos.append({
+            'name': np.concatenate((names[keep], rng.choice(CLASS_NAMES, size=num_fp))), 'bbox': dt_bbox,
+            'alpha': rng.uniform(-np.pi, np.pi, size=num_dt), 'score': rng.uniform(size=num_dt)
+        })
+    return gt_annos, dt_annos
+
+
+@pytest.mark.parametrize('num_workers', [2, 4])
+def test_eval_classes_pool_matches_sequential(num_workers):
+    gt_annos, dt_annos = get_random_annos(60, np.random.RandomState(0))
+    min_overlaps = np.array([[[0.7, 0.5, 0.5]], [[0.5, 0.25, 0.25]]])  # [num_minoverlap, metric, class]
+    min_overlaps = np.tile(min_overlaps, (1, 3, 1))
+    kwargs = {'current_classes': [0, 1, 2], 'difficultys': [0, 1, 2], 'metrics': [0],
+              'min_overlaps': min_overlaps, 'compute_aos': True, 'num_parts': 7}
+
+    ret = kitti_eval.eval_classes(gt_annos, dt_annos, num_workers=0, **kwargs)[0]
+    assert (ret['precision'] > 0).any()
+    pool_ret = kitti_eval.eval_classes(gt_annos, dt_annos, num_workers=num_workers, **kwargs)[0]
+    for key in ['precision', 'recall', 'orientation']:
+        assert np.array_equal(pool_ret[key], ret[key])
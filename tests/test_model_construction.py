@@ -0,0 +1,64 @@
+from pathlib import Path
+
+import numpy as np
+import torch
+import yaml
+from easydict import EasyDict
+
+from pcdet.models.dense_heads import AnchorHeadSingle, PointHeadBox
+from pcdet.utils import loss_utils
+
+CFG_DIR = Path(__file__).resolve().parents[1] / 'tools' / 'cfgs' / 'kitti_models'
+CLASS_NAMES = ['Car', 'Pedestrian', 'Cyclist']
+
+
+def load_model_cfg(cfg_name):
+    with open(CFG_DIR / cfg_name, 'r') as f:
+        return EasyDict(yaml.safe_load(f)['MODEL'])
+
+
+def test_weighted_losses_follow_module():
+    for loss_class in [loss_utils.WeightedSmoothL1Loss, loss_utils.WeightedL1Loss]:
+        loss_func = loss_class(code_weights=[1.0, 2.0, 3.0])
+        assert loss_func.code_weights.device.type == 'cpu'
+        loss_func.double()
+        assert loss_func.code_weights.dtype == torch.float64
+        loss = loss_func(torch.zeros(1, 2, 3, dtype=torch.float64), torch.ones(1, 2, 3, dtype=torch.float64))
+        assert loss.shape == (1, 2, 3)
+
+        assert loss_class().code_weights is None
+        assert loss_class()(torch.zeros(1, 2, 3), torch.ones(1, 2, 3)).shape == (1, 2, 3)
+
+
+def test_anchor_head_builds_on_cpu():
+    model_cfg = load_model_cfg('pointpillar.yaml')
+    head = AnchorHeadSingle(
+        model_cfg=model_cfg.DENSE_HEAD, input_channels=384, num_class=3, class_names=CLASS_NAMES,
+        grid_size=np.array([432, 496, 1]), point_cloud_range=np.array([0, -39.68, -3, 69.12, 39.68, 1]),
+        predict_boxes_when_training=False
+    ).eval()
+    assert all(x.device.type == 'cpu' for x in head.anchors)
+    assert head.reg_loss_func.code_weights.device.type == 'cpu'
+
+    with torch.no_grad():
+        batch_dict = head({'spatial_features_2d': torch.randn(1, 384, 248, 216), 'batch_size': 1})
+    assert batch_dict['batch_box_preds'].shape == (1, 248 * 216 * 6, 7)
+
+    head.double()
+    assert head.reg_loss_func.code_weights.dtype == torch.float64
+    assert all(x.dtype == torch.float64 for x in head.anchors)
+
+
+def test_point_head_box_builds_on_cpu():
+    model_cfg = load_model_cfg('pointrcnn.yaml')
+    head = PointHeadBox(num_class=3, input_channels=128, model_cfg=model_cfg.POINT_HEAD).eval()
+    assert head.box_coder.mean_size.device.type == 'cpu'
+    assert head.reg_loss_func.code_weights.device.type == 'cpu'
+
+    points = torch.randn(10, 3)
+    box_preds = head.box_coder.decode_torch(torch.randn(10, 8), points, torch.ones(10, dtype=torch.long))
+    assert box_preds.shape == (10, 7)
+
+    head.double()
+    assert head.box_coder.mean_size.dtype == torch.float64
+    assert head.reg_loss_func.code_weights.dtype == torch.float64
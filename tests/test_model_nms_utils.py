@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+import torch
+from easydict import EasyDict
+
+from pcdet.models.detectors.detector3d_template import Detector3DTemplate
+from pcdet.models.model_utils import model_nms_utils
+
+NMS_CONFIG = EasyDict(NMS_TYPE='nms_gpu', NMS_THRESH=0.2, NMS_PRE_MAXSIZE=30, NMS_POST_MAXSIZE=8)
+
+
+def get_random_boxes(num_boxes, rng):
+    boxes = np.zeros((num_boxes, 7), dtype=np.float32)
+    boxes[:, 0:2] = rng.uniform(-10, 10, size=(num_boxes, 2))
+    boxes[:, 3:6] = rng.uniform(1, 4, size=(num_boxes, 3))
+    boxes[:, 6] = rng.uniform(-np.pi, np.pi, size=num_boxes)
+    return torch.from_numpy(boxes)
+
+
+def test_get_rank_in_group():
+    rank = model_nms_utils.get_rank_in_group(torch.tensor([0, 0, 0, 2, 5, 5]))
+    assert rank.tolist() == [0, 1, 2, 0, 0, 1]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_grouped_nms_matches_per_group_nms(seed):
+    rng = np.random.RandomState(seed)
+    box_preds = get_random_boxes(400, rng)
+    box_scores = torch.from_numpy(rng.permutation(400).astype(np.float32) / 400)
+    group_ids = torch.from_numpy(rng.choice([0, 3, 4, 9], size=400))
+
+    selected = model_nms_utils.grouped_nms(box_scores, box_preds, group_ids, NMS_CONFIG)
+    assert (group_ids[selected][1:] >= group_ids[selected][:-1]).all()
+
+    ref_selected = []
+    for group_id in group_ids.unique():
+        group_idxs = (group_ids == group_id).nonzero().view(-1)
+        cur_selected, _ = model_nms_utils.class_agnostic_nms(box_scores[group_idxs], box_preds[group_idxs], NMS_CONFIG)
+        ref_selected.append(group_idxs[cur_selected])
+    ref_selected = torch.cat(ref_selected)
+    assert torch.equal(box_scores[selected], box_scores[ref_selected])
+    assert torch.equal(box_preds[selected], box_preds[ref_selected])
+
+
+def test_grouped_nms_empty():
+    selected = model_nms_utils.grouped_nms(torch.zeros(0), torch.zeros(0, 7), torch.zeros(0, dtype=torch.long),
+                                           NMS_CONFIG)
+    assert selected.shape == (0, )
+
+
+def test_grouped_nms_far_from_origin():
+    rng = np.random.RandomState(3)
+    box_preds = get_random_boxes(2000, rng)
+    box_preds[:, 0:2] += torch.tensor([20000.0, -25000.0])
+    box_scores = torch.from_numpy(rng.permutation(2000).astype(np.float32) / 2000)
+    group_ids = torch.from_numpy(rng.randint(0, 100, size=2000))
+
+    selected = model_nms_utils.grouped_nms(box_scores, box_preds, group_ids, NMS_CONFIG)
+    ref_selected = []
+    for group_id in group_ids.unique():
+        group_idxs = (group_ids == group_id).nonzero().view(-1)
+        cur_selected, _ = model_nms_utils.class_agnostic_nms(box_scores[group_idxs], box_preds[group_idxs], NMS_CONFIG)
+        ref_selected.append(group_idxs[cur_selected])
+    assert torch.equal(selected, torch.cat(ref_selected))
+
+
+def get_multihead_detector(batched_nms=None):
+    nms_config = EasyDict(NMS_CONFIG, MULTI_CLASSES_NMS=True)
+    if batched_nms is not None:
+        nms_config.BATCHED_NMS = batched_nms
+    detector = Detector3DTemplate.__new__(Detector3DTemplate)
+    torch.nn.Module.__init__(detector)
+    detector.num_class = 5
+    detector.model_cfg = EasyDict(POST_PROCESSING=EasyDict(
+        RECALL_THRESH_LIST=[0.3, 0.5, 0.7], SCORE_THRESH=0.1, OUTPUT_RAW_SCORE=False, NMS_CONFIG=nms_config
+    ))
+    return detector
+
+
+def test_multi_classes_post_processing_on_cpu(monkeypatch):
+    rng = np.random.RandomState(4)
+    batch_size, num_boxes = 3, 200
+    batch_dict = {
+        'batch_size': batch_size,
+        'batch_box_preds': get_random_boxes(batch_size * num_boxes, rng).view(batch_size, num_boxes, 7),
+        # two heads, the first one over the first half of the boxes
+        'batch_cls_preds': [torch.from_numpy(rng.uniform(size=(batch_size, num_boxes // 2, 2)).astype(np.float32)),
+                            torch.from_numpy(rng.uniform(size=(batch_size, num_boxes // 2, 3)).astype(np.float32))],
+        'multihead_label_mapping': [torch.tensor([1, 2]), torch.tensor([3, 4, 5])],
+        'cls_preds_normalized': True
+    }
+    batched_pred_dicts, _ = get_multihead_detector(batched_nms=True).post_processing(batch_dict)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('the cpu post processing runs the NMS per sample')
+    monkeypatch.setattr(model_nms_utils, 'batched_multi_classes_nms', fail)
+    pred_dicts, _ = get_multihead_detector().post_processing(batch_dict)
+
+    assert all(x['pred_labels'].shape[0] > 0 for x in pred_dicts)
+    for pred_dict, batched_pred_dict in zip(pred_dicts, batched_pred_dicts):
+        for key in ['pred_boxes', 'pred_scores', 'pred_labels']:
+            assert torch.equal(pred_dict[key], batched_pred_dict[key])
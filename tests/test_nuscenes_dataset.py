@@ -0,0 +1,142 @@
+import logging
+import pickle
+from pathlib import Path
+
+import numpy as np
+import yaml
+from easydict import EasyDict
+
+from pcdet.datasets.nuscenes.nuscenes_dataset import NuScenesDataset
+from pcdet.utils import common_utils
+
+CFG_PATH = Path(__file__).resolve().parents[1] / 'tools' / 'cfgs' / 'dataset_configs' / 'nuscenes_dataset.yaml'
+CLASS_NAMES = ['car', 'pedestrian']
+
+
+def write_nuscenes_infos(root_path, num_samples, rng, max_sweeps=10):
+    """
+    Val infos of num_samples keyframes whose sweeps overlap, as consecutive nuScenes keyframes
+    """
+    version_path = root_path / 'v1.0-trainval'
+    for name in ['samples', 'sweeps']:
+        (version_path / name).mkdir(parents=True)
+    num_sweeps = num_samples + max_sweeps + 1
+    for k in range(num_sweeps):
+        points = rng.uniform([-20, -20, -2, 0, 0], [20, 20, 2, 255, 0], size=(rng.randint(500, 1000), 5))
+        points.astype(np.float32).tofile(str(version_path / 'sweeps' / ('%d.bin' % k)))
+
+    infos = []
+    for k in range(num_samples):
+        lidar_path = Path('samples') / ('%d.bin' % k)
+        points = rng.uniform([-20, -20, -2, 0, 0], [20, 20, 2, 255, 0], size=(800, 5)).astype(np.float32)
+        points.tofile(str(version_path / lidar_path))
+        sweeps = []
+        for j in range(max_sweeps + 2):
+            angle = rng.uniform(-0.1, 0.1)
+            transform_matrix = np.eye(4)
+            transform_matrix[0:2, 0:2] = [[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]]
+            transform_matrix[0:3, 3] = rng.uniform(-2, 2, size=3)
+            sweeps.append({'lidar_path': str(Path('sweeps') / ('%d.bin' % (k + j))), 'time_lag': 0.05 * (j + 1),
+                           'transform_matrix': transform_matrix if j % 3 else None})
+        infos.append({
+            'lidar_path': str(lidar_path), 'token': 'token_%d' % k, 'sweeps': sweeps,
+            'gt_boxes': np.concatenate((rng.uniform(-10, 10, size=(2, 7)), np.zeros((2, 2))), axis=1),
+            'gt_names': np.array(CLASS_NAMES), 'num_lidar_pts': np.array([10, 0])
+        })
+    with open(str(version_path / 'nuscenes_infos_10sweeps_val.pkl'), 'wb') as f:
+        pickle.dump(infos, f)
+    return infos
+
+
+def get_dataset(root_path, **cfg_updates):
+    with open(CFG_PATH, 'r') as f:
+        dataset_cfg = EasyDict(yaml.safe_load(f))
+    dataset_cfg.update(cfg_updates)
+    return NuScenesDataset(dataset_cfg=dataset_cfg, class_names=CLASS_NAMES, training=False, root_path=root_path,
+                           logger=logging.getLogger('test_nuscenes_dataset'))
+
+
+def test_array_lru_cache():
+    arrays = {key: np.full(10, key, dtype=np.float64) for key in range(4)}  # 80 bytes each
+    loaded = []
+
+    def load_func(key):
+        loaded.append(key)
+        return arrays[key].copy()
+
+    cache = common_utils.ArrayLRUCache(max_bytes=200)
+    for key in [0, 1, 0, 2, 3, 0]:
+        assert np.array_equal(cache.get(key, load_func), arrays[key])
+    # room for 2 arrays: the hit of 0 makes 1 the oldest one, evicted by 2, then 0 is evicted by 3 and reloaded
+    assert loaded == [0, 1, 2, 3, 0]
+    assert len(cache) == 2 and cache.num_bytes == 160
+    assert not cache.get(3, load_func).flags.writeable and loaded[-1] == 0
+
+    cache = pickle.loads(pickle.dumps(cache))
+    assert len(cache) == 0 and cache.num_bytes == 0
+    disabled_cache = common_utils.ArrayLRUCache(max_bytes=0)
+    disabled_cache.get(0, load_func)
+    assert len(disabled_cache) == 0
+
+
+def test_sweep_cache_matches_uncached_sweeps(tmp_path):
+    infos = write_nuscenes_infos(tmp_path, 4, np.random.RandomState(0))
+    dataset = get_dataset(tmp_path)
+    uncached_dataset = get_dataset(tmp_path, SWEEP_CACHE_MB=0)
+
+    used_sweeps = set()
+    for repeat in range(2):
+        for index in range(len(dataset)):
+            sweep_idxs = np.random.RandomState(index).choice(12, 9, replace=False)
+            used_sweeps.update(infos[index]['sweeps'][k]['lidar_path'] for k in sweep_idxs)
+            points = dataset.get_lidar_with_sweeps(index, max_sweeps=10, sweep_idxs=sweep_idxs)
+            expected = uncached_dataset.get_lidar_with_sweeps(index, max_sweeps=10, sweep_idxs=sweep_idxs)
+            assert points.dtype == np.float32 and np.array_equal(points, expected)
+    # each sweep shared by the keyframes is decoded once, and its transform does not modify the cached points
+    assert len(dataset.sweep_cache) == len(used_sweeps) < 4 * 9
+    assert len(uncached_dataset.sweep_cache) == 0
+
+
+def test_packed_sweeps(tmp_path):
+    write_nuscenes_infos(tmp_path, 5, np.random.RandomState(1))
+    get_dataset(tmp_path).create_packed_sweeps(max_sweeps=10)
+
+    dataset = get_dataset(tmp_path, PACKED_SWEEPS=True)
+    file_dataset = get_dataset(tmp_path)
+    assert dataset.packed_sweeps is not None and file_dataset.packed_sweeps is None
+    for index in range(len(dataset)):
+        expected = file_dataset.get_lidar_with_sweeps(index, max_sweeps=10, sweep_idxs=np.arange(9))
+        assert np.array_equal(dataset.get_lidar_with_sweeps(index, max_sweeps=10), expected)
+    # the packed clouds only replace the ones of MAX_SWEEPS sweeps
+    assert dataset.get_lidar_with_sweeps(0, max_sweeps=1).shape == (800, 5)
+
+
+def get_eval_points(dataset, index, seed):
+    np.random.seed(seed)
+    return dataset[index]['points']
+
+
+def test_deterministic_eval_sweeps(tmp_path, monkeypatch):
+    write_nuscenes_infos(tmp_path, 3, np.random.RandomState(2))
+    monkeypatch.setattr(NuScenesDataset, 'prepare_data', lambda self, data_dict: data_dict)
+    nearest = [get_dataset(tmp_path).get_lidar_with_sweeps(index, max_sweeps=10, sweep_idxs=np.arange(9))
+               for index in range(3)]
+
+    # random sweeps by default, as the released evaluation
+    dataset = get_dataset(tmp_path)
+    assert not np.array_equal(get_eval_points(dataset, 0, seed=0), get_eval_points(dataset, 0, seed=1))
+
+    dataset = get_dataset(tmp_path, DETERMINISTIC_EVAL_SWEEPS=True)
+    for index in range(3):
+        assert np.array_equal(get_eval_points(dataset, index, seed=index), nearest[index])
+
+    dataset = get_dataset(tmp_path, DETERMINISTIC_EVAL_SWEEPS=True, EVAL_SWEEPS_CACHE=True)
+    cache_dir = tmp_path / 'v1.0-trainval' / 'eval_sweeps_cache_10sweeps_test'
+    for index in range(3):
+        assert np.array_equal(get_eval_points(dataset, index, seed=0), nearest[index])
+    assert sorted(path.name for path in cache_dir.iterdir()) == ['token_0.npy', 'token_1.npy', 'token_2.npy']
+
+    # the next evaluation reads the cached clouds without the sweep files
+    monkeypatch.setattr(NuScenesDataset, 'get_lidar_with_sweeps', None)
+    for index in range(3):
+        assert np.array_equal(get_eval_points(dataset, index, seed=0), nearest[index])
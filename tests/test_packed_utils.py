@@ -0,0 +1,86 @@
+import pickle
+
+import numpy as np
+from easydict import EasyDict
+
+from pcdet.datasets.augmentor.database_sampler import DataBaseSampler
+from pcdet.utils import gt_database_utils, packed_utils
+
+
+def test_packed_points_round_trip(tmp_path):
+    rng = np.random.RandomState(0)
+    clouds = {'%06d' % k: rng.uniform(size=(rng.randint(0, 50), 5)).astype(np.float32) for k in range(20)}
+    writer = packed_utils.PackedPointsWriter(tmp_path / 'packed.bin', num_features=5)
+    offsets = [writer.add(points, key=key) for key, points in clouds.items()]
+    index = writer.close(tmp_path / 'packed_index.pkl')
+    assert index['num_rows'] == sum(x.shape[0] for x in clouds.values()) == sum(x[1] for x in offsets)
+
+    reader = packed_utils.PackedPointsReader.from_index_file(tmp_path / 'packed.bin', tmp_path / 'packed_index.pkl')
+    # the memmap is opened again after pickling, as in the DataLoader workers
+    reader = pickle.loads(pickle.dumps(reader))
+    assert reader._blob is None
+    for (key, points), offset in zip(clouds.items(), offsets):
+        assert key in reader
+        assert np.array_equal(reader.get(key), points) and np.array_equal(reader.get_slice(*offset), points)
+    assert not reader.get('000000').flags.writeable
+
+
+class SampleObjects(object):
+    """
+    get_sample_objects of fake samples with a Car and a Pedestrian each
+    """
+    def __init__(self, database_save_path):
+        self.database_save_path = database_save_path
+
+    def __call__(self, sample):
+        rng = np.random.RandomState(sample)
+        objects = []
+        for i, name in enumerate(['Car', 'Pedestrian']):
+            gt_points = rng.uniform(-0.5, 0.5, size=(rng.randint(5, 30), 4)).astype(np.float32)
+            filename = '%d_%s_%d.bin' % (sample, name, i)
+            db_info = {'name': name, 'path': 'gt_database/%s' % filename, 'image_idx': sample, 'gt_idx': i,
+                       'box3d_lidar': np.concatenate((rng.uniform(-30, 30, size=3), [2, 2, 2, 0])),
+                       'num_points_in_gt': gt_points.shape[0], 'difficulty': 0}
+            objects.append((name, gt_points, self.database_save_path / filename, db_info))
+        return objects
+
+
+def build_database(root_path, packed):
+    root_path.mkdir()
+    return gt_database_utils.create_gt_database_sharded(
+        SampleObjects(root_path / 'gt_database'), list(range(30)), root_path=root_path,
+        database_save_path=root_path / 'gt_database', db_info_save_path=root_path / 'dbinfos.pkl', num_features=4,
+        packed_db_path=root_path / 'gt_database_packed.bin' if packed else None, num_workers=0, shard_size=4
+    )
+
+
+def test_packed_gt_database_round_trip(tmp_path):
+    db_infos = build_database(tmp_path / 'files', packed=False)
+    packed_db_infos = build_database(tmp_path / 'packed', packed=True)
+    assert not (tmp_path / 'packed' / 'gt_database').exists()
+
+    reader = packed_utils.PackedPointsReader(tmp_path / 'packed' / 'gt_database_packed.bin', num_features=4)
+    for name in ['Car', 'Pedestrian']:
+        assert len(packed_db_infos[name]) == len(db_infos[name]) == 30
+        for info, packed_info in zip(db_infos[name], packed_db_infos[name]):
+            assert packed_info['packed_path'] == 'gt_database_packed.bin'
+            points = np.fromfile(str(tmp_path / 'files' / info['path']), dtype=np.float32).reshape(-1, 4)
+            assert np.array_equal(reader.get_slice(*packed_info['packed_offset']), points)
+
+    # the sampler reads the same objects from the blob as from the per-object files
+    sampler_cfg = EasyDict({
+        'DB_INFO_PATH': ['dbinfos.pkl'], 'PREPARE': {'filter_by_min_points': ['Car:10']},
+        'SAMPLE_GROUPS': ['Car:5', 'Pedestrian:5'], 'NUM_POINT_FEATURES': 4, 'REMOVE_EXTRA_WIDTH': [0.0, 0.0, 0.0]
+    })
+    samplers = [DataBaseSampler(tmp_path / name, sampler_cfg, ['Car', 'Pedestrian']) for name in ['files', 'packed']]
+    for k in range(10):
+        data_dicts = []
+        for sampler in samplers:
+            np.random.seed(k)
+            data_dicts.append(sampler({
+                'gt_boxes': np.zeros((0, 7), dtype=np.float32), 'gt_names': np.zeros(0, dtype=str),
+                'gt_boxes_mask': np.zeros(0, dtype=bool), 'points': np.zeros((0, 4), dtype=np.float32)
+            }))
+        assert data_dicts[0]['points'].shape[0] > 0
+        for key in ['points', 'gt_boxes', 'gt_names']:
+            assert np.array_equal(data_dicts[0][key], data_dicts[1][key])
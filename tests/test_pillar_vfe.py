@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+import torch
+from easydict import EasyDict
+
+from pcdet.datasets.processor.voxel_generator import VoxelGenerator
+from pcdet.models.backbones_2d.map_to_bev.pointpillar_scatter import PointPillarScatter
+from pcdet.models.backbones_3d.vfe import pillar_vfe
+from pcdet.utils import common_utils
+
+VOXEL_SIZE = [0.4, 0.4, 4]
+POINT_CLOUD_RANGE = [0, -4, -3, 8, 4, 1]
+
+
+def get_batch_dicts(rng, num_points=3000):
+    points = rng.uniform([-1, -5, -3, 0], [9, 5, 1, 1], size=(num_points, 4)).astype(np.float32)
+    # max_num_points is large enough to keep all the points of each pillar, as dynamic voxelization does
+    voxel_generator = VoxelGenerator(VOXEL_SIZE, POINT_CLOUD_RANGE, max_num_points=num_points, max_voxels=20000)
+    voxels, coordinates, num_points_per_voxel = voxel_generator.generate(points)
+    point_voxel_ids, dynamic_coordinates = voxel_generator.points_to_voxel_indices(points)
+    assert np.array_equal(coordinates, dynamic_coordinates)
+
+    coords = torch.from_numpy(np.pad(coordinates, ((0, 0), (1, 0)), mode='constant'))
+    padded_dict = {
+        'voxels': torch.from_numpy(voxels[:, :num_points_per_voxel.max()]),
+        'voxel_num_points': torch.from_numpy(num_points_per_voxel),
+        'voxel_coords': coords
+    }
+    dynamic_dict = {
+        'points': torch.from_numpy(np.pad(points, ((0, 0), (1, 0)), mode='constant')),
+        'point_voxel_ids': torch.from_numpy(point_voxel_ids),
+        'voxel_coords': coords
+    }
+    return padded_dict, dynamic_dict
+
+
+def get_pillar_vfe(with_distance):
+    model_cfg = EasyDict(USE_NORM=True, WITH_DISTANCE=with_distance, USE_ABSLOTE_XYZ=True, NUM_FILTERS=[64])
+    vfe = pillar_vfe.PillarVFE(model_cfg, num_point_features=4, voxel_size=VOXEL_SIZE,
+                               point_cloud_range=POINT_CLOUD_RANGE)
+    # zero mean and bias keep the padded points of forward() at 0 after the relu, so they never win the max
+    bn = vfe.pfn_layers[0].norm
+    bn.weight.data.uniform_(0.5, 2)
+    bn.running_var.uniform_(0.5, 2)
+    return vfe.eval()
+
+
+@pytest.mark.parametrize('with_distance', [False, True])
+def test_pillar_vfe_dynamic_matches_padded(with_distance):
+    torch.manual_seed(0)
+    padded_dict, dynamic_dict = get_batch_dicts(np.random.RandomState(0))
+    vfe = get_pillar_vfe(with_distance)
+    with torch.no_grad():
+        padded_features = vfe(padded_dict)['pillar_features']
+        dynamic_features = vfe(dynamic_dict)['pillar_features']
+    assert dynamic_features.shape == padded_features.shape
+    assert torch.allclose(dynamic_features, padded_features, atol=1e-5)
+
+
+def test_pfn_layer_sorted_scatter_fallback(monkeypatch):
+    torch.manual_seed(0)
+    _, dynamic_dict = get_batch_dicts(np.random.RandomState(1))
+    vfe = get_pillar_vfe(with_distance=False)
+    with torch.no_grad():
+        features = vfe(dict(dynamic_dict))['pillar_features']
+        monkeypatch.setattr(common_utils, 'scatter_reduce', common_utils.scatter_reduce_sorted)
+        fallback_features = vfe(dict(dynamic_dict))['pillar_features']
+    assert torch.equal(features, fallback_features)
+
+
+@pytest.mark.parametrize('reduce', ['amax', 'amin'])
+def test_scatter_reduce_sorted(reduce):
+    torch.manual_seed(0)
+    index = torch.randint(0, 50, (400, ))
+    for src in [torch.randn(400, 6), torch.randint(0, 10, (400, ))]:
+        out = common_utils.scatter_reduce_sorted(src, index, 60, reduce=reduce, fill_value=-7)
+        for k in range(60):
+            values = src[index == k]
+            if values.shape[0] == 0:
+                assert (out[k] == -7).all()
+            else:
+                expected = values.max(dim=0)[0] if reduce == 'amax' else values.min(dim=0)[0]
+                assert torch.equal(out[k], expected)
+
+
+def test_pointpillar_scatter_outputs_are_independent():
+    rng = np.random.RandomState(3)
+    nx, ny, num_features = 20, 20, 8
+    scatter = PointPillarScatter(EasyDict(NUM_BEV_FEATURES=num_features), grid_size=[nx, ny, 1]).eval()
+
+    spatial_features, expected = [], []
+    with torch.no_grad():
+        for batch_size in [2, 2, 3]:
+            # (batch_idx, z, y, x) of 40 distinct pillars per sample
+            cells = np.concatenate([rng.choice(nx * ny, 40, replace=False) for _ in range(batch_size)])
+            coords = np.stack((np.repeat(np.arange(batch_size), 40), np.zeros_like(cells), cells // nx, cells % nx),
+                              axis=1)
+            pillar_features = torch.from_numpy(rng.uniform(size=(coords.shape[0], num_features)).astype(np.float32))
+            batch_dict = scatter({'pillar_features': pillar_features, 'voxel_coords': torch.from_numpy(coords).int(),
+                                  'batch_size': batch_size})
+            spatial_features.append(batch_dict['spatial_features'])
+
+            dense = torch.zeros(batch_size, num_features, ny, nx)
+            dense[coords[:, 0], :, coords[:, 2], coords[:, 3]] = pillar_features
+            expected.append(dense)
+
+    # the features of an earlier call are not overwritten by the next ones
+    for cur_spatial_features, cur_expected in zip(spatial_features, expected):
+        assert torch.equal(cur_spatial_features, cur_expected)
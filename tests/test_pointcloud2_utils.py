@@ -0,0 +1,127 @@
+import types
+
+import numpy as np
+import pytest
+
+from ros_utils import pointcloud2_utils
+
+# sensor_msgs/PointField datatypes
+INT8, UINT8, INT16, UINT16, INT32, UINT32, FLOAT32, FLOAT64 = range(1, 9)
+
+
+def make_cloud(values, layout, height, width, point_step, row_padding=0, is_bigendian=False):
+    """
+    Raw PointCloud2 bytes of a (height * width) structured cloud, with padding between the points and the rows
+    Args:
+        values: dict, field name => (height * width) values
+        layout: list of (name, offset, datatype)
+
+    Returns:
+        data: bytes
+        fields: list of PointField-like objects
+        row_step:
+    """
+    byte_order = '>' if is_bigendian else '<'
+    dtype = np.dtype({
+        'names': [name for name, _, _ in layout],
+        'formats': [np.dtype(pointcloud2_utils.POINTFIELD_DTYPES[datatype]).newbyteorder(byte_order)
+                    for _, _, datatype in layout],
+        'offsets': [offset for _, offset, _ in layout],
+        'itemsize': point_step
+    })
+    row_step = point_step * width + row_padding
+    data = bytearray(row_step * height)
+    for row in range(height):
+        cloud = np.zeros(width, dtype=dtype)
+        for name, _, _ in layout:
+            cloud[name] = values[name][row * width:(row + 1) * width]
+        data[row * row_step:row * row_step + point_step * width] = cloud.tobytes()
+    fields = [types.SimpleNamespace(name=name, offset=offset, datatype=datatype, count=1)
+              for name, offset, datatype in layout]
+    return bytes(data), fields, row_step
+
+
+def get_random_values(num_points, rng):
+    return {
+        'x': rng.uniform(-50, 50, num_points), 'y': rng.uniform(-50, 50, num_points),
+        'z': rng.uniform(-3, 1, num_points), 'intensity': rng.randint(0, 256, num_points),
+        'ring': rng.randint(0, 64, num_points)
+    }
+
+
+@pytest.mark.parametrize('is_bigendian', [False, True])
+def test_decode_strided_fields(is_bigendian):
+    rng = np.random.RandomState(0)
+    height, width = 3, 50
+    values = get_random_values(height * width, rng)
+    # velodyne-like layout: padded float32 xyz, uint8 intensity, uint16 ring and a padded row end
+    layout = [('x', 0, FLOAT32), ('y', 4, FLOAT32), ('z', 8, FLOAT32), ('intensity', 16, UINT8), ('ring', 20, UINT16)]
+    data, fields, row_step = make_cloud(values, layout, height, width, point_step=32, row_padding=12,
+                                        is_bigendian=is_bigendian)
+
+    decoder = pointcloud2_utils.PointCloud2Decoder(field_names=['x', 'y', 'z', 'intensity', 'ring'], timestamp=False)
+    points = decoder.decode(data, fields, height, width, 32, row_step, is_bigendian=is_bigendian)
+    expected = np.stack([values[name] for name in ['x', 'y', 'z', 'intensity', 'ring']], axis=1).astype(np.float32)
+    assert points.dtype == np.float32
+    assert np.array_equal(points, expected)
+
+
+def test_decode_float64_and_missing_fields():
+    rng = np.random.RandomState(1)
+    values = get_random_values(40, rng)
+    layout = [('x', 0, FLOAT64), ('y', 8, FLOAT64), ('z', 16, FLOAT64)]
+    data, fields, row_step = make_cloud(values, layout, 1, 40, point_step=24)
+
+    decoder = pointcloud2_utils.PointCloud2Decoder(field_names=['x', 'y', 'z', 'intensity', None], timestamp=False)
+    points = decoder.decode(data, fields, 1, 40, 24, row_step)
+    assert np.array_equal(points[:, 0:3], np.stack([values['x'], values['y'], values['z']], axis=1).astype(np.float32))
+    assert (points[:, 3:5] == 0).all()
+
+
+def test_decode_nans_offset_and_timestamp():
+    rng = np.random.RandomState(2)
+    values = get_random_values(30, rng)
+    values['x'][[0, 7]] = np.nan
+    values['z'][12] = np.inf
+    layout = [('x', 0, FLOAT32), ('y', 4, FLOAT32), ('z', 8, FLOAT32), ('intensity', 12, FLOAT32)]
+    data, fields, row_step = make_cloud(values, layout, 1, 30, point_step=16)
+
+    decoder = pointcloud2_utils.PointCloud2Decoder(field_names=['x', 'y', 'z', 'intensity'], x_offset=1.5)
+    points = decoder.decode(data, fields, 1, 30, 16, row_step, frame=3)
+    keep = np.ones(30, dtype=bool)
+    keep[[0, 7, 12]] = False
+    expected = np.stack([values[name] for name in ['x', 'y', 'z', 'intensity']], axis=1).astype(np.float32)[keep]
+    expected[:, 0] += np.float32(1.5)
+    assert points.shape == (27, 5)
+    assert np.array_equal(points[:, 0:4], expected)
+    assert (points[:, 4] == 3).all()
+
+    decoder.remove_nans = False
+    assert decoder.decode(data, fields, 1, 30, 16, row_step).shape == (30, 5)
+
+
+def test_decoder_reuses_its_buffer():
+    rng = np.random.RandomState(3)
+    layout = [('x', 0, FLOAT32), ('y', 4, FLOAT32), ('z', 8, FLOAT32)]
+    decoder = pointcloud2_utils.PointCloud2Decoder(timestamp=False)
+
+    clouds = [make_cloud(get_random_values(n, rng), layout, 1, n, point_step=12) for n in [100, 60, 250]]
+    first = decoder.decode(clouds[0][0], clouds[0][1], 1, 100, 12, clouds[0][2])
+    second = decoder.decode(clouds[1][0], clouds[1][1], 1, 60, 12, clouds[1][2])
+    assert np.shares_memory(first, second)
+    third = decoder.decode(clouds[2][0], clouds[2][1], 1, 250, 12, clouds[2][2])
+    assert not np.shares_memory(second, third) and third.shape == (250, 3)
+
+
+def test_decode_msg():
+    rng = np.random.RandomState(4)
+    values = get_random_values(20, rng)
+    layout = [('x', 0, FLOAT32), ('y', 4, FLOAT32), ('z', 8, FLOAT32), ('intensity', 12, FLOAT32)]
+    data, fields, row_step = make_cloud(values, layout, 1, 20, point_step=16)
+    msg = types.SimpleNamespace(data=data, fields=fields, height=1, width=20, point_step=16, row_step=row_step,
+                                is_bigendian=False)
+
+    decoder = pointcloud2_utils.PointCloud2Decoder(field_names=['x', 'y', 'z', 'intensity'])
+    points = decoder.decode_msg(msg, frame=1)
+    assert np.array_equal(points[:, 0], values['x'].astype(np.float32))
+    assert (points[:, 4] == 1).all()
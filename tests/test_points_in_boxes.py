@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+import torch
+
+from pcdet.ops.roiaware_pool3d import roiaware_pool3d_utils
+
+
+def get_random_boxes(num_boxes, rng, xy_range=20.0):
+    boxes = np.zeros((num_boxes, 7), dtype=np.float32)
+    boxes[:, 0:2] = rng.uniform(-xy_range, xy_range, size=(num_boxes, 2))
+    boxes[:, 2] = rng.uniform(-1, 1, size=num_boxes)
+    boxes[:, 3:6] = rng.uniform(0.5, 5, size=(num_boxes, 3))
+    boxes[:, 6] = rng.uniform(-np.pi, np.pi, size=num_boxes)
+    return boxes
+
+
+def points_in_boxes_brute_force(points, boxes, margin):
+    """
+    Returns:
+        in_flag: (num_points, N) whether each point is inside each box, as the cuda kernel
+    """
+    local = points[:, None, 0:2] - boxes[None, :, 0:2]
+    cosa, sina = np.cos(boxes[:, 6]), np.sin(boxes[:, 6])
+    local_x = local[..., 0] * cosa + local[..., 1] * sina
+    local_y = -local[..., 0] * sina + local[..., 1] * cosa
+    return (np.abs(points[:, None, 2] - boxes[None, :, 2]) <= boxes[:, 5] / 2) & \
+        (np.abs(local_x) < boxes[:, 3] / 2 + margin) & (np.abs(local_y) < boxes[:, 4] / 2 + margin)
+
+
+@pytest.mark.parametrize('margin', [1e-2, 1e-5])
+def test_points_in_boxes_idx_cpu_matches_brute_force(margin):
+    rng = np.random.RandomState(0)
+    boxes = get_random_boxes(30, rng)
+    points = rng.uniform([-22, -22, -3], [22, 22, 3], size=(20000, 3)).astype(np.float32)
+
+    in_flag = points_in_boxes_brute_force(points, boxes, margin)
+    expected = np.where(in_flag.any(axis=1), in_flag.argmax(axis=1), -1)
+    box_idxs = roiaware_pool3d_utils.points_in_boxes_idx_cpu(points, boxes, margin=margin)
+    assert (box_idxs >= 0).sum() > 100
+    assert np.array_equal(box_idxs, expected)
+
+
+def test_points_in_boxes_sparse_cpu_matches_brute_force():
+    rng = np.random.RandomState(1)
+    # crowded boxes, most points are inside several of them
+    boxes = get_random_boxes(50, rng, xy_range=5)
+    points = rng.uniform([-8, -8, -3], [8, 8, 3], size=(5000, 3)).astype(np.float32)
+
+    point_idxs, box_idxs = roiaware_pool3d_utils.points_in_boxes_sparse_cpu(points, boxes)
+    expected_point_idxs, expected_box_idxs = points_in_boxes_brute_force(points, boxes, 1e-2).nonzero()
+    assert (np.bincount(point_idxs) > 1).any()
+    assert np.array_equal(point_idxs, expected_point_idxs)
+    assert np.array_equal(box_idxs, expected_box_idxs)
+
+
+def test_points_on_box_boundaries():
+    boxes = np.array([
+        [0, 0, 0, 2, 4, 2, 0],
+        [10, 0, 0, 2, 4, 2, np.pi / 2],  # long side along x
+    ], dtype=np.float32)
+    points = np.array([
+        [0.5, 1.99, 1],  # on the top face of box 0
+        [0.5, 1.99, 1.01],  # above box 0
+        [0, 0, -1],  # on the bottom face of box 0
+        [0.99, 0, 0], [1.02, 0, 0],  # inside and outside of the x face of box 0
+        [11.9, 0, 0], [10, 1.1, 0],  # inside and outside of box 1 after its rotation
+        [5, 0, 0],
+    ], dtype=np.float32)
+    box_idxs = roiaware_pool3d_utils.points_in_boxes_idx_cpu(points, boxes)
+    assert box_idxs.tolist() == [0, -1, 0, 0, -1, 1, -1, -1]
+
+    point_idxs, box_idxs = roiaware_pool3d_utils.points_in_boxes_sparse_cpu(points, boxes)
+    assert point_idxs.tolist() == [0, 2, 3, 5] and box_idxs.tolist() == [0, 0, 0, 1]
+
+
+def test_points_in_boxes_empty():
+    rng = np.random.RandomState(2)
+    points = rng.uniform(-5, 5, size=(100, 3)).astype(np.float32)
+    no_boxes = np.zeros((0, 7), dtype=np.float32)
+    assert (roiaware_pool3d_utils.points_in_boxes_idx_cpu(points, no_boxes) == -1).all()
+    point_idxs, box_idxs = roiaware_pool3d_utils.points_in_boxes_sparse_cpu(points, no_boxes)
+    assert point_idxs.shape == box_idxs.shape == (0, )
+
+    # boxes without any point, and no points at all
+    far_boxes = get_random_boxes(5, rng)
+    far_boxes[:, 0:2] += 100
+    assert (roiaware_pool3d_utils.points_in_boxes_idx_cpu(points, far_boxes) == -1).all()
+    assert roiaware_pool3d_utils.points_in_boxes_idx_cpu(points[:0], far_boxes).shape == (0, )
+    point_idxs, box_idxs = roiaware_pool3d_utils.points_in_boxes_sparse_cpu(points[:0], far_boxes)
+    assert point_idxs.shape == box_idxs.shape == (0, )
+
+    # torch tensors in, torch tensors out
+    box_idxs = roiaware_pool3d_utils.points_in_boxes_idx_cpu(torch.from_numpy(points), torch.from_numpy(no_boxes))
+    assert isinstance(box_idxs, torch.Tensor) and box_idxs.shape == (100, )
@@ -0,0 +1,76 @@
+import numpy as np
+
+from ros_utils import pipeline, pointcloud2_utils
+
+
+class FakeProcessor(object):
+    """
+    Processor_ROS stand-in whose detections are the centroid and the number of points of the frame
+    """
+    def __init__(self, fail_frames=()):
+        self.fail_frames = fail_frames
+
+    def preprocess(self, points, frame):
+        if frame in self.fail_frames:
+            raise ValueError('bad frame %d' % frame)
+        # the decoder buffer is reused by the next frame, as the collated batch of Processor_ROS, keep a copy
+        return {'points': points.copy(), 'frame_id': frame}
+
+    def inference(self, data_dict, calib):
+        points = data_dict['points']
+        boxes_lidar = np.concatenate((points[:, 0:3].mean(axis=0), [1, 1, 1, calib]))[None, :]
+        return np.array([float(points.shape[0])]), boxes_lidar, np.array([1]), None
+
+
+def build_messages(msg, scores, boxes_lidar, types):
+    return {'boxes': (msg.header.seq, boxes_lidar), 'scores': (msg.header.seq, scores, types)}
+
+
+def write_frames(path, num_frames, rng):
+    frames = []
+    for k in range(num_frames):
+        points = rng.uniform(-10, 10, size=(rng.randint(50, 500), 4)).astype(np.float32)
+        points.tofile(str(path / ('%06d.bin' % k)))
+        frames.append(points)
+    return frames
+
+
+def get_stages(processor, calib=0.5):
+    decoder = pointcloud2_utils.PointCloud2Decoder(field_names=('x', 'y', 'z', None), x_offset=20.0)
+    publishers = {'boxes': pipeline.FakePublisher('boxes'), 'scores': pipeline.FakePublisher('scores')}
+    return pipeline.DetectionStages(processor, decoder, publishers, build_messages, calib=calib, stats_every=0)
+
+
+def test_replay_frames_through_detection_stages(tmp_path):
+    frames = write_frames(tmp_path, 6, np.random.RandomState(0))
+    stages = get_stages(FakeProcessor())
+    # queues as long as the replay, so that no frame is dropped
+    stats = pipeline.replay_frames(stages, tmp_path, queue_size=len(frames), timeout=10.0)
+    assert stats['publish']['count'] == len(frames) and stats['end_to_end']['count'] == len(frames)
+
+    box_messages = list(stages.publishers['boxes'].messages)
+    score_messages = list(stages.publishers['scores'].messages)
+    assert [seq for seq, _ in box_messages] == list(range(len(frames)))
+    for points, (_, boxes_lidar), (_, scores, types) in zip(frames, box_messages, score_messages):
+        assert scores[0] == points.shape[0] and types.tolist() == [1]
+        assert np.allclose(boxes_lidar[0, 0:3], points[:, 0:3].mean(axis=0) + np.array([20, 0, 0]), atol=1e-4)
+        assert boxes_lidar[0, 6] == 0.5
+
+
+def test_stage_errors_are_counted_and_logged(tmp_path, capsys):
+    frames = write_frames(tmp_path, 4, np.random.RandomState(1))
+    stages = get_stages(FakeProcessor(fail_frames=(2, )))
+    stats = pipeline.replay_frames(stages, tmp_path, queue_size=len(frames), timeout=10.0)
+
+    assert stats['preprocess']['errors'] == 1
+    assert [seq for seq, _ in stages.publishers['boxes'].messages] == [0, 1, 3]
+    err = capsys.readouterr().err
+    assert 'Traceback' in err and 'bad frame 2' in err
+
+
+def test_drop_oldest_queue():
+    queue = pipeline.DropOldestQueue(maxsize=2)
+    for k in range(5):
+        queue.put(k)
+    assert queue.num_dropped == 3
+    assert [queue.get(), queue.get(), queue.get(timeout=0.01)] == [3, 4, None]
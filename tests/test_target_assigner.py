@@ -0,0 +1,113 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+import yaml
+from easydict import EasyDict
+
+from pcdet.models.dense_heads.anchor_head_template import AnchorHeadTemplate
+from pcdet.models.dense_heads.target_assigner.axis_aligned_target_assigner import AxisAlignedTargetAssigner
+from pcdet.utils import box_coder_utils, common_utils
+
+CFG_DIR = Path(__file__).resolve().parents[1] / 'tools' / 'cfgs'
+# small ranges keep the dense (B, N, M) IoU of the reference path cheap on cpu
+HEAD_CFGS = {
+    'kitti_pointpillar': ('kitti_models/pointpillar.yaml', [0, -19.84, -3, 34.56, 19.84, 1], [0.16, 0.16, 4]),
+    'kitti_second_multihead': ('kitti_models/second_multihead.yaml', [0, -20, -3, 35.2, 20, 1], [0.05, 0.05, 4]),
+    'nuscenes_pp_multihead': ('nuscenes_models/cbgs_pp_multihead.yaml', [-25.6, -25.6, -5, 25.6, 25.6, 3],
+                              [0.2, 0.2, 8]),
+}
+
+
+def load_head_cfg(name, **target_overrides):
+    cfg_file, point_cloud_range, voxel_size = HEAD_CFGS[name]
+    with open(CFG_DIR / cfg_file, 'r') as f:
+        cfg = EasyDict(yaml.safe_load(f))
+    head_cfg = cfg.MODEL.DENSE_HEAD
+    head_cfg.TARGET_ASSIGNER_CONFIG.update(target_overrides)
+    point_cloud_range = np.array(point_cloud_range, dtype=np.float32)
+    grid_size = np.round((point_cloud_range[3:6] - point_cloud_range[0:3]) / np.array(voxel_size)).astype(np.int64)
+    return head_cfg, cfg.CLASS_NAMES, grid_size, point_cloud_range
+
+
+def get_assigner_and_anchors(name, **target_overrides):
+    head_cfg, class_names, grid_size, point_cloud_range = load_head_cfg(name, **target_overrides)
+    anchors, _ = AnchorHeadTemplate.generate_anchors(
+        head_cfg.ANCHOR_GENERATOR_CONFIG, grid_size=grid_size, point_cloud_range=point_cloud_range, anchor_ndim=7
+    )
+    assigner = AxisAlignedTargetAssigner(
+        model_cfg=head_cfg, class_names=class_names, box_coder=box_coder_utils.ResidualCoder(code_size=7),
+        match_height=head_cfg.TARGET_ASSIGNER_CONFIG.MATCH_HEIGHT
+    )
+    return assigner, anchors, head_cfg, class_names, point_cloud_range
+
+
+def get_random_gt_boxes(head_cfg, class_names, point_cloud_range, batch_size, max_gt, rng):
+    """
+    (B, max_gt, 8) boxes of anchor-like sizes, each sample is padded with zero boxes after its own number of gts
+    """
+    gt_boxes = np.zeros((batch_size, max_gt, 8), dtype=np.float32)
+    for k in range(batch_size):
+        num_gt = rng.randint(1, max_gt + 1) if k > 0 else max_gt
+        for i in range(num_gt):
+            class_idx = rng.randint(len(head_cfg.ANCHOR_GENERATOR_CONFIG))
+            anchor_cfg = head_cfg.ANCHOR_GENERATOR_CONFIG[class_idx]
+            gt_boxes[k, i, 0:2] = rng.uniform(point_cloud_range[0:2] + 2, point_cloud_range[3:5] - 2)
+            gt_boxes[k, i, 2] = anchor_cfg['anchor_bottom_heights'][0] + 1
+            gt_boxes[k, i, 3:6] = np.array(anchor_cfg['anchor_sizes'][0]) * rng.uniform(0.8, 1.2, size=3)
+            gt_boxes[k, i, 6] = rng.uniform(-np.pi, np.pi)
+            gt_boxes[k, i, 7] = class_names.index(anchor_cfg['class_name']) + 1
+    return torch.from_numpy(gt_boxes)
+
+
+def assert_same_targets(targets, ref_targets):
+    assert torch.equal(targets['box_cls_labels'], ref_targets['box_cls_labels'])
+    assert torch.equal(targets['reg_weights'], ref_targets['reg_weights'])
+    assert torch.allclose(targets['box_reg_targets'], ref_targets['box_reg_targets'], atol=1e-5)
+
+
+@pytest.mark.parametrize('name', list(HEAD_CFGS.keys()))
+def test_batched_assignment_matches_per_sample_loop(name):
+    assigner, anchors, head_cfg, class_names, point_cloud_range = get_assigner_and_anchors(name, SPARSE_IOU=False)
+    gt_boxes = get_random_gt_boxes(head_cfg, class_names, point_cloud_range, 3, 12, np.random.RandomState(0))
+
+    assigner.batched_assignment = True
+    targets = assigner.assign_targets(anchors, gt_boxes)
+    assigner.batched_assignment = False
+    ref_targets = assigner.assign_targets(anchors, gt_boxes)
+    assert (ref_targets['box_cls_labels'] > 0).any()
+    assert_same_targets(targets, ref_targets)
+
+
+def test_batched_assignment_without_gt():
+    assigner, anchors, _, _, _ = get_assigner_and_anchors('kitti_pointpillar')
+    targets = assigner.assign_targets(anchors, torch.zeros(2, 0, 8))
+    assert (targets['box_cls_labels'] == 0).all() and (targets['reg_weights'] == 0).all()
+
+
+@pytest.mark.parametrize('name', list(HEAD_CFGS.keys()))
+def test_sparse_iou_matches_dense(name):
+    assigner, anchors, head_cfg, class_names, point_cloud_range = get_assigner_and_anchors(name, SPARSE_IOU=False)
+    gt_boxes = get_random_gt_boxes(head_cfg, class_names, point_cloud_range, 3, 12, np.random.RandomState(1))
+
+    ref_targets = assigner.assign_targets(anchors, gt_boxes)
+    assigner.sparse_iou = True
+    targets = assigner.assign_targets(anchors, gt_boxes)
+    assert (ref_targets['box_cls_labels'] > 0).any()
+    assert_same_targets(targets, ref_targets)
+
+
+def test_sparse_iou_fallbacks_match_dense(monkeypatch):
+    """
+    Sparse assignment with the sort-based scatter_reduce and searchsorted used on torch<1.12 and torch<1.6
+    """
+    assigner, anchors, head_cfg, class_names, point_cloud_range = get_assigner_and_anchors('nuscenes_pp_multihead')
+    gt_boxes = get_random_gt_boxes(head_cfg, class_names, point_cloud_range, 2, 12, np.random.RandomState(2))
+    assigner.sparse_iou = False
+    ref_targets = assigner.assign_targets(anchors, gt_boxes)
+
+    monkeypatch.setattr(common_utils, 'scatter_reduce', common_utils.scatter_reduce_sorted)
+    monkeypatch.delattr(torch, 'searchsorted')
+    assigner.sparse_iou = True
+    assert_same_targets(assigner.assign_targets(anchors, gt_boxes), ref_targets)
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from pcdet.datasets.processor.voxel_generator import VoxelGenerator
+
+
+def points_to_voxel_reference(points, voxel_size, point_cloud_range, max_num_points, max_voxels):
+    """
+    Point-by-point loop of spconv points_to_voxel_3d_np
+    """
+    voxel_size = np.array(voxel_size, dtype=np.float32)
+    point_cloud_range = np.array(point_cloud_range, dtype=np.float32)
+    grid_size = np.round((point_cloud_range[3:6] - point_cloud_range[0:3]) / voxel_size).astype(np.int64)
+    coor_to_voxelidx = {}
+    voxels, coordinates, num_points_per_voxel = [], [], []
+    for point in points:
+        coor = np.floor((point[0:3] - point_cloud_range[0:3]) / voxel_size).astype(np.int64)
+        if (coor < 0).any() or (coor >= grid_size).any():
+            continue
+        key = (coor[2], coor[1], coor[0])
+        voxelidx = coor_to_voxelidx.get(key, -1)
+        if voxelidx == -1:
+            if len(voxels) >= max_voxels:
+                continue
+            voxelidx = coor_to_voxelidx[key] = len(voxels)
+            voxels.append(np.zeros((max_num_points, points.shape[1]), dtype=points.dtype))
+            coordinates.append(key)
+            num_points_per_voxel.append(0)
+        num = num_points_per_voxel[voxelidx]
+        if num < max_num_points:
+            voxels[voxelidx][num] = point
+            num_points_per_voxel[voxelidx] += 1
+    return (np.array(voxels, dtype=points.dtype).reshape(-1, max_num_points, points.shape[1]),
+            np.array(coordinates, dtype=np.int32).reshape(-1, 3), np.array(num_points_per_voxel, dtype=np.int32))
+
+
+def get_random_points(num_points, rng):
+    points = rng.uniform([-2, -2, -3.5, 0], [8, 4, 1.5, 1], size=(num_points, 4)).astype(np.float32)
+    # dense clusters to fill voxels beyond max_num_points
+    points[:num_points // 4, 0:3] = rng.normal([3, 1, -1], 0.05, size=(num_points // 4, 3))
+    return points
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('max_voxels', [20000, 150])
+def test_voxel_generator_matches_spconv_loop(seed, max_voxels):
+    rng = np.random.RandomState(seed)
+    points = get_random_points(2000, rng)
+    voxel_cfg = dict(voxel_size=[0.4, 0.4, 0.5], point_cloud_range=[0, -1.6, -3, 6.4, 3.2, 1],
+                     max_num_points=5, max_voxels=max_voxels)
+
+    voxels, coordinates, num_points = VoxelGenerator(**voxel_cfg).generate(points)
+    ref_voxels, ref_coordinates, ref_num_points = points_to_voxel_reference(points, **voxel_cfg)
+    if max_voxels < 20000:
+        assert coordinates.shape[0] == max_voxels
+    assert (ref_num_points == 5).any()
+    np.testing.assert_array_equal(coordinates, ref_coordinates)
+    np.testing.assert_array_equal(num_points, ref_num_points)
+    np.testing.assert_array_equal(voxels, ref_voxels)
+    assert coordinates.dtype == np.int32 and num_points.dtype == np.int32
+
+
+def test_voxel_generator_matches_spconv():
+    spconv_utils = pytest.importorskip('spconv.utils')
+    if not hasattr(spconv_utils, 'VoxelGenerator'):
+        pytest.skip('spconv 1.x is not installed')
+    points = get_random_points(5000, np.random.RandomState(0))
+    voxel_cfg = dict(voxel_size=[0.2, 0.2, 0.25], point_cloud_range=[0, -1.6, -3, 6.4, 3.2, 1],
+                     max_num_points=5, max_voxels=1000)
+
+    voxels, coordinates, num_points = VoxelGenerator(**voxel_cfg).generate(points)
+    ref_output = spconv_utils.VoxelGenerator(**voxel_cfg).generate(points)
+    if isinstance(ref_output, dict):
+        ref_output = ref_output['voxels'], ref_output['coordinates'], ref_output['num_points_per_voxel']
+    np.testing.assert_array_equal(coordinates, ref_output[1])
+    np.testing.assert_array_equal(num_points, ref_output[2])
+    np.testing.assert_array_equal(voxels, ref_output[0])
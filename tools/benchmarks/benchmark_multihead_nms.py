@@ -0,0 +1,145 @@
+"""
+Latency of the multi-classes NMS post-processing of the 10-class nuScenes multihead config: the former loop over
+samples, heads and classes (multi_classes_nms) against batched_multi_classes_nms, on synthetic head outputs with the
+anchor layout of the config (128 x 128 locations, 2 rotations per class) and clusters of confident boxes around the
+objects of each sample. The outputs of both paths are checked to be the same.
+    python benchmarks/benchmark_multihead_nms.py --cfg_file cfgs/nuscenes_models/cbgs_pp_multihead.yaml
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+import yaml
+from easydict import EasyDict
+
+from pcdet.models.model_utils import model_nms_utils
+
+
+def get_head_outputs(cfg, batch_size, num_objects, boxes_per_object, device, rng):
+    """
+    Returns:
+        box_preds: (B, num_boxes, 7), the boxes of each head are consecutive
+        cls_preds: [(B, num_head_boxes, num_head_classes), ...] sigmoid scores
+        label_mapping: [(num_head_classes), ...] class index starting from 1
+    """
+    point_cloud_range = np.array(cfg.DATA_CONFIG.POINT_CLOUD_RANGE)
+    voxel_size = np.array(cfg.DATA_CONFIG.DATA_PROCESSOR[-1].VOXEL_SIZE)
+    head_cfg = cfg.MODEL.DENSE_HEAD
+    stride = head_cfg.ANCHOR_GENERATOR_CONFIG[0]['feature_map_stride']
+    num_locations = int(np.prod(np.round((point_cloud_range[3:5] - point_cloud_range[0:2]) / voxel_size[0:2])) /
+                        stride ** 2)
+    num_anchors_per_class = num_locations * len(head_cfg.ANCHOR_GENERATOR_CONFIG[0]['anchor_rotations'])
+
+    box_preds, cls_preds, label_mapping = [], [], []
+    for rpn_head_cfg in head_cfg.RPN_HEAD_CFGS:
+        num_head_classes = len(rpn_head_cfg['HEAD_CLS_NAME'])
+        num_head_boxes = num_anchors_per_class * num_head_classes
+        boxes = np.zeros((batch_size, num_head_boxes, 7), dtype=np.float32)
+        boxes[..., 0:2] = rng.uniform(point_cloud_range[0:2], point_cloud_range[3:5], size=(batch_size, num_head_boxes, 2))
+        boxes[..., 3:6] = rng.uniform(0.5, 5, size=(batch_size, num_head_boxes, 3))
+        boxes[..., 6] = rng.uniform(-np.pi, np.pi, size=(batch_size, num_head_boxes))
+        logits = rng.normal(-6, 1, size=(batch_size, num_head_boxes, num_head_classes)).astype(np.float32)
+        for k in range(batch_size):
+            # confident overlapping boxes around each object, as around the anchors of a real detection
+            idxs = rng.choice(num_head_boxes, size=(num_objects, boxes_per_object), replace=False)
+            centers = rng.uniform(point_cloud_range[0:2], point_cloud_range[3:5], size=(num_objects, 1, 2))
+            boxes[k, idxs, 0:2] = centers + rng.normal(0, 0.3, size=(num_objects, boxes_per_object, 2))
+            boxes[k, idxs, 3:6] = rng.uniform(1, 4, size=(num_objects, 1, 3))
+            logits[k, idxs, rng.randint(num_head_classes, size=(num_objects, 1))] = \
+                rng.normal(1, 1.5, size=(num_objects, boxes_per_object))
+        box_preds.append(boxes)
+        cls_preds.append(torch.sigmoid(torch.from_numpy(logits)).to(device))
+        label_mapping.append(torch.tensor(
+            [cfg.CLASS_NAMES.index(name) + 1 for name in rpn_head_cfg['HEAD_CLS_NAME']], device=device
+        ))
+    return torch.from_numpy(np.concatenate(box_preds, axis=1)).to(device), cls_preds, label_mapping
+
+
+def loop_nms(box_preds, cls_preds, label_mapping, post_process_cfg):
+    """
+    Multi-classes NMS of Detector3DTemplate.post_processing before batched_multi_classes_nms
+    """
+    results = []
+    for index in range(box_preds.shape[0]):
+        cur_start_idx = 0
+        pred_scores, pred_labels, pred_boxes = [], [], []
+        for cur_cls_preds, cur_label_mapping in zip(cls_preds, label_mapping):
+            cur_cls_preds = cur_cls_preds[index]
+            cur_pred_scores, cur_pred_labels, cur_pred_boxes = model_nms_utils.multi_classes_nms(
+                cls_scores=cur_cls_preds, box_preds=box_preds[index, cur_start_idx:cur_start_idx + cur_cls_preds.shape[0]],
+                nms_config=post_process_cfg.NMS_CONFIG, score_thresh=post_process_cfg.SCORE_THRESH
+            )
+            pred_scores.append(cur_pred_scores)
+            pred_labels.append(cur_label_mapping[cur_pred_labels])
+            pred_boxes.append(cur_pred_boxes)
+            cur_start_idx += cur_cls_preds.shape[0]
+        results.append((torch.cat(pred_scores), torch.cat(pred_labels), torch.cat(pred_boxes)))
+    return results
+
+
+def batched_nms(box_preds, cls_preds, label_mapping, post_process_cfg):
+    """
+    Multi-classes NMS of Detector3DTemplate.batched_multi_classes_nms
+    """
+    batch_size, num_boxes = box_preds.shape[0:2]
+    batch_box_idxs = torch.arange(batch_size * num_boxes, device=box_preds.device).view(batch_size, num_boxes)
+    batch_index = torch.arange(batch_size, device=box_preds.device)[:, None].expand(-1, num_boxes).reshape(-1)
+    cur_start_idx = 0
+    box_idxs, flat_cls_preds = [], []
+    for cur_cls_preds in cls_preds:
+        box_idxs.append(batch_box_idxs[:, cur_start_idx:cur_start_idx + cur_cls_preds.shape[1]].reshape(-1))
+        flat_cls_preds.append(cur_cls_preds.reshape(-1, cur_cls_preds.shape[-1]))
+        cur_start_idx += cur_cls_preds.shape[1]
+
+    pred_scores, pred_columns, pred_boxes, pred_batch_index = model_nms_utils.batched_multi_classes_nms(
+        cls_scores=flat_cls_preds, box_preds=box_preds.view(-1, box_preds.shape[-1]), batch_index=batch_index,
+        nms_config=post_process_cfg.NMS_CONFIG, score_thresh=post_process_cfg.SCORE_THRESH, box_idxs=box_idxs
+    )
+    pred_labels = torch.cat(label_mapping)[pred_columns]
+    return [(pred_scores[pred_batch_index == k], pred_labels[pred_batch_index == k], pred_boxes[pred_batch_index == k])
+            for k in range(batch_size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='arg parser')
+    parser.add_argument('--cfg_file', type=str, default='cfgs/nuscenes_models/cbgs_pp_multihead.yaml')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num_objects', type=int, default=40, help='number of objects per sample and head')
+    parser.add_argument('--boxes_per_object', type=int, default=20, help='confident boxes per object')
+    parser.add_argument('--num_repeats', type=int, default=10)
+    args = parser.parse_args()
+
+    with open(args.cfg_file, 'r') as f:
+        cfg = EasyDict(yaml.safe_load(f))
+    post_process_cfg = cfg.MODEL.POST_PROCESSING
+    device = torch.device(args.device)
+    print('%s on %s, NMS_TYPE %s' % (args.cfg_file, device, post_process_cfg.NMS_CONFIG.NMS_TYPE))
+    print('batch_size | num_boxes | candidates | loop (ms) | batched (ms)')
+    for batch_size in [1, 2, 4]:
+        rng = np.random.RandomState(batch_size)
+        box_preds, cls_preds, label_mapping = get_head_outputs(
+            cfg, batch_size, args.num_objects, args.boxes_per_object, device, rng
+        )
+        num_candidates = sum([(x >= post_process_cfg.SCORE_THRESH).sum().item() for x in cls_preds])
+        times = {}
+        for name, func in [('loop', loop_nms), ('batched', batched_nms)]:
+            results = func(box_preds, cls_preds, label_mapping, post_process_cfg)
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            start_time = time.time()
+            for _ in range(args.num_repeats):
+                func(box_preds, cls_preds, label_mapping, post_process_cfg)
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            times[name] = ((time.time() - start_time) / args.num_repeats * 1000, results)
+
+        for (scores, labels, boxes), (ref_scores, ref_labels, ref_boxes) in zip(times['batched'][1], times['loop'][1]):
+            assert torch.equal(scores, ref_scores) and torch.equal(labels, ref_labels) and torch.equal(boxes, ref_boxes)
+        print('%10d | %9d | %10d | %9.1f | %12.1f' % (
+            batch_size, box_preds.shape[1], num_candidates, times['loop'][0], times['batched'][0]
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+PointPillarScatter against the former per-sample loop, for batch sizes 1 to 16 on the kitti pointpillar grid
+(432 x 496, 64 features, 12000 pillars per sample), in inference and in training mode.
+    python benchmarks/benchmark_pillar_scatter.py --device cuda
+"""
+import argparse
+import time
+
+import torch
+from easydict import EasyDict
+
+from pcdet.models.backbones_2d.map_to_bev.pointpillar_scatter import PointPillarScatter
+
+GRID_SIZE = (432, 496, 1)
+NUM_BEV_FEATURES = 64
+
+
+def loop_scatter(pillar_features, coords, nx, ny, nz, num_bev_features):
+    """
+    Per-sample scatter of PointPillarScatter before the batched one
+    """
+    batch_spatial_features = []
+    batch_size = coords[:, 0].max().int().item() + 1
+    for batch_idx in range(batch_size):
+        spatial_feature = torch.zeros(
+            num_bev_features, nz * nx * ny, dtype=pillar_features.dtype, device=pillar_features.device
+        )
+        batch_mask = coords[:, 0] == batch_idx
+        this_coords = coords[batch_mask, :]
+        indices = (this_coords[:, 1] + this_coords[:, 2] * nx + this_coords[:, 3]).type(torch.long)
+        spatial_feature[:, indices] = pillar_features[batch_mask, :].t()
+        batch_spatial_features.append(spatial_feature)
+    return torch.stack(batch_spatial_features, 0).view(batch_size, num_bev_features * nz, ny, nx)
+
+
+def get_batch(batch_size, num_pillars, device):
+    nx, ny, _ = GRID_SIZE
+    coords = []
+    for batch_idx in range(batch_size):
+        cells = torch.randperm(nx * ny)[:num_pillars]
+        coords.append(torch.stack((
+            torch.full_like(cells, batch_idx), torch.zeros_like(cells), cells // nx, cells % nx
+        ), dim=1))
+    coords = torch.cat(coords).int().to(device)
+    pillar_features = torch.randn(coords.shape[0], NUM_BEV_FEATURES, device=device)
+    return pillar_features, coords
+
+
+def timeit(func, device, num_repeats):
+    func()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start_time = time.time()
+    for _ in range(num_repeats):
+        func()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.time() - start_time) / num_repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='arg parser')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num_pillars', type=int, default=12000, help='number of pillars per sample')
+    parser.add_argument('--num_repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    scatter = PointPillarScatter(EasyDict(NUM_BEV_FEATURES=NUM_BEV_FEATURES), GRID_SIZE).to(device)
+    nx, ny, nz = GRID_SIZE
+    print('batch_size | loop (ms) | batched eval (ms) | batched train (ms)')
+    for batch_size in [1, 2, 4, 8, 16]:
+        pillar_features, coords = get_batch(batch_size, args.num_pillars, device)
+
+        def batched():
+            return scatter({'pillar_features': pillar_features, 'voxel_coords': coords,
+                            'batch_size': batch_size})['spatial_features']
+
+        loop_time = timeit(lambda: loop_scatter(pillar_features, coords, nx, ny, nz, NUM_BEV_FEATURES),
+                           device, args.num_repeats)
+        scatter.eval()
+        with torch.no_grad():
+            eval_time = timeit(batched, device, args.num_repeats)
+            assert torch.equal(batched(), loop_scatter(pillar_features, coords, nx, ny, nz, NUM_BEV_FEATURES))
+        scatter.train()
+        train_time = timeit(batched, device, args.num_repeats)
+        print('%10d | %9.2f | %17.2f | %18.2f' % (batch_size, loop_time, eval_time, train_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Throughput of the NumPy VoxelGenerator and of the spconv one when it is installed, with the voxel settings of the
+kitti pointpillar config, on KITTI .bin frames or on random clouds of the same size.
+    python benchmarks/benchmark_voxel_generator.py --data_path ../data/kitti/training/velodyne
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from pcdet.datasets.processor.voxel_generator import VoxelGenerator
+
+VOXEL_CFG = dict(voxel_size=[0.16, 0.16, 4], point_cloud_range=[0, -39.68, -3, 69.12, 39.68, 1], max_num_points=32)
+MAX_VOXELS = {'train': 16000, 'test': 40000}
+
+
+def get_spconv_generator_class():
+    try:
+        from spconv.utils import VoxelGeneratorV2 as SpconvVoxelGenerator
+    except ImportError:
+        try:
+            from spconv.utils import VoxelGenerator as SpconvVoxelGenerator
+        except ImportError:
+            SpconvVoxelGenerator = None
+    return SpconvVoxelGenerator
+
+
+def main():
+    parser = argparse.ArgumentParser(description='arg parser')
+    parser.add_argument('--data_path', type=str, default=None, help='directory of .bin frames, random if not given')
+    parser.add_argument('--num_frames', type=int, default=50, help='number of frames')
+    parser.add_argument('--num_points', type=int, default=120000, help='number of points of the random frames')
+    args = parser.parse_args()
+
+    if args.data_path is not None:
+        frames = [np.fromfile(str(x), dtype=np.float32).reshape(-1, 4)
+                  for x in sorted(Path(args.data_path).glob('*.bin'))[:args.num_frames]]
+    else:
+        rng = np.random.RandomState(0)
+        frames = [rng.uniform([-80, -80, -3, 0], [80, 80, 1, 1], size=(args.num_points, 4)).astype(np.float32)
+                  for _ in range(args.num_frames)]
+    num_points = sum(x.shape[0] for x in frames)
+
+    generators = [('numpy', VoxelGenerator)]
+    if get_spconv_generator_class() is not None:
+        generators.append(('spconv', get_spconv_generator_class()))
+    for mode, max_voxels in MAX_VOXELS.items():
+        for name, generator_class in generators:
+            voxel_generator = generator_class(max_voxels=max_voxels, **VOXEL_CFG)
+            voxel_generator.generate(frames[0])
+            start_time = time.time()
+            for points in frames:
+                voxel_generator.generate(points)
+            total_time = time.time() - start_time
+            print('%s %s (max_voxels=%d): %.2fms per frame, %.1fM points/s' % (
+                name, mode, max_voxels, total_time / len(frames) * 1000, num_points / total_time / 1e6
+            ))
+
+
+if __name__ == '__main__':
+    main()
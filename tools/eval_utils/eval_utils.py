@@ -5,7 +5,7 @@ import numpy as np
 import torch
 import tqdm
 
-from pcdet.models import load_data_to_gpu
+from pcdet.models import DataPrefetcher, load_data_to_gpu
 from pcdet.utils import common_utils
 
 
@@ -51,7 +51,7 @@ def eval_one_epoch(cfg, model, dataloader, epoch_id, logger, dist_test=False, sa
     if cfg.LOCAL_RANK == 0:
         progress_bar = tqdm.tqdm(total=len(dataloader), leave=True, desc='eval', dynamic_ncols=True)
     start_time = time.time()
-    for i, batch_dict in enumerate(dataloader):
+    for i, batch_dict in enumerate(DataPrefetcher(dataloader)):
         load_data_to_gpu(batch_dict)
         with torch.no_grad():
             pred_dicts, ret_dict = model(batch_dict)
@@ -1,7 +1,6 @@
 
 
 import rospy
-import ros_numpy
 import numpy as np
 import copy
 import json
@@ -17,7 +16,6 @@ from pathlib import Path
 from message_filters import TimeSynchronizer, Subscriber, ApproximateTimeSynchronizer
 from kitti_player_tracking.msg import matrices
 from std_msgs.msg import Header
-from pyquaternion import Quaternion
 import sensor_msgs.point_cloud2 as pc2
 from sensor_msgs.msg import PointCloud2, PointField
 from jsk_recognition_msgs.msg import BoundingBox, BoundingBoxArray
@@ -26,11 +24,12 @@ from t4ac_perception_msgs.msg import bev_obstacle, bev_obstacles_list, bev_obsta
 
 
 from pcdet.datasets import DatasetTemplate
-from pcdet.models import build_network, load_data_to_gpu
+from pcdet.models import build_network, load_data_to_device
 from pcdet.config import cfg, cfg_from_yaml_file
 from pcdet.utils import common_utils
 
 from pcdet.utils import box_utils, calibration_kitti, common_utils, object3d_kitti
+from ros_utils import detection_utils, pipeline, pointcloud2_utils
 
 
 class DemoDataset(DatasetTemplate):
@@ -72,9 +71,6 @@ class DemoDataset(DatasetTemplate):
         data_dict = self.prepare_data(data_dict=input_dict)
         return data_dict
 
-def yaw2quaternion(yaw: float) -> Quaternion:
-    return Quaternion(axis=[0,0,1], radians=yaw)
-
 def get_annotations_indices(types, thresh, label_preds, scores):
     indexs = []
     annotation_indices = []
@@ -165,19 +161,18 @@ class Processor_ROS:
         return ret_dict
 
     def run(self, points, calib, frame):
-        t_t = time.time()
+        """
+        Args:
+            points: (N, 5) [x, y, z, intensity, timestamp] from PointCloud2Decoder, already shifted by movelidarcenter
+        """
+        return self.inference(self.preprocess(points, frame), calib)
+
+    def preprocess(self, points, frame):
+        """
+        CPU part of run, the collated batch no longer references points, which could then be reused by the decoder
+        """
         print(f"input points shape: {points.shape}")
-        num_features = 4        
-        self.points = points.reshape([-1, num_features])
-        #print("points", self.points)
-
-        frame = 0
-        timestamps = np.empty((len(self.points),1))
-        timestamps[:] = frame
-        print("Timestamps", timestamps.shape)
-        self.points = np.append(self.points, timestamps, axis=1)
-        self.points[:,0] += movelidarcenter
-        #print("points2", self.points)
+        self.points = points
 
         input_dict = {
             'points': self.points,
@@ -186,12 +181,16 @@ class Processor_ROS:
 
         data_dict = self.demo_dataset.prepare_data(data_dict=input_dict)
         data_dict = self.demo_dataset.collate_batch([data_dict])
-        load_data_to_gpu(data_dict)
+        return data_dict
+
+    def inference(self, data_dict, calib):
+        load_data_to_device(data_dict, self.device, non_blocking=True)
 
         torch.cuda.synchronize()
         t = time.time()
 
-        pred_dicts, _ = self.net.forward(data_dict)
+        with torch.no_grad():
+            pred_dicts, _ = self.net.forward(data_dict)
         
         torch.cuda.synchronize()
         inference_time = time.time() - t
@@ -211,7 +210,7 @@ class Processor_ROS:
         pred_boxes = np.copy(boxes_lidar)
         pred_dict = self.get_template_prediction(scores.shape[0])
         if scores.shape[0] == 0:
-            return pred_dict
+            return scores, boxes_lidar, types, pred_dict
 
         #image_shape = input_dict['image_shape'][batch_index]
         pred_boxes_camera = box_utils.boxes3d_lidar_to_kitti_camera(pred_boxes, calib)
@@ -231,19 +230,6 @@ class Processor_ROS:
 
         return scores, boxes_lidar, types, pred_dict
 
-def get_xyz_points(cloud_array, remove_nans=True, dtype=np.float):
-    '''
-    '''
-    if remove_nans:
-        mask = np.isfinite(cloud_array['x']) & np.isfinite(cloud_array['y']) & np.isfinite(cloud_array['z'])
-        cloud_array = cloud_array[mask]
-
-    points = np.zeros(cloud_array.shape + (4,), dtype=dtype)
-    points[...,0] = cloud_array['x']
-    points[...,1] = cloud_array['y']
-    points[...,2] = cloud_array['z']
-    return points
-
 def xyz_array_to_pointcloud2(points_sum, stamp=None, frame_id=None):
     '''
     Create a sensor_msgs.PointCloud2 from an array of points.
@@ -269,19 +255,12 @@ def xyz_array_to_pointcloud2(points_sum, stamp=None, frame_id=None):
     return msg
 
 
-def rotz(t):
-    ''' Rotation about the z-axis. '''
-    c = np.cos(t)
-    s = np.sin(t)
-    return np.array([[c,  -s,  0],
-                     [s,   c,  0],
-                     [0,   0,  1]])
+TYPE_NAMES = {1: "Pedestrian", 2: "Car", 3: "Cyclist"}
 
 
 def anno_to_sort(dt_box_lidar, scores, types):
 
     pp_list = bev_obstacles_list()		##CREO EL MENSAJE
-    objects_list = []
 
     point_cloud_range = cfg.DATA_CONFIG.POINT_CLOUD_RANGE			##LLENO VALORES GENERICOS
     pp_list.header.stamp = rospy.Time.now()
@@ -290,52 +269,26 @@ def anno_to_sort(dt_box_lidar, scores, types):
     pp_list.left = point_cloud_range[1]
     pp_list.right = point_cloud_range[4]
 
-    if scores.size != 0:
-        for i in range(scores.size):
-            if scores[i] > threshold:
-
-                obj         = bev_obstacle()
-                #obj.type    = int(types[i])
-                obj.score   = scores[i]
-
-                rotation = dt_box_lidar[i][6]
-
-                if rotation > math.pi:
-                    rotation = rotation - math.pi
-                R = rotz(-rotation)
-
-                # 3d bounding box corners
-                l = float(dt_box_lidar[i][3])  #in lidar_frame coordinates
-                w = float(dt_box_lidar[i][4])
-                location_x = -float(dt_box_lidar[i][1])
-                location_y = -(float(dt_box_lidar[i][0]) - movelidarcenter)
-                x_corners = [-l/2,-l/2,l/2, l/2]
-                y_corners = [ w/2,-w/2,w/2,-w/2]
-                z_corners = [0,0,0,0]
-                corners_3d = np.dot(R, np.vstack([x_corners,y_corners,z_corners]))[0:2]
-                corners_3d = corners_3d + np.vstack([location_x, location_y])
-
-                obj.x           = location_x
-                obj.y           = location_y
-                obj.tl_br       = [0,0,0,0]     #2D bbox top-left, bottom-right  xy coordinates
-                obj.x_corners   = [corners_3d[0,0], corners_3d[0,1], corners_3d[0,2], corners_3d[0,3]]  #Array of x coordinates (upper left, upper right, lower left, lower right)
-                obj.y_corners   = [corners_3d[1,0], corners_3d[1,1], corners_3d[1,2], corners_3d[1,3]]
-                obj.l           = l             #in lidar_frame coordinates
-                obj.w           = w             #in lidar_frame coordinates
-                obj.o           = rotation      #in lidar_frame coordinates
-
-                if int(types[i]) == 1:
-                    type_obj_str = "Pedestrian"
-
-                elif int(types[i]) == 2:
-                    type_obj_str = "Car"
-
-                elif int(types[i]) == 3:
-                    type_obj_str = "Cyclist"
-
-                #obj.type = type_obj_str
-
-                pp_list.bev_obstacles_list.append(obj)
+    mask = scores > threshold
+    boxes = dt_box_lidar[mask]
+    # all the corners of the frame in one pass, only the field assignment is left per object
+    locations, corners, rotations = detection_utils.get_sort_corners(boxes, x_offset=movelidarcenter)
+    locations, corners, rotations = locations.tolist(), corners.tolist(), rotations.tolist()
+    dims = boxes[:, 3:5].tolist()
+    for i, score in enumerate(scores[mask]):
+        obj         = bev_obstacle()
+        obj.score   = score
+
+        obj.x           = locations[i][0]
+        obj.y           = locations[i][1]
+        obj.tl_br       = [0,0,0,0]     #2D bbox top-left, bottom-right  xy coordinates
+        obj.x_corners   = [corner[0] for corner in corners[i]]  #Array of x coordinates (upper left, upper right, lower left, lower right)
+        obj.y_corners   = [corner[1] for corner in corners[i]]
+        obj.l           = dims[i][0]    #in lidar_frame coordinates
+        obj.w           = dims[i][1]    #in lidar_frame coordinates
+        obj.o           = rotations[i]  #in lidar_frame coordinates
+
+        pp_list.bev_obstacles_list.append(obj)
 
     return pp_list
 
@@ -368,9 +321,13 @@ def anno_to_AB3DMOT(dt_box_lidar, scores, types, msg):
     return object_list
 
 def anno_to_3Dsort(dt_box_lidar, types):
+    """
+    Args:
+        dt_box_lidar: (N, 10) [x, y, z, dx, dy, dz, heading, rho, phi, score] from sortbydistance
+        types: (N) in the order of dt_box_lidar
+    """
 
     pp_list_3D = bev_obstacles_3D_list()		##CREO EL MENSAJE
-    objects_list = []
 
     point_cloud_range = cfg.DATA_CONFIG.POINT_CLOUD_RANGE			##LLENO VALORES GENERICOS
     pp_list_3D.header.stamp = rospy.Time.now()
@@ -379,68 +336,41 @@ def anno_to_3Dsort(dt_box_lidar, types):
     pp_list_3D.left = point_cloud_range[1]
     pp_list_3D.right = point_cloud_range[4]
 
-    if dt_box_lidar.size != 0:
-        for i in range(len(dt_box_lidar)):
-            if dt_box_lidar[i][-1] > threshold:
-
-
-                obj         = bev_obstacle_3D()
-                #obj.type    = int(types[i])
-                #obj.score   = scores[i]
-                obj.score   = dt_box_lidar[i][-1]
-
-                rotation = dt_box_lidar[i][6]
-
-                if rotation > math.pi:
-                    rotation = rotation - math.pi
-                R = rotz(rotation)
-
-                # 3d bounding box corners
-                l = float(dt_box_lidar[i][3])  #in lidar_frame coordinates
-                w = float(dt_box_lidar[i][4])
-                h = float(dt_box_lidar[i][5])
-                '''
-                location_x = -float(dt_box_lidar[i][1])
-                location_y = -(float(dt_box_lidar[i][0]) - movelidarcenter)
-                location_z = -float(dt_box_lidar[i][2])
-                '''
-                location_x = (float(dt_box_lidar[i][0]) - movelidarcenter)
-                location_y = float(dt_box_lidar[i][1])
-                location_z = float(dt_box_lidar[i][2])
-                x_corners = [-l/2,-l/2, l/2, l/2,-l/2,-l/2,l/2, l/2]
-                y_corners = [ w/2,-w/2, w/2,-w/2, w/2,-w/2,w/2,-w/2]
-                z_corners = [-h/2,-h/2,-h/2,-h/2, h/2, h/2,h/2, h/2]
-                corners_3d = np.dot(R, np.vstack([x_corners,y_corners,z_corners]))
-                corners_3d = corners_3d + np.vstack([location_x, location_y, location_z])
-
-                obj.x            = -location_y
-                obj.y            = -location_x
-                obj.x_lidar      = float(dt_box_lidar[i][0]) - movelidarcenter
-                obj.y_lidar      = float(dt_box_lidar[i][1])
-                obj.z_lidar      = float(dt_box_lidar[i][2])
-                obj.tl_br        = [0,0,0,0]     #2D bbox top-left, bottom-right  xy coordinates
-                obj.x_corners    = [corners_3d[0,0], corners_3d[0,1], corners_3d[0,2], corners_3d[0,3]]  #Array of x coordinates (upper left, upper right, lower left, lower right)
-                obj.y_corners    = [corners_3d[1,0], corners_3d[1,1], corners_3d[1,2], corners_3d[1,3]]
-                obj.x_corners_3D = [corners_3d[0,0], corners_3d[0,1], corners_3d[0,2], corners_3d[0,3], corners_3d[0,4], corners_3d[0,5], corners_3d[0,6], corners_3d[0,7]]
-                obj.y_corners_3D = [corners_3d[1,0], corners_3d[1,1], corners_3d[1,2], corners_3d[1,3], corners_3d[1,4], corners_3d[1,5], corners_3d[1,6], corners_3d[1,7]]
-                obj.z_corners_3D = [corners_3d[2,0], corners_3d[2,1], corners_3d[2,2], corners_3d[2,3], corners_3d[2,4], corners_3d[2,5], corners_3d[2,6], corners_3d[2,7]]
-                obj.l            = l             #in lidar_frame coordinates
-                obj.w            = w             #in lidar_frame coordinates
-                obj.h            = h             #in lidar_frame coordinates
-                obj.o            = -rotation- math.pi/2      #in lidar_frame coordinates
-
-                if int(types[i]) == 1:
-                    type_obj_str = "Pedestrian"
-
-                elif int(types[i]) == 2:
-                    type_obj_str = "Car"
-
-                elif int(types[i]) == 3:
-                    type_obj_str = "Cyclist"
-
-                obj.type = type_obj_str
-
-                pp_list_3D.bev_obstacles_3D_list.append(obj)
+    if dt_box_lidar.size == 0:
+        return pp_list_3D
+
+    mask = dt_box_lidar[:, -1] > threshold
+    boxes = dt_box_lidar[mask]
+    locations, corners, rotations = detection_utils.get_3d_sort_corners(boxes, x_offset=movelidarcenter)
+    corners = corners.transpose(0, 2, 1).tolist()  # (N, 3, 8)
+    locations, rotations, dims = locations.tolist(), rotations.tolist(), boxes[:, 3:6].tolist()
+    box_types = types[mask].tolist()
+    for i, score in enumerate(boxes[:, -1]):
+        obj         = bev_obstacle_3D()
+        obj.score   = score
+
+        location_x, location_y, location_z = locations[i]
+        obj.x            = -location_y
+        obj.y            = -location_x
+        obj.x_lidar      = location_x
+        obj.y_lidar      = location_y
+        obj.z_lidar      = location_z
+        obj.tl_br        = [0,0,0,0]     #2D bbox top-left, bottom-right  xy coordinates
+        obj.x_corners    = corners[i][0][0:4]  #Array of x coordinates (upper left, upper right, lower left, lower right)
+        obj.y_corners    = corners[i][1][0:4]
+        obj.x_corners_3D = corners[i][0]
+        obj.y_corners_3D = corners[i][1]
+        obj.z_corners_3D = corners[i][2]
+        obj.l            = dims[i][0]             #in lidar_frame coordinates
+        obj.w            = dims[i][1]             #in lidar_frame coordinates
+        obj.h            = dims[i][2]             #in lidar_frame coordinates
+        obj.o            = -rotations[i]- math.pi/2      #in lidar_frame coordinates
+
+        type_obj_str = TYPE_NAMES.get(box_types[i])
+        if type_obj_str is not None:
+            obj.type = type_obj_str
+
+        pp_list_3D.bev_obstacles_3D_list.append(obj)
 
     return pp_list_3D
 
@@ -448,61 +378,37 @@ def anno_to_rviz(dt_box_lidar, scores, types, msg):
 
     MarkerArray_list = MarkerArray()		##CREO EL MENSAJE GENERAL
 
-    if scores.size != 0:
-        for i in range(scores.size):
-            if scores[i] > threshold:
-                obj = Marker()
-                obj.header.stamp = rospy.Time.now()
-                obj.header.frame_id = msg.header.frame_id
-                obj.type = Marker.CUBE
-                obj.id = i
-                obj.lifetime = rospy.Duration.from_sec(1)
-                obj.pose.position.x = float(dt_box_lidar[i][0]) - movelidarcenter
-                obj.pose.position.y = float(dt_box_lidar[i][1])
-                obj.pose.position.z = float(dt_box_lidar[i][2])
-                q = yaw2quaternion(float(dt_box_lidar[i][6]))
-                obj.pose.orientation.x = q[1] 
-                obj.pose.orientation.y = q[2]
-                obj.pose.orientation.z = q[3]
-                obj.pose.orientation.w = q[0]
-                obj.scale.x = float(dt_box_lidar[i][3])
-                obj.scale.y = float(dt_box_lidar[i][4])
-                obj.scale.z = float(dt_box_lidar[i][5])
-                obj.color.r = 255
-                obj.color.a = 0.5
-            
-                MarkerArray_list.markers.append(obj)
+    idxs = np.nonzero(scores > threshold)[0]
+    boxes = dt_box_lidar[idxs]
+    positions = (boxes[:, 0:3] - np.array([movelidarcenter, 0, 0])).tolist()
+    quaternions = detection_utils.yaw_to_quaternions(boxes[:, 6]).tolist()
+    dims = boxes[:, 3:6].tolist()
+    for k, i in enumerate(idxs.tolist()):
+        obj = Marker()
+        obj.header.stamp = rospy.Time.now()
+        obj.header.frame_id = msg.header.frame_id
+        obj.type = Marker.CUBE
+        obj.id = i
+        obj.lifetime = rospy.Duration.from_sec(1)
+        obj.pose.position.x, obj.pose.position.y, obj.pose.position.z = positions[k]
+        obj.pose.orientation.w, obj.pose.orientation.x, obj.pose.orientation.y, obj.pose.orientation.z = quaternions[k]
+        obj.scale.x, obj.scale.y, obj.scale.z = dims[k]
+        obj.color.r = 255
+        obj.color.a = 0.5
+
+        MarkerArray_list.markers.append(obj)
 
     return MarkerArray_list
 
 def sortbydistance(dt_box_lidar, scores, types):
-    arr = np.empty((0,2), float)
-    #Find objects with score under threshold
-    index = np.where(scores < threshold)
-    annos = np.copy(dt_box_lidar)
-    annos = np.delete(annos, obj=index, axis=0)
-    scores_over_threshold = np.copy(scores)
-    scores_over_threshold = np.delete(scores_over_threshold, obj=index, axis=0)
-    #Calculate distance between object and vehicle
-    for i in range(len(annos)):
-        x_lidar = float(annos[i][0]) - movelidarcenter
-        y_lidar = float(annos[i][1])
-        rho, phi = cart2pol(x_lidar, y_lidar)
-        arr = np.append(arr, np.array([[rho, phi]]), axis=0)
-    #Add column values to array
-    annos_with_distance = np.append(annos, arr, axis=1)
-    scores_over_threshold = scores_over_threshold.reshape((-1,1))
-    annos_with_distance = np.append(annos_with_distance, scores_over_threshold, axis=1)
-    #Sort by distance (rho)
-    annos_sorted = annos_with_distance[annos_with_distance[:,-3].argsort()]
-    #print("annos_sorted", annos_sorted)
-    return annos_sorted
-
-
-def cart2pol(x, y):
-        rho = np.sqrt(x**2 + y**2)
-        phi = np.arctan2(y, x)
-        return(rho, phi)
+    """
+    Returns:
+        annos_sorted: (M, 10) [x, y, z, dx, dy, dz, heading, rho, phi, score] of the boxes over threshold
+        types_sorted: (M), types in the same order
+    """
+    annos_sorted, order = detection_utils.sort_by_distance(dt_box_lidar, scores, threshold, x_offset=movelidarcenter)
+    return annos_sorted, types[order]
+
 
 def getCalibfromFile(calib_file):
     return calibration_kitti.Calibration(calib_file)
@@ -531,66 +437,44 @@ def getCalibfromROS(calibmsg):
     return calib
 
 
-def rslidar_callback(msg):
-    t_t = time.time()
-
-    
-    #calib = getCalibfromFile(calib_file)
-    #calib = getCalibfromROS(calibmsg)
-
-    frame = msg.header.seq
-
+def build_detection_messages(msg, scores, dt_box_lidar, types):
+    """
+    Detection messages of one frame for DetectionStages.publish, in the publish order
+    Returns:
+        messages: dict, publisher name => message
+    """
     arr_bbox = BoundingBoxArray()
 
-    msg_cloud = ros_numpy.point_cloud2.pointcloud2_to_array(msg)
-    np_p = get_xyz_points(msg_cloud, True)
-    print("  ")
-    #scores, dt_box_lidar, types = proc_1.run(np_p)
-    scores, dt_box_lidar, types, pred_dict = proc_1.run(np_p, calib, frame)
-
-    annos_sorted = sortbydistance(dt_box_lidar, scores, types)
+    annos_sorted, types_sorted = sortbydistance(dt_box_lidar, scores, types)
     #pp_AB3DMOT_list  = anno_to_AB3DMOT(pred_dict, msg)
     pp_AB3DMOT_list  = anno_to_AB3DMOT(dt_box_lidar, scores, types, msg)
     pp_list          = anno_to_sort(dt_box_lidar, scores, types)
-    pp_3D_list       = anno_to_3Dsort(annos_sorted, types)
+    pp_3D_list       = anno_to_3Dsort(annos_sorted, types_sorted)
     MarkerArray_list = anno_to_rviz(dt_box_lidar, scores, types, msg)
 
-    if scores.size != 0:
-        for i in range(scores.size):
-            if scores[i] > threshold:
-                bbox = BoundingBox()
-                bbox.header.frame_id = msg.header.frame_id
-                bbox.header.stamp = rospy.Time.now()
-                q = yaw2quaternion(float(dt_box_lidar[i][6]))
-                bbox.pose.orientation.x = q[1]
-                bbox.pose.orientation.y = q[2]
-                bbox.pose.orientation.z = q[3]
-                bbox.pose.orientation.w = q[0]           
-                bbox.pose.position.x = float(dt_box_lidar[i][0]) - movelidarcenter
-                bbox.pose.position.y = float(dt_box_lidar[i][1])
-                bbox.pose.position.z = float(dt_box_lidar[i][2])
-                bbox.dimensions.x = float(dt_box_lidar[i][3])
-                bbox.dimensions.y = float(dt_box_lidar[i][4])
-                bbox.dimensions.z = float(dt_box_lidar[i][5])
-                bbox.value = scores[i]
-                bbox.label = int(types[i])
-                arr_bbox.boxes.append(bbox)
-
-
-    print("total callback time: ", time.time() - t_t)
+    mask = scores > threshold
+    boxes = dt_box_lidar[mask]
+    positions = (boxes[:, 0:3] - np.array([movelidarcenter, 0, 0])).tolist()
+    quaternions = detection_utils.yaw_to_quaternions(boxes[:, 6]).tolist()
+    dims = boxes[:, 3:6].tolist()
+    for k, (score, label) in enumerate(zip(scores[mask].tolist(), types[mask].tolist())):
+        bbox = BoundingBox()
+        bbox.header.frame_id = msg.header.frame_id
+        bbox.header.stamp = rospy.Time.now()
+        bbox.pose.orientation.w, bbox.pose.orientation.x, bbox.pose.orientation.y, bbox.pose.orientation.z = \
+            quaternions[k]
+        bbox.pose.position.x, bbox.pose.position.y, bbox.pose.position.z = positions[k]
+        bbox.dimensions.x, bbox.dimensions.y, bbox.dimensions.z = dims[k]
+        bbox.value = score
+        bbox.label = int(label)
+        arr_bbox.boxes.append(bbox)
+
     arr_bbox.header.frame_id = msg.header.frame_id
     arr_bbox.header.stamp = msg.header.stamp
-    if len(arr_bbox.boxes) is not 0:
-        pub_arr_bbox.publish(arr_bbox)
-        arr_bbox.boxes = []
-    else:
-        arr_bbox.boxes = []
-        pub_arr_bbox.publish(arr_bbox)
-
-    pubRviz.publish(MarkerArray_list)
-    pubSort.publish(pp_list)
-    pub3DSort.publish(pp_3D_list)
-    pubAB3DMOT.publish(pp_AB3DMOT_list)
+
+    return {'boxes': arr_bbox, 'markers': MarkerArray_list, 'sort': pp_list, 'sort_3d': pp_3D_list,
+            'ab3dmot': pp_AB3DMOT_list}
+
    
 if __name__ == "__main__":
 
@@ -629,10 +513,14 @@ if __name__ == "__main__":
     proc_1 = Processor_ROS(config_path, model_path)
     
     proc_1.initialize()
+    pointcloud_decoder = pointcloud2_utils.PointCloud2Decoder(
+        field_names=('x', 'y', 'z', None), x_offset=movelidarcenter, remove_nans=True, timestamp=True
+    )
 
     calib_file = 'CARLA.txt'
     calib = proc_1.get_calib(calib_file)
     calib.P2 = calib.P3
+    calib.update_matrices()
     print("Calib.P", calib.P2)
     print("Calib.P", calib.P3)
     print("Calib.R", calib.R0)
@@ -650,14 +538,22 @@ if __name__ == "__main__":
                         "/SimOneSM_PointCloud_0"]
 
     cfg_from_yaml_file(config_path, cfg)
-    
-    sub_ = rospy.Subscriber(sub_lidar_topic[2], PointCloud2, rslidar_callback, queue_size=1, buff_size=2**24)
 
-    pub_arr_bbox = rospy.Publisher("pp_boxes", BoundingBoxArray, queue_size=1)
-    pubRviz   = rospy.Publisher('/pp_markers', MarkerArray, queue_size=10)
-    pubSort   = rospy.Publisher("/perception/object_detector/bev_detections", bev_obstacles_list, queue_size=10)
-    pub3DSort = rospy.Publisher("/pointpillars/bev_detections_3D", bev_obstacles_3D_list, queue_size=10)
-    pubAB3DMOT = rospy.Publisher("/pp/detection", Object_kitti_list, queue_size=10)
+    publishers = {
+        'boxes': rospy.Publisher("pp_boxes", BoundingBoxArray, queue_size=1),
+        'markers': rospy.Publisher('/pp_markers', MarkerArray, queue_size=10),
+        'sort': rospy.Publisher("/perception/object_detector/bev_detections", bev_obstacles_list, queue_size=10),
+        'sort_3d': rospy.Publisher("/pointpillars/bev_detections_3D", bev_obstacles_3D_list, queue_size=10),
+        'ab3dmot': rospy.Publisher("/pp/detection", Object_kitti_list, queue_size=10)
+    }
+    detection_stages = pipeline.DetectionStages(
+        proc_1, pointcloud_decoder, publishers, build_detection_messages, calib=calib
+    )
+    inference_pipeline = detection_stages.build_pipeline(queue_size=1).start()
+    # submit never blocks, the stages drop the oldest frames when they fall behind
+    sub_ = rospy.Subscriber(sub_lidar_topic[2], PointCloud2, inference_pipeline.submit, queue_size=1, buff_size=2**24)
 
     print("[+] PCDet ros_node has started!")    
     rospy.spin()
+    inference_pipeline.stop(timeout=5.0)
+    print(inference_pipeline.format_stats())
@@ -0,0 +1,118 @@
+import numpy as np
+
+from pcdet.utils import box_utils
+
+# box_utils corner order (front-left, front-right, rear-right, rear-left, bottom then top) to the order of the
+# bev_obstacle messages (rear-left, rear-right, front-left, front-right, bottom then top)
+MSG_CORNER_ORDER = [3, 2, 0, 1, 7, 6, 4, 5]
+
+
+def limit_rotation(rotation):
+    return np.where(rotation > np.pi, rotation - np.pi, rotation)
+
+
+def yaw_to_quaternions(yaw):
+    """
+    Batched version of Quaternion(axis=[0, 0, 1], radians=yaw)
+    Args:
+        yaw: (N)
+
+    Returns:
+        quaternions: (N, 4) [w, x, y, z]
+    """
+    quaternions = np.zeros((yaw.shape[0], 4), dtype=np.float64)
+    quaternions[:, 0] = np.cos(yaw / 2)
+    quaternions[:, 3] = np.sin(yaw / 2)
+    return quaternions
+
+
+def get_sort_corners(boxes, x_offset=0.0):
+    """
+    BEV corners of the bev_obstacle messages, in the frame x = -y_lidar, y = -(x_lidar - x_offset)
+    Args:
+        boxes: (N, 7 + C) [x, y, z, dx, dy, dz, heading, ...] in the lidar frame
+        x_offset:
+
+    Returns:
+        locations: (N, 2)
+        corners: (N, 4, 2)
+        rotations: (N), heading, minus pi when above pi as in the messages
+    """
+    rotations = limit_rotation(boxes[:, 6])
+    sort_boxes = np.zeros((boxes.shape[0], 7), dtype=np.float32)
+    sort_boxes[:, 0] = -boxes[:, 1]
+    sort_boxes[:, 1] = -(boxes[:, 0] - x_offset)
+    sort_boxes[:, 3:5] = boxes[:, 3:5]
+    sort_boxes[:, 6] = -rotations
+    if boxes.shape[0] == 0:
+        return sort_boxes[:, 0:2], np.zeros((0, 4, 2), dtype=np.float32), rotations
+    corners = box_utils.boxes_to_corners_3d(sort_boxes)[:, MSG_CORNER_ORDER[:4], 0:2]
+    return sort_boxes[:, 0:2], corners, rotations
+
+
+def get_3d_sort_corners(boxes, x_offset=0.0):
+    """
+    3D corners of the bev_obstacle_3D messages, in the lidar frame shifted by x_offset
+    Args:
+        boxes: (N, 7 + C) [x, y, z, dx, dy, dz, heading, ...]
+        x_offset:
+
+    Returns:
+        locations: (N, 3)
+        corners: (N, 8, 3)
+        rotations: (N), heading, minus pi when above pi as in the messages
+    """
+    rotations = limit_rotation(boxes[:, 6])
+    sort_boxes = np.array(boxes[:, 0:7], dtype=np.float32)
+    sort_boxes[:, 0] -= x_offset
+    sort_boxes[:, 6] = rotations
+    if boxes.shape[0] == 0:
+        return sort_boxes[:, 0:3], np.zeros((0, 8, 3), dtype=np.float32), rotations
+    corners = box_utils.boxes_to_corners_3d(sort_boxes)[:, MSG_CORNER_ORDER, :]
+    return sort_boxes[:, 0:3], corners, rotations
+
+
+def sort_by_distance(boxes, scores, threshold, x_offset=0.0):
+    """
+    Args:
+        boxes: (N, 7)
+        scores: (N)
+        threshold: boxes with a lower score are removed
+        x_offset:
+
+    Returns:
+        annos_sorted: (M, 10) [x, y, z, dx, dy, dz, heading, rho, phi, score] ordered by the BEV distance rho
+            of (x - x_offset, y)
+        order: (M), indices of annos_sorted in boxes
+    """
+    keep = np.nonzero(scores >= threshold)[0]
+    boxes, scores = boxes[keep], scores[keep]
+    x_lidar = boxes[:, 0] - x_offset
+    y_lidar = boxes[:, 1]
+    annos_with_distance = np.concatenate([
+        boxes, np.sqrt(x_lidar ** 2 + y_lidar ** 2)[:, None], np.arctan2(y_lidar, x_lidar)[:, None], scores[:, None]
+    ], axis=1)
+    sorted_idxs = annos_with_distance[:, -3].argsort()
+    return annos_with_distance[sorted_idxs], keep[sorted_idxs]
+
+
+if __name__ == '__main__':
+    import time
+
+    num_boxes, num_repeats = 500, 100
+    boxes = np.random.uniform(-40, 40, size=(num_boxes, 7)).astype(np.float32)
+    boxes[:, 3:6] = np.random.uniform(0.5, 5, size=(num_boxes, 3))
+    boxes[:, 6] = np.random.uniform(-np.pi, 2 * np.pi, size=num_boxes)
+    scores = np.random.uniform(0, 1, size=num_boxes).astype(np.float32)
+
+    for name, func in [
+        ('sort_by_distance', lambda: sort_by_distance(boxes, scores, 0.0, x_offset=20)),
+        ('get_sort_corners', lambda: get_sort_corners(boxes, x_offset=20)),
+        ('get_3d_sort_corners', lambda: get_3d_sort_corners(boxes, x_offset=20)),
+        ('yaw_to_quaternions', lambda: yaw_to_quaternions(boxes[:, 6])),
+    ]:
+        func()
+        start_time = time.time()
+        for _ in range(num_repeats):
+            func()
+        print('%s of %d boxes: %.3fms' % (name, num_boxes, (time.time() - start_time) / num_repeats * 1000))
@@ -0,0 +1,326 @@
+import collections
+import threading
+import time
+import traceback
+from pathlib import Path
+
+import numpy as np
+
+_STOP = object()
+
+
+class DropOldestQueue(object):
+    def __init__(self, maxsize=1):
+        """
+        Bounded queue whose put never blocks: when it is full, the oldest item is dropped, so that a slow consumer
+        always gets the latest frame
+        Args:
+            maxsize:
+        """
+        self.maxsize = maxsize
+        self.num_dropped = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def put(self, item):
+        with self._cond:
+            if item is not _STOP and len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.num_dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Returns:
+            item: None on timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._items) > 0, timeout=timeout):
+                return None
+            return self._items.popleft()
+
+
+class LatencyStats(object):
+    def __init__(self, window=100):
+        """
+        Latencies in seconds of the last window items
+        """
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, latency):
+        with self._lock:
+            self.count += 1
+            self.total += latency
+            self.max = max(self.max, latency)
+            self.recent.append(latency)
+
+    def summary(self):
+        with self._lock:
+            recent = np.array(self.recent) if len(self.recent) > 0 else np.zeros(1)
+            return {
+                'count': self.count, 'mean': self.total / max(self.count, 1), 'max': self.max,
+                'recent_mean': float(recent.mean()), 'recent_p90': float(np.percentile(recent, 90))
+            }
+
+
+class PipelineStage(threading.Thread):
+    def __init__(self, name, func, in_queue, out_queue=None, end_to_end_stats=None):
+        """
+        Thread applying func to the items of in_queue and putting the results into out_queue. Items are
+        (submit_time, payload) pairs, a None result drops the item.
+        Args:
+            name:
+            func: function of payload returning the payload of the next stage
+            in_queue: DropOldestQueue
+            out_queue: DropOldestQueue, None for the last stage
+            end_to_end_stats: LatencyStats from submit to the end of this stage
+        """
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.stats = LatencyStats()
+        self.end_to_end_stats = end_to_end_stats
+        self.num_errors = 0
+
+    def run(self):
+        while True:
+            item = self.in_queue.get()
+            if item is _STOP:
+                if self.out_queue is not None:
+                    self.out_queue.put(_STOP)
+                break
+
+            submit_time, payload = item
+            start_time = time.time()
+            try:
+                result = self.func(payload)
+            except Exception as e:
+                self.num_errors += 1
+                print('%s stage error: %r' % (self.name, e))
+                traceback.print_exc()
+                continue
+            end_time = time.time()
+            self.stats.add(end_time - start_time)
+            if self.end_to_end_stats is not None:
+                self.end_to_end_stats.add(end_time - submit_time)
+            if result is not None and self.out_queue is not None:
+                self.out_queue.put((submit_time, result))
+
+
+class InferencePipeline(object):
+    def __init__(self, preprocess_func, inference_func, publish_func, queue_size=1):
+        """
+        Decode/preprocess, inference and publish threads connected by drop-oldest queues, so that a slow frame
+        never blocks the subscriber callback and the inference always runs on the latest frame.
+        Args:
+            preprocess_func: function of a message returning the model inputs, run in the preprocess thread
+            inference_func: function of the model inputs returning the predictions, run in the inference thread
+            publish_func: function of the predictions publishing them, run in the publish thread
+            queue_size: size of the queue in front of each stage
+        """
+        self.input_queue = DropOldestQueue(queue_size)
+        self.inference_queue = DropOldestQueue(queue_size)
+        self.publish_queue = DropOldestQueue(queue_size)
+        self.end_to_end_stats = LatencyStats()
+        self.stages = [
+            PipelineStage('preprocess', preprocess_func, self.input_queue, self.inference_queue),
+            PipelineStage('inference', inference_func, self.inference_queue, self.publish_queue),
+            PipelineStage('publish', publish_func, self.publish_queue, end_to_end_stats=self.end_to_end_stats)
+        ]
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def submit(self, msg):
+        """
+        Non-blocking, to be called from the subscriber callback
+        """
+        self.input_queue.put((time.time(), msg))
+
+    def stop(self, timeout=None):
+        """
+        Let the stages finish the queued items and join them
+        """
+        self.input_queue.put(_STOP)
+        for stage in self.stages:
+            stage.join(timeout)
+
+    def get_stats(self):
+        queues = [self.input_queue, self.inference_queue, self.publish_queue]
+        stats = {}
+        for stage, queue in zip(self.stages, queues):
+            stats[stage.name] = dict(stage.stats.summary(), dropped=queue.num_dropped, errors=stage.num_errors)
+        stats['end_to_end'] = self.end_to_end_stats.summary()
+        return stats
+
+    def format_stats(self):
+        lines = []
+        for name, stats in self.get_stats().items():
+            line = '%s: count=%d, mean=%.1fms, p90=%.1fms, max=%.1fms' % (
+                name, stats['count'], stats['mean'] * 1000, stats['recent_p90'] * 1000, stats['max'] * 1000
+            )
+            if 'dropped' in stats:
+                line += ', dropped=%d' % stats['dropped']
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+class DetectionStages(object):
+    def __init__(self, processor, decoder, publishers, build_messages, calib=None, stats_every=50):
+        """
+        Preprocess, inference and publish functions of the InferencePipeline of a detection node. They only use
+        the objects given here, so the same stages run on rospy or, offline, on FakeSubscriber and FakePublisher.
+        Args:
+            processor: object with preprocess(points, frame) returning the model inputs and inference(data_dict,
+                calib) returning (scores, boxes_lidar, types, pred_dict), such as Processor_ROS
+            decoder: PointCloud2Decoder
+            publishers: dict, name => object with publish(msg), such as rospy.Publisher or FakePublisher
+            build_messages: function of (msg, scores, boxes_lidar, types) returning a dict, name => message to
+                publish with publishers[name]
+            calib: calibration given to processor.inference
+            stats_every: print the stats of the pipeline every stats_every frames, 0 to never print them
+        """
+        self.processor = processor
+        self.decoder = decoder
+        self.publishers = publishers
+        self.build_messages = build_messages
+        self.calib = calib
+        self.stats_every = stats_every
+        self.pipeline = None
+
+    def preprocess(self, msg):
+        """
+        Decode the cloud and build the collated batch
+        """
+        points = self.decoder.decode_msg(msg, frame=0)
+        return msg, self.processor.preprocess(points, msg.header.seq)
+
+    def inference(self, item):
+        msg, data_dict = item
+        scores, boxes_lidar, types, _ = self.processor.inference(data_dict, self.calib)
+        return msg, scores, boxes_lidar, types
+
+    def publish(self, item):
+        """
+        Build and publish the detection messages
+        """
+        msg, scores, boxes_lidar, types = item
+        for name, message in self.build_messages(msg, scores, boxes_lidar, types).items():
+            self.publishers[name].publish(message)
+
+        if self.stats_every > 0 and self.pipeline is not None and msg.header.seq % self.stats_every == 0:
+            print(self.pipeline.format_stats())
+
+    def build_pipeline(self, queue_size=1):
+        self.pipeline = InferencePipeline(self.preprocess, self.inference, self.publish, queue_size=queue_size)
+        return self.pipeline
+
+
+def replay_frames(stages, frame_files, rate=0.0, loop=1, queue_size=1, timeout=None):
+    """
+    Offline run of the detection stages on recorded .bin frames, see FakeSubscriber
+    Args:
+        stages: DetectionStages, with FakePublisher publishers to keep the published messages
+        frame_files: list of .bin files, or a directory of them
+        rate: frames per second, 0 to replay as fast as possible
+        loop: number of passes over the frames
+        queue_size: size of the queue in front of each stage, frames are dropped when a stage falls behind
+        timeout: of the final join of the stages
+
+    Returns:
+        stats: see InferencePipeline.get_stats
+    """
+    inference_pipeline = stages.build_pipeline(queue_size=queue_size).start()
+    FakeSubscriber(frame_files, inference_pipeline.submit, rate=rate, loop=loop).spin()
+    inference_pipeline.stop(timeout)
+    return inference_pipeline.get_stats()
+
+
+class FakePointField(object):
+    FLOAT32 = 7
+
+    def __init__(self, name, offset, datatype, count=1):
+        self.name = name
+        self.offset = offset
+        self.datatype = datatype
+        self.count = count
+
+
+class FakeHeader(object):
+    def __init__(self, seq=0, stamp=0.0, frame_id='velodyne'):
+        self.seq = seq
+        self.stamp = stamp
+        self.frame_id = frame_id
+
+
+class FakePointCloud2(object):
+    def __init__(self, points, seq=0, frame_id='velodyne'):
+        """
+        Stand-in of sensor_msgs.msg.PointCloud2 with the x, y, z, intensity float32 fields of a .bin frame
+        Args:
+            points: (N, 4) float32
+        """
+        points = np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 4)
+        self.header = FakeHeader(seq=seq, stamp=time.time(), frame_id=frame_id)
+        self.height = 1
+        self.width = points.shape[0]
+        self.fields = [FakePointField(name, 4 * k, FakePointField.FLOAT32)
+                       for k, name in enumerate(['x', 'y', 'z', 'intensity'])]
+        self.is_bigendian = False
+        self.point_step = 16
+        self.row_step = self.point_step * self.width
+        self.data = points.tobytes()
+        self.is_dense = bool(np.isfinite(points).all())
+
+
+class FakeSubscriber(object):
+    def __init__(self, frame_files, callback, rate=10.0, loop=1):
+        """
+        Replay recorded .bin frames (N, 4) as FakePointCloud2 messages to callback
+        Args:
+            frame_files: list of .bin files, or a directory of them
+            callback: subscriber callback, such as InferencePipeline.submit
+            rate: frames per second, 0 to replay as fast as possible
+            loop: number of passes over the frames
+        """
+        if isinstance(frame_files, (str, Path)) and Path(frame_files).is_dir():
+            frame_files = sorted(Path(frame_files).glob('*.bin'))
+        self.frame_files = [Path(x) for x in frame_files]
+        self.callback = callback
+        self.rate = rate
+        self.loop = loop
+
+    def spin(self):
+        frames = [np.fromfile(str(x), dtype=np.float32).reshape(-1, 4) for x in self.frame_files]
+        seq = 0
+        for _ in range(self.loop):
+            for points in frames:
+                start_time = time.time()
+                self.callback(FakePointCloud2(points, seq=seq))
+                seq += 1
+                if self.rate > 0:
+                    time.sleep(max(0.0, 1.0 / self.rate - (time.time() - start_time)))
+
+
+class FakePublisher(object):
+    def __init__(self, name=None, max_messages=None):
+        """
+        Stand-in of rospy.Publisher keeping the published messages
+        """
+        self.name = name
+        self.messages = collections.deque(maxlen=max_messages)
+
+    def publish(self, msg):
+        self.messages.append(msg)
@@ -0,0 +1,99 @@
+import numpy as np
+
+# sensor_msgs/PointField datatypes
+POINTFIELD_DTYPES = {
+    1: np.int8, 2: np.uint8, 3: np.int16, 4: np.uint16,
+    5: np.int32, 6: np.uint32, 7: np.float32, 8: np.float64
+}
+
+
+def get_field_view(data, field, height, width, point_step, row_step, is_bigendian=False):
+    """
+    Zero-copy strided view of one PointField inside the raw bytes of a PointCloud2
+    Args:
+        data: bytes-like msg.data
+        field: object with name, offset and datatype, such as sensor_msgs.msg.PointField
+        height:
+        width:
+        point_step: bytes per point
+        row_step: bytes per row
+        is_bigendian:
+
+    Returns:
+        view: (height, width), read-only when data is bytes
+    """
+    dtype = np.dtype(POINTFIELD_DTYPES[field.datatype]).newbyteorder('>' if is_bigendian else '<')
+    return np.ndarray(
+        shape=(height, width), dtype=dtype, buffer=data, offset=field.offset, strides=(row_step, point_step)
+    )
+
+
+class PointCloud2Decoder(object):
+    def __init__(self, field_names=('x', 'y', 'z'), x_offset=0.0, remove_nans=True, timestamp=True):
+        """
+        Decode PointCloud2 messages into (N, 3 + C) float32 points without the structured-array copies of
+        ros_numpy. Each field is read as a strided view of msg.data and cast once into a preallocated buffer, which
+        also receives the NaN filtering, the x shift and the timestamp column. The buffer is reused by the next
+        decode, copy the returned points if they must outlive it. Only numpy is needed, so the decoder is
+        tested with synthetic byte buffers.
+        Args:
+            field_names: fields to decode, the first three must be the coordinates, a None or missing field is
+                filled with zeros
+            x_offset: added to the x coordinates
+            remove_nans: drop the points with a non-finite coordinate
+            timestamp: append a column filled with the frame given to decode
+        """
+        self.field_names = list(field_names)
+        self.x_offset = x_offset
+        self.remove_nans = remove_nans
+        self.timestamp = timestamp
+        self.num_features = len(self.field_names) + int(self.timestamp)
+        self._buffer = np.empty((0, self.num_features), dtype=np.float32)
+
+    def get_buffer(self, num_points):
+        if self._buffer.shape[0] < num_points:
+            self._buffer = np.empty((max(num_points, 2 * self._buffer.shape[0]), self.num_features), dtype=np.float32)
+        return self._buffer[:num_points]
+
+    def decode(self, data, fields, height, width, point_step, row_step, is_bigendian=False, frame=0):
+        """
+        Args:
+            data: bytes-like msg.data
+            fields: list of PointField-like objects with name, offset and datatype
+            height:
+            width:
+            point_step:
+            row_step:
+            is_bigendian:
+            frame: value of the timestamp column
+
+        Returns:
+            points: (N, num_features) float32, a view into the decoder buffer
+        """
+        fields = {field.name: field for field in fields}
+        num_points = height * width
+        points = self.get_buffer(num_points)
+        for k, name in enumerate(self.field_names):
+            if name not in fields:
+                points[:, k] = 0
+                continue
+            view = get_field_view(data, fields[name], height, width, point_step, row_step, is_bigendian)
+            points[:, k].reshape(height, width)[...] = view
+
+        if self.remove_nans:
+            finite_mask = np.isfinite(points[:, 0:3]).all(axis=1)
+            if not finite_mask.all():
+                num_points = int(finite_mask.sum())
+                points[:num_points] = points[finite_mask]
+                points = points[:num_points]
+        if self.x_offset != 0:
+            points[:, 0] += self.x_offset
+        if self.timestamp:
+            points[:, -1] = frame
+        return points
+
+    def decode_msg(self, msg, frame=0):
+        return self.decode(
+            msg.data, msg.fields, msg.height, msg.width, msg.point_step, msg.row_step,
+            is_bigendian=msg.is_bigendian, frame=frame
+        )